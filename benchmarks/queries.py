@@ -0,0 +1,37 @@
+"""Representative queries for every asset type, benchmarked by benchmarks/run.py"""
+
+SMALL_POLYGON = {"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}, "geometry": {
+    "type": "Polygon", "coordinates": [[[-43.39, -4.74], [-43.39, -4.95], [-43.17, -4.80], [-43.39, -4.74]]]}}]}
+
+QUERIES = [
+    # Image
+    {'name': 'image_histogram',
+     'sql': "SELECT ST_HISTOGRAM(rast, elevation, 10, true) FROM 'CGIAR/SRTM90_V4'",
+     'geojson': SMALL_POLYGON},
+    {'name': 'image_summarystats',
+     'sql': "SELECT ST_SUMMARYSTATS() FROM 'CGIAR/SRTM90_V4'",
+     'geojson': SMALL_POLYGON},
+    {'name': 'image_fused_functions',
+     'sql': "SELECT ST_HISTOGRAM(rast, 'seasonality', 12, true), ST_SUMMARYSTATS(rast, 'seasonality'), "
+            "ST_VALUECOUNT(rast, 'seasonality', false) FROM 'JRC/GSW1_2/GlobalSurfaceWater'",
+     'geojson': SMALL_POLYGON},
+    # ImageCollection
+    {'name': 'image_collection_select',
+     'sql': "select * from 'IDAHO_EPSCOR/GRIDMET' limit 2"},
+    {'name': 'image_collection_where_order',
+     'sql': "select status from 'IDAHO_EPSCOR/GRIDMET' where status='permanent' "
+            "order by system:time_start desc limit 10"},
+    {'name': 'image_collection_aggregate',
+     'sql': "select sum(pr), avg(tmmn) from 'IDAHO_EPSCOR/GRIDMET' where system:time_start > 1522548800000",
+     'geojson': SMALL_POLYGON},
+    {'name': 'image_collection_group_by',
+     'sql': "select max(tmmx), avg(tmmx) as average_tmmx from 'IDAHO_EPSCOR/TERRACLIMATE' "
+            "group by system:index limit 5"},
+    # FeatureCollection
+    {'name': 'table_count',
+     'sql': 'select count(ALAND) from "TIGER/2018/States" where ALAND > 400000000'},
+    {'name': 'table_rows',
+     'sql': 'select NAME, ALAND as land from "TIGER/2018/States" limit 50'},
+    {'name': 'feature_collection_group_by',
+     'sql': "select sum(area), anlys_time from 'GLIMS/2016' group by anlys_time order by anlys_time asc limit 10"},
+]
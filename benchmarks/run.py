@@ -0,0 +1,276 @@
+"""
+Benchmark harness for the parse -> plan -> execute -> map pipeline.
+
+Record the Earth Engine responses once (needs credentials, like the tests):
+
+    python -m benchmarks.run --record benchmarks/recordings.json
+
+Without credentials, build the recording from the synthetic responses of benchmarks/synthetic.py instead (this is
+how the committed benchmarks/recordings.json was made):
+
+    python -m benchmarks.run --synthesize benchmarks/recordings.json
+
+Then benchmark offline against the recording, and compare with a stored baseline:
+
+    python -m benchmarks.run --recordings benchmarks/recordings.json --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --recordings benchmarks/recordings.json --baseline benchmarks/baseline.json
+
+Every query reports p50/p90/p99 latency per stage, allocations and Earth Engine calls. The comparison fails (exit
+status 1) when a stage p50 is slower than the baseline by more than --tolerance, or a query makes more EE calls.
+Timings are stored with the time a fixed pure Python workload takes on the machine (calibrate()), and the baseline
+p50s are scaled by the ratio of the two calibrations before comparing, so a baseline saved on another machine can be
+compared with; call counts are compared as they are.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import ee
+
+from sql2gee import backend as backends
+from sql2gee import catalog
+from sql2gee.gee_factory import GeeFactory
+from sql2gee.utils.jsonSql import JsonSql
+
+from .queries import QUERIES
+
+STAGES = ['parse', 'plan', 'reducers', 'build', 'getInfo', 'map', 'total']
+
+
+class TimingBackend(backends.EarthEngineBackend):
+    """Measures the time spent in, and the number of, requests to the wrapped backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = 0
+        self.elapsed = 0.0
+
+    def _timed(self, function, argument):
+        start = time.perf_counter()
+        try:
+            return function(argument)
+        finally:
+            self.elapsed += time.perf_counter() - start
+            self.calls += 1
+
+    def get_info(self, ee_object):
+        return self._timed(self.backend.get_info, ee_object)
+
+    def get_asset(self, asset_id):
+        return self._timed(self.backend.get_asset, asset_id)
+
+
+def run_query(query, backend):
+    """Runs one query, returning the seconds spent in every stage and the number of EE calls"""
+    timings = dict.fromkeys(STAGES, 0.0)
+    timer = TimingBackend(backend)
+    start = time.perf_counter()
+
+    scheme = JsonSql(query['sql']).to_json()
+    timings['parse'] = time.perf_counter() - start
+
+    mark, ee_mark = time.perf_counter(), timer.elapsed
+    factory = GeeFactory(scheme, query.get('geojson'), query.get('flags'), backend=timer)
+    factory._select
+    factory._filter
+    timings['plan'] = time.perf_counter() - mark - (timer.elapsed - ee_mark)
+
+    mark, ee_mark = time.perf_counter(), timer.elapsed
+    executor = factory._query()
+    # checked on the class: hasattr() on the executor would build the cached reducers before they are timed
+    if hasattr(type(executor), 'reduceGen'):
+        reducers_mark = time.perf_counter()
+        executor.reduceGen
+        timings['reducers'] = time.perf_counter() - reducers_mark
+
+    mapped = [0.0]
+    if hasattr(executor, '_mapOutput'):
+        map_output = executor._mapOutput
+
+        def timed_map_output(element):
+            map_mark = time.perf_counter()
+            try:
+                return map_output(element)
+            finally:
+                mapped[0] += time.perf_counter() - map_mark
+
+        executor._mapOutput = timed_map_output
+
+    executor.response()
+    execute = time.perf_counter() - mark
+    timings['getInfo'] = timer.elapsed - ee_mark
+    timings['map'] = mapped[0]
+    timings['build'] = execute - timings['getInfo'] - timings['map'] - timings['reducers']
+    timings['total'] = time.perf_counter() - start
+    return timings, timer.calls
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[index]
+
+
+def benchmark(query, backend, repeat):
+    """Cold run (empty metadata catalog), `repeat` warm runs, and one traced run for allocations"""
+    catalog.default_catalog().invalidate()
+    _, cold_calls = run_query(query, backend)
+
+    samples = {stage: [] for stage in STAGES}
+    calls = 0
+    for _ in range(repeat):
+        timings, calls = run_query(query, backend)
+        for stage in STAGES:
+            samples[stage].append(timings[stage])
+
+    tracemalloc.start()
+    run_query(query, backend)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'stages': {stage: {'p50': percentile(values, 50), 'p90': percentile(values, 90), 'p99': percentile(values, 99)}
+                   for stage, values in samples.items()},
+        'ee_calls': calls,
+        'ee_calls_cold': cold_calls,
+        'peak_bytes': peak,
+        'retained_bytes': current
+    }
+
+
+def calibrate(repeat=5):
+    """Seconds a fixed pure Python workload takes on this machine, best of `repeat`"""
+    rows = [{'id': i, 'name': str(i) * 3, 'values': list(range(i % 20))} for i in range(2000)]
+    best = None
+    for _ in range(repeat):
+        mark = time.perf_counter()
+        sorted(json.loads(json.dumps(rows)), key=lambda row: row['name'])
+        elapsed = time.perf_counter() - mark
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the list of regressions of a run against the baseline, both {'calibration': seconds, 'queries': {...}}.
+    The baseline timings are scaled by the ratio of the calibrations, so they are compared as if taken on this machine.
+    """
+    regressions = []
+    scale = results['calibration'] / baseline['calibration']
+    for name, result in results['queries'].items():
+        if name not in baseline['queries']:
+            continue
+        expected = baseline['queries'][name]
+        for stage in STAGES:
+            before = expected['stages'][stage]['p50'] * scale
+            after = result['stages'][stage]['p50']
+            # sub 50 microsecond stages are noise
+            if after > before * (1 + tolerance) and after - before > 5e-5 * scale:
+                regressions.append('{0}: {1} p50 {2:.3f} ms -> {3:.3f} ms'.format(name, stage, before * 1e3,
+                                                                                  after * 1e3))
+        for key in ['ee_calls', 'ee_calls_cold']:
+            if result[key] > expected[key]:
+                regressions.append('{0}: {1} {2} -> {3}'.format(name, key, expected[key], result[key]))
+    return regressions
+
+
+def report(results):
+    header = '{0:<32}'.format('query') + ''.join('{0:>11}'.format(stage) for stage in STAGES)
+    print(header + '{0:>7}{1:>7}{2:>12}'.format('calls', 'cold', 'peak KiB'))
+    for name, result in results.items():
+        line = '{0:<32}'.format(name)
+        line += ''.join('{0:>11.3f}'.format(result['stages'][stage]['p50'] * 1e3) for stage in STAGES)
+        line += '{0:>7}{1:>7}{2:>12.1f}'.format(result['ee_calls'], result['ee_calls_cold'],
+                                                result['peak_bytes'] / 1024.0)
+        print(line)
+    print('(p50 in ms; p90/p99 in the JSON report)')
+
+
+def initialize_live():
+    if 'EE_ACCOUNT' in os.environ:
+        credentials = ee.ServiceAccountCredentials(os.environ['EE_ACCOUNT'], 'privatekey.json')
+        ee.Initialize(credentials)
+    else:
+        ee.Initialize()
+
+
+def synthesize(queries, path):
+    """Records the queries against the synthetic responses, with the algorithm signatures bundled with the ee API"""
+    from ee import apitestcase
+    from . import synthetic
+
+    algorithms = apitestcase.GetAlgorithms()
+    backends.ReplayBackend({'algorithms': algorithms}).initialize()
+    recorder = backends.RecordingBackend()
+    for query in queries:
+        catalog.default_catalog().invalidate()
+        recorder.backend = synthetic.ScriptedBackend(query['name'])
+        run_query(query, recorder)
+    recorder.save(path, algorithms)
+    return recorder
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--record', metavar='PATH', help='run the queries against Earth Engine and record them')
+    parser.add_argument('--synthesize', metavar='PATH', help='record the queries against synthetic responses')
+    parser.add_argument('--recordings', metavar='PATH', help='replay recorded responses instead of calling EE')
+    parser.add_argument('--latency', type=float, default=0, help='seconds of latency injected per replayed call')
+    parser.add_argument('--repeat', type=int, default=20, help='warm runs per query')
+    parser.add_argument('--query', action='append', help='only run the named queries')
+    parser.add_argument('--baseline', metavar='PATH', help='compare with a stored baseline')
+    parser.add_argument('--save-baseline', metavar='PATH', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slowdown before failing')
+    parser.add_argument('--output', metavar='PATH', help='write the full JSON report')
+    args = parser.parse_args(argv)
+
+    queries = [q for q in QUERIES if not args.query or q['name'] in args.query]
+
+    if args.record:
+        initialize_live()
+        recorder = backends.RecordingBackend()
+        for query in queries:
+            catalog.default_catalog().invalidate()
+            run_query(query, recorder)
+        recorder.save(args.record)
+        print('recorded {0} getInfo and {1} getAsset responses in {2}'.format(
+            len(recorder.recordings['getInfo']), len(recorder.recordings['getAsset']), args.record))
+        return 0
+
+    if args.synthesize:
+        recorder = synthesize(queries, args.synthesize)
+        print('synthesized {0} getInfo and {1} getAsset responses in {2}'.format(
+            len(recorder.recordings['getInfo']), len(recorder.recordings['getAsset']), args.synthesize))
+        return 0
+
+    if args.recordings:
+        backend = backends.ReplayBackend(args.recordings, latency=args.latency).initialize()
+    else:
+        initialize_live()
+        backend = backends.EarthEngineBackend()
+
+    results = {'calibration': calibrate(),
+               'queries': {query['name']: benchmark(query, backend, args.repeat) for query in queries}}
+    report(results['queries'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
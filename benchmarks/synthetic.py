@@ -0,0 +1,154 @@
+"""
+Synthetic Earth Engine responses for the benchmark queries, used to build benchmarks/recordings.json without
+credentials (python -m benchmarks.run --synthesize benchmarks/recordings.json).
+
+The asset metadata follows the real catalogue entries and every response has the shape Earth Engine returns for that
+request, so the pipeline does the same work; the values themselves are made up. Re-record against Earth Engine with
+--record when credentials are available.
+"""
+from sql2gee import backend as backends
+
+UPDATED = '2019-06-17T17:48:10.661679Z'
+DAY = 86400000
+
+
+def _grid(scale, width, height, west, north):
+    return {'crsCode': 'EPSG:4326', 'dimensions': {'width': width, 'height': height},
+            'affineTransform': {'scaleX': scale, 'translateX': west, 'scaleY': -scale, 'translateY': north}}
+
+
+def _band(name, data_type, grid):
+    return {'id': name, 'dataType': {'precision': data_type}, 'grid': grid}
+
+
+SRTM_GRID = _grid(1 / 1200.0, 432000, 144000, -180, 60)
+GSW_GRID = _grid(1 / 4000.0, 1440000, 560000, -180, 80)
+GSW_BANDS = ['occurrence', 'change_abs', 'change_norm', 'seasonality', 'recurrence', 'transition', 'max_extent']
+GRIDMET_GRID = _grid(1 / 24.0, 1386, 585, -124.79, 49.42)
+GRIDMET_BANDS = ['pr', 'rmax', 'rmin', 'sph', 'srad', 'th', 'tmmn', 'tmmx', 'vs', 'erc', 'eto', 'bi', 'fm100', 'fm1000',
+                 'etr', 'vpd']
+TERRACLIMATE_GRID = _grid(1 / 24.0, 8640, 4320, -180, 90)
+TERRACLIMATE_BANDS = ['aet', 'def', 'pdsi', 'pet', 'pr', 'ro', 'soil', 'srad', 'swe', 'tmmn', 'tmmx', 'vap', 'vpd',
+                      'vs']
+TIGER_COLUMNS = {'ALAND': 'Long', 'AWATER': 'Long', 'DIVISION': 'String', 'FUNCSTAT': 'String', 'GEOID': 'String',
+                 'INTPTLAT': 'String', 'INTPTLON': 'String', 'LSAD': 'String', 'MTFCC': 'String', 'NAME': 'String',
+                 'REGION': 'String', 'STATEFP': 'String', 'STATENS': 'String', 'STUSPS': 'String',
+                 'system:index': 'String'}
+GLIMS_COLUMNS = {'anlys_id': 'Integer', 'anlys_time': 'String', 'area': 'Float', 'db_area': 'Float',
+                 'glac_id': 'String', 'glac_name': 'String', 'src_date': 'String', 'geog_area': 'String',
+                 'system:index': 'String'}
+STATES = ['Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut', 'Delaware', 'Florida',
+          'Georgia']
+
+# getAsset responses
+ASSETS = {
+    'CGIAR/SRTM90_V4': {'type': 'IMAGE', 'id': 'CGIAR/SRTM90_V4', 'updateTime': UPDATED, 'properties': {},
+                        'bands': [_band('elevation', 'INT', SRTM_GRID)]},
+    'JRC/GSW1_2/GlobalSurfaceWater': {'type': 'IMAGE', 'id': 'JRC/GSW1_2/GlobalSurfaceWater', 'updateTime': UPDATED,
+                                      'properties': {}, 'bands': [_band(name, 'INT', GSW_GRID) for name in GSW_BANDS]},
+    'IDAHO_EPSCOR/GRIDMET': {'type': 'IMAGE_COLLECTION', 'id': 'IDAHO_EPSCOR/GRIDMET', 'updateTime': UPDATED},
+    'IDAHO_EPSCOR/TERRACLIMATE': {'type': 'IMAGE_COLLECTION', 'id': 'IDAHO_EPSCOR/TERRACLIMATE', 'updateTime': UPDATED},
+    'TIGER/2018/States': {'type': 'TABLE', 'id': 'TIGER/2018/States', 'updateTime': UPDATED},
+    'GLIMS/2016': {'type': 'TABLE', 'id': 'GLIMS/2016', 'updateTime': UPDATED},
+}
+
+
+def _histogram(low, high, bins):
+    width = (high + 1 - low) / float(bins)
+    return [[low + i * width, 1000 + 37 * i] for i in range(bins)]
+
+
+def _stats(band, count, low, high):
+    return {band + '_count': count, band + '_sum': count * (low + high) / 2.0, band + '_mean': (low + high) / 2.0,
+            band + '_stdDev': (high - low) / 4.0, band + '_min': low, band + '_max': high}
+
+
+def _image(collection, index, bands, grid, properties):
+    return {'type': 'Image', 'id': collection + '/' + index, 'version': 1560000000000000,
+            'bands': [_band(name, 'FLOAT', grid) for name in bands],
+            'properties': dict(properties, **{'system:index': index})}
+
+
+def _gridmet(day):
+    return _image('IDAHO_EPSCOR/GRIDMET', '201801{0:02d}'.format(day + 1), GRIDMET_BANDS, GRIDMET_GRID,
+                  {'system:time_start': 1514764800000 + day * DAY, 'system:time_end': 1514851200000 + day * DAY,
+                   'status': 'permanent', 'system:asset_size': 45871234})
+
+
+def _terraclimate(month):
+    return _image('IDAHO_EPSCOR/TERRACLIMATE', '1958{0:02d}'.format(month + 1), TERRACLIMATE_BANDS,
+                  TERRACLIMATE_GRID, {'system:time_start': -378691200000 + month * 31 * DAY})
+
+
+def _collection(images):
+    """ImageCollection.limit(1) as read by the metadata catalog"""
+    return {'type': 'ImageCollection', 'bands': [], 'features': images}
+
+
+def _table(columns):
+    """FeatureCollection.limit(1) as read by the metadata catalog"""
+    return {'type': 'FeatureCollection', 'columns': columns, 'features': []}
+
+
+def _feature(index, properties):
+    return {'type': 'Feature', 'geometry': None, 'id': index, 'properties': properties}
+
+
+def _row(image, columns=None):
+    """An image projected to a bare feature, as image collection row selects return them"""
+    properties = image['properties']
+    if columns is not None:
+        properties = {key: properties[key] for key in columns + ['system:index']}
+    return _feature(image['properties']['system:index'], dict(properties, **{'system:id': image['id']}))
+
+
+# getInfo responses of every query, in request order, starting from an empty metadata catalog
+RESPONSES = {
+    'image_histogram': [
+        {'stats': {'elevation_min': 98, 'elevation_max': 412}, 'histogram': _histogram(98, 412, 10)}],
+    'image_summarystats': [
+        {'stats': _stats('elevation', 7412, 98, 412)}],
+    'image_fused_functions': [
+        {'stats': _stats('seasonality', 2100, 0, 12), 'histogram': _histogram(0, 12, 12),
+         'valuecount': {str(month): 100 + month for month in range(13)}}],
+    'image_collection_select': [
+        _collection([_gridmet(0)]),
+        [_row(_gridmet(day)) for day in range(2)]],
+    'image_collection_where_order': [
+        _collection([_gridmet(0)]),
+        [_row(_gridmet(30 - day), ['status']) for day in range(10)]],
+    'image_collection_aggregate': [
+        _collection([_gridmet(0)]),
+        [_feature('0', {'pr_sum': 183.4, 'tmmn_mean': 271.9})]],
+    'image_collection_group_by': [
+        _collection([_terraclimate(0)]),
+        [_feature(str(month), {'system:index': '1958{0:02d}'.format(month + 1), 'tmmx_max': 301.5 - month,
+                               'tmmx_mean': 288.2 - month}) for month in range(5)]],
+    'table_count': [
+        _table(TIGER_COLUMNS),
+        [{'count': 41}]],
+    'table_rows': [
+        _table(TIGER_COLUMNS),
+        [_feature('{0:04x}'.format(i), {'NAME': STATES[i % 10] + (' {0}'.format(i // 10) if i >= 10 else ''),
+                                        'ALAND': 1000000000 + 7919 * i}) for i in range(50)]],
+    'feature_collection_group_by': [
+        _table(GLIMS_COLUMNS),
+        [{'anlys_time': '20{0:02d}-01-01T00:00:00'.format(i), 'sum': 12.5 * (i + 1)} for i in range(10)]],
+}
+
+
+class ScriptedBackend(backends.EarthEngineBackend):
+    """Answers the getInfo requests of one query with its RESPONSES in order, and getAsset from ASSETS"""
+
+    def __init__(self, name):
+        self.name = name
+        self.responses = list(RESPONSES[name])
+
+    def get_info(self, ee_object):
+        if not self.responses:
+            raise backends.ReplayError('{0}: no synthetic response left for {1}'.format(self.name,
+                                                                                    ee_object.serialize()[:200]))
+        return self.responses.pop(0)
+
+    def get_asset(self, asset_id):
+        return ASSETS[asset_id]
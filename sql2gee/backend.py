@@ -0,0 +1,130 @@
+import hashlib
+import json
+import threading
+import time
+
+import ee
+
+
+def request_key(ee_object):
+    """Stable key of an Earth Engine expression: the sha1 of its serialized form"""
+    return hashlib.sha1(ee_object.serialize().encode('utf-8')).hexdigest()
+
+
+class EarthEngineBackend(object):
+    """
+    Executes the requests of sql2gee against Earth Engine. GeeFactory, Collection, Image and the metadata catalog
+    only talk to Earth Engine through a backend, so it can be swapped for a recording or an offline stand-in.
+    """
+
+    def get_info(self, ee_object):
+        return ee_object.getInfo()
+
+    def get_asset(self, asset_id):
+        return ee.data.getAsset(asset_id)
+
+
+class RecordingBackend(EarthEngineBackend):
+    """Forwards every request to another backend and records the request/response pairs"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or EarthEngineBackend()
+        self.recordings = {'getInfo': {}, 'getAsset': {}}
+        self._lock = threading.Lock()
+
+    def get_info(self, ee_object):
+        response = self.backend.get_info(ee_object)
+        with self._lock:
+            self.recordings['getInfo'][request_key(ee_object)] = response
+        return response
+
+    def get_asset(self, asset_id):
+        response = self.backend.get_asset(asset_id)
+        with self._lock:
+            self.recordings['getAsset'][asset_id] = response
+        return response
+
+    def save(self, path, algorithms=None):
+        """
+        Writes the recordings to a JSON file, with the algorithm signatures ReplayBackend.initialize() needs to build
+        expressions without a connection to Earth Engine (fetched from Earth Engine unless `algorithms` is given).
+        """
+        if algorithms is None:
+            algorithms = ee.data.getAlgorithms()
+        recordings = dict(self.recordings, algorithms=algorithms, ee_version=ee.__version__)
+        with open(path, 'w') as f:
+            json.dump(recordings, f)
+
+
+class ReplayError(KeyError):
+    """Raised by ReplayBackend for a request that was not recorded"""
+
+
+class ReplayBackend(EarthEngineBackend):
+    """
+    Offline stand-in for Earth Engine: answers requests deterministically from recordings made with
+    RecordingBackend, optionally sleeping `latency` seconds (or latency() seconds if it is callable) per request.
+    Every request is logged in `calls` so round trips can be counted.
+    """
+
+    def __init__(self, recordings, latency=0):
+        if isinstance(recordings, str):
+            with open(recordings) as f:
+                recordings = json.load(f)
+        self.recordings = recordings
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+
+    def _replay(self, method, key):
+        with self._lock:
+            self.calls.append((method, key))
+        self._wait()
+        try:
+            return self.recordings[method][key]
+        except KeyError:
+            raise ReplayError('{0} request not recorded: {1}'.format(method, key))
+
+    def get_info(self, ee_object):
+        return self._replay('getInfo', request_key(ee_object))
+
+    def get_asset(self, asset_id):
+        return self._replay('getAsset', asset_id)
+
+    def initialize(self):
+        """
+        Initializes the Earth Engine client from the recorded algorithm signatures instead of the API, so expressions
+        can be built and serialized with no credentials or network.
+        """
+        get_algorithms = ee.data.getAlgorithms
+        ee.data.getAlgorithms = lambda: self.recordings['algorithms']
+        try:
+            ee.ApiFunction.initialize()
+            for name in ['Element', 'Image', 'Feature', 'Collection', 'ImageCollection', 'FeatureCollection',
+                         'Filter', 'Geometry', 'List', 'Number', 'String', 'Date', 'Dictionary', 'Terrain']:
+                getattr(ee, name).initialize()
+            ee._InitializeGeneratedClasses()
+            ee._InitializeUnboundMethods()
+        finally:
+            ee.data.getAlgorithms = get_algorithms
+        return self
+
+
+_backend = EarthEngineBackend()
+
+
+def default_backend():
+    """The backend used by every query that does not get its own"""
+    return _backend
+
+
+def set_default_backend(backend):
+    """Replaces the shared backend, e.g. set_default_backend(ReplayBackend('recordings.json').initialize())"""
+    global _backend
+    _backend = backend
+    return _backend
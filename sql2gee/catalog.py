@@ -0,0 +1,131 @@
+import copy
+import time
+
+import ee
+
+from .backend import default_backend
+from .stats import record_cache
+from .utils.lruCache import LRUCache
+from .utils.singleFlight import SingleFlight
+
+
+class MetadataCatalog(object):
+    """
+    Shared asset metadata catalog. Entries are kept in an in-memory LRU (plus an optional on-disk store) keyed by
+    asset id. Once an entry is older than `ttl` seconds it is revalidated with a single ee.data.getAsset() call: if the
+    asset updateTime/version did not change the cached schema is reused, otherwise the entry is rebuilt.
+    """
+
+    def __init__(self, maxsize=128, ttl=3600, path=None):
+        self.ttl = ttl
+        self._cache = LRUCache(maxsize=maxsize, path=path)
+        self._flight = SingleFlight()
+
+    def metadata(self, asset_id, backend=None):
+        """The metadata dictionary GeeFactory exposes for the asset"""
+        return copy.deepcopy(self._entry(asset_id, backend or default_backend())['metadata'])
+
+    def table_columns(self, asset_id, backend=None):
+        """Column names and types of a table, as returned by FeatureCollection.limit(1).getInfo()"""
+        backend = backend or default_backend()
+        entry = self._entry(asset_id, backend)
+        if entry['columns'] is None:
+            entry, _ = self._flight.do('columns:' + asset_id, lambda: self._load_columns(asset_id, backend, entry))
+        return dict(entry['columns'])
+
+    def _load_columns(self, asset_id, backend, entry):
+        entry = dict(entry, columns=backend.get_info(ee.FeatureCollection(asset_id).limit(1))['columns'])
+        self._cache.set(asset_id, entry)
+        return entry
+
+    def version(self, asset_id, backend=None):
+        """The [updateTime, version] pair of the asset, as of its last revalidation"""
+        return list(self._entry(asset_id, backend or default_backend())['version'])
+
+    def invalidate(self, asset_id=None):
+        """Drops one asset, or the whole catalog if no asset id is given"""
+        if asset_id is None:
+            self._cache.clear()
+        else:
+            self._cache.delete(asset_id)
+
+    def _version(self, info):
+        return [info.get('updateTime'), info.get('version')]
+
+    def _entry(self, asset_id, backend):
+        entry = self._cache.get(asset_id)
+        if entry is not None and time.time() - entry['checked'] < self.ttl:
+            record_cache(backend, 'metadata', True)
+            return entry
+        # concurrent lookups of the same asset share one fetch/revalidation
+        entry, shared = self._flight.do(asset_id, lambda: self._refresh(asset_id, backend))
+        if shared:
+            record_cache(backend, 'metadata', True)
+        return entry
+
+    def _refresh(self, asset_id, backend):
+        entry = self._cache.get(asset_id)
+        now = time.time()
+        if entry is not None and now - entry['checked'] < self.ttl:
+            record_cache(backend, 'metadata', True)
+            return entry
+
+        info = None
+        if entry is not None and 'ft:' not in asset_id:
+            info = backend.get_asset(asset_id)
+            if info is not None and self._version(info) == entry['version']:
+                entry = dict(entry, checked=now)
+                self._cache.set(asset_id, entry)
+                record_cache(backend, 'metadata', True)
+                return entry
+
+        record_cache(backend, 'metadata', False)
+        entry = self._load(asset_id, backend, info)
+        self._cache.set(asset_id, entry)
+        return entry
+
+    def _load(self, asset_id, backend, info=None):
+        """Fetches the metadata from Earth Engine; `info` is a getAsset() response we already have"""
+        if 'ft:' in asset_id:
+            meta = backend.get_info(ee.FeatureCollection(asset_id).limit(0))
+            assert meta is not None, 'please enter a valid fusion table'
+
+            info = {
+                'type': meta['type'],
+                'columns': meta['columns'],
+                'id': asset_id,
+                'version': '',
+                'properties': meta['properties']
+            }
+        else:
+            if info is None:
+                info = backend.get_asset(asset_id)
+
+            assert info is not None, "data type not expected"
+
+            if info['type'] == 'IMAGE_COLLECTION':
+                meta = backend.get_info(ee.ImageCollection(asset_id).limit(1))['features'][0]
+                info['bands'] = meta['bands']
+                info['columns'] = {k: type(v).__name__ for k, v in meta['properties'].items()}
+
+        return {
+            'metadata': info,
+            'columns': None,
+            'version': self._version(info),
+            'checked': time.time()
+        }
+
+
+_catalog = MetadataCatalog()
+
+
+def default_catalog():
+    """The catalog shared by every query that does not get its own"""
+    return _catalog
+
+
+def configure(maxsize=128, ttl=3600, path=None):
+    """Replaces the shared catalog, e.g. configure(ttl=600, path='/var/cache/sql2gee') to persist it on disk"""
+    global _catalog
+    _catalog = MetadataCatalog(maxsize=maxsize, ttl=ttl, path=path)
+    return _catalog
@@ -1,18 +1,36 @@
-import json
 import logging
 
 import ee
 from cached_property import cached_property
 
-from .utils.reduce import _reducers
+from .backend import default_backend
+from .utils.pagination import decode_cursor, encode_token, query_fingerprint
+from .utils.parallel import parallel_map
+from .utils.reduce import _reducers, _withRegion
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched per request and pages requested concurrently when a result does not fit in one page
+PAGE_SIZE = 5000
+MAX_WORKERS = 4
+# Most rows response() holds in memory; larger results are read with pages() or iter_response()
+MAX_ROWS = 100000
+# Property plain row results are paged on, see Collection._cursor_paging
+CURSOR_PROPERTY = 'system:index'
+# Region reduced for images without a footprint (e.g. composites) when the query has no geometry
+WORLD_BOUNDS = [-180, -90, 180, 90]
+
 
 class Collection(object):
     """docstring for Collection"""
 
-    def __init__(self, parsed, select, filters, asset_id, dType, geometry=None):
+    # ReductionPlan of the region reductions, if the collection has any
+    plan = None
+
+    def __init__(self, parsed, select, filters, asset_id, dType, geometry=None, backend=None, reducers=None):
+        self.backend = backend or default_backend()
+        # reducer graph planned without region, e.g. by a prepared query; built from the select when None
+        self.reducers = reducers
         self._parsed = parsed
         self._filters = filters
         self.select = select
@@ -32,11 +50,8 @@ class Collection(object):
         return _data[self.type](self._asset_id)
 
     def _geometry(self, geometry):
-        if geometry:
-            return geometry
-        return ee.FeatureCollection(json.loads(
-            '{"type": "FeatureCollection","features":[{"type":"Feature", "properties": {}, "geometry": {"type":"Polygon", "coordinates": [[[-180,-90],[180,-90],[180,90],[-180,90],[-180,-90]]]}}]}').get(
-            'features'))
+        """The query geometry; None means unbounded, so nothing is filtered by location"""
+        return geometry or None
 
     def _where(self):
         """
@@ -46,17 +61,26 @@ class Collection(object):
         if 'where' not in self._parsed or len(self._parsed['where']) == 0:
             return self
 
-        if 'filter' in self._filters:
-            self._asset = self._asset.filter(self._filters['filter'])
+        # time and bounds filters first: they are served from the collection indexes and shrink what the rest scans
+        for indexed in self._filters.get('indexed', []) if self._filters else []:
+            self._asset = self._asset.filter(indexed)
 
-        if self.geometry:
+        if self.geometry is not None:
             self._asset = self._asset.filterBounds(self.geometry)
 
+        if self._filters and 'filter' in self._filters:
+            self._asset = self._asset.filter(self._filters['filter'])
+
         return self
 
     def _sort(self):
         """
-        This will sort the result over the first condition as gee doesn't allow multisort
+        Sorts by every ORDER BY key: the collection is sorted by the least significant key first, as later sorts keep
+        the order of ties. That relies on Collection.sort/limit being stable, which Earth Engine does not document;
+        tests/test_featureCollection_func.py checks it against the service. With a LIMIT the most significant key
+        compiles to limit(n, key, ascending), a server side top-k, and the other keys only sort the rows up to the
+        n-th value of the first key, ties included, instead of the whole collection. An OFFSET adds to n, the rows it
+        skips are dropped when paging.
         """
         _direction = {
             'asc': True,
@@ -67,8 +91,20 @@ class Collection(object):
                 pass  #### ToDo, should we implement an special algorithm for sortin to map the preresult dict
             elif isinstance(self._asset, ee.imagecollection.ImageCollection) or isinstance(self._asset,
                                                                                            ee.featurecollection.FeatureCollection):
-                for order in self._parsed['orderBy']:
+                first, rest = self._parsed['orderBy'][0], self._parsed['orderBy'][1:]
+                top_k = self._rowLimit + self._rowOffset if self._rowLimit is not None else None
+                if top_k is not None and rest:
+                    ascending = _direction[first['direction']]
+                    top = self._asset.limit(top_k, first['value'], ascending)
+                    bound = top.aggregate_max(first['value']) if ascending else top.aggregate_min(first['value'])
+                    keep = ee.Filter.lte if ascending else ee.Filter.gte
+                    self._asset = self._asset.filter(keep(first['value'], bound))
+                for order in reversed(rest):
                     self._asset = self._asset.sort(order['value'], _direction[order['direction']])
+                if top_k is not None:
+                    self._asset = self._asset.limit(top_k, first['value'], _direction[first['direction']])
+                else:
+                    self._asset = self._asset.sort(first['value'], _direction[first['direction']])
 
         return self
 
@@ -126,46 +162,181 @@ class Collection(object):
         else:
             return ee.Feature(feat).toDictionary()
 
-    def _limit(self):
+    @cached_property
+    def _prepared(self):
+        """The filtered, reduced and sorted asset; every page is a slice of it"""
+        self._initSelect()._where()._groupBy()._sort()._project()
+        return self._asset
+
+    def _project(self):
+        """Last step before slicing: trims what each row carries back from Earth Engine"""
+        return self
+
+    @property
+    def _rowLimit(self):
+        if 'limit' in self._parsed and self._parsed['limit']:
+            return self._parsed['limit']
+        return None
+
+    @property
+    def _rowOffset(self):
+        """Rows skipped by the query OFFSET; page offsets and tokens count from the first row past them"""
+        return self._parsed.get('offset') or 0
+
+    @cached_property
+    def _fingerprint(self):
+        return query_fingerprint(self._parsed)
+
+    def _slice(self, offset, count):
         """
-        This will limit  the answer if limit exist.
+        This will slice `count` rows starting at `offset`.
         if the object is a collection it will use the built in function for it.
-        If instead the answer is a dictionary, it will limit the output due the selected limit.
+        If instead the answer is a list, it will slice it.
         """
+        asset = self._prepared
+        if isinstance(asset, ee.ee_list.List):
+            return asset.slice(offset, offset + count)
+        elif isinstance(asset, ee.imagecollection.ImageCollection) or isinstance(asset,
+                                                                                ee.featurecollection.FeatureCollection):
+            return asset.toList(count, offset)
+        else:
+            raise TypeError('cannot paginate {0}'.format(type(asset)))
 
-        if 'limit' in self._parsed and self._parsed['limit']:
-            if isinstance(self._asset, ee.ee_list.List):
-                self._asset = self._asset.slice(0, self._parsed['limit'])
-            elif isinstance(self._asset, ee.imagecollection.ImageCollection):
-                self._asset = self._asset.toList(self._parsed['limit'])
-            elif isinstance(self._asset, ee.featurecollection.FeatureCollection):
-                self._asset = self._asset.toList(self._parsed['limit'])
-            else:
-                raise type(self._asset)
-        elif isinstance(self._asset, ee.imagecollection.ImageCollection):
-            ##Lets limit the output: TODO Paginate it
-            self._asset = self._asset.toList(10000)
-        elif isinstance(self._asset, ee.featurecollection.FeatureCollection):
-            ##Lets limit the output: TODO Paginate itf
-            # self._asset = self._asset.toList(10000).map(self._mapOutputFList)
-            self._asset = self._asset.toList(10000)
-            # elf._asset = ee.List(self._asset.toList(10000).map(functools.partial(test_f, output=self._output)))
-        # elif isinstance(self._asset, ee.ee_list.List):
-        ##Lets limit the output: TODO Paginate it
-        # self._asset = self._asset.map()
+    def _fetch(self, offset, count):
+        """Evaluates `count` rows starting at `offset`"""
+        return self.backend.get_info(self._slice(offset, count))
 
-        return self
+    @cached_property
+    def _cursor_paging(self):
+        """
+        Plain row results (no ORDER BY, GROUP BY or aggregate) can be paged in system:index order, each page filtering
+        the rows past the last one of the previous page, so resuming at page n does not evaluate the n - 1 before it
+        as toList(count, offset) does. That sorts the collection and pages can only be fetched one after the other, so
+        only page() uses it, see Collection._resumable.
+        """
+        if self._parsed.get('orderBy') or self._parsed.get('group') or self.select['functions']:
+            return False
+        return isinstance(self._prepared, (ee.imagecollection.ImageCollection, ee.featurecollection.FeatureCollection))
+
+    def _resumable(self, page_size):
+        """Whether page() reads a plain row result by cursor: only if its LIMIT does not fit in one page"""
+        return self._cursor_paging and (self._rowLimit is None or self._rowLimit > page_size)
+
+    def _fetch_after(self, cursor, count, skip=0):
+        """
+        Evaluates the `count` rows following the one whose system:index is `cursor`, or the first ones past `skip`
+        rows if None
+        """
+        asset = self._prepared
+        if cursor is not None:
+            asset = asset.filter(ee.Filter.gt(CURSOR_PROPERTY, cursor))
+        return self.backend.get_info(asset.limit(skip + count, CURSOR_PROPERTY).toList(count, skip))
+
+    def _mapOutput(self, element):
+        return element
+
+    def _page(self, offset, page_size, cursor=None, by_cursor=None):
+        """
+        Fetches and alias maps the page starting at `offset`, never going past the query LIMIT. The page is read after
+        `cursor` instead if by_cursor is set, which it is by default when a cursor is given.
+        """
+        count = page_size
+        if self._rowLimit is not None:
+            count = min(page_size, self._rowLimit - offset)
+        if count <= 0:
+            return {'rows': [], 'next_page_token': None}
+
+        if by_cursor is None:
+            by_cursor = cursor is not None
+        if by_cursor:
+            result = self._fetch_after(cursor, count) if cursor is not None else \
+                self._fetch_after(None, count, self._rowOffset)
+            cursor = result[-1]['id'] if result else cursor
+        else:
+            result = self._fetch(self._rowOffset + offset, count)
+        next_offset = offset + len(result)
+        more = len(result) == count and (self._rowLimit is None or next_offset < self._rowLimit)
+
+        return {'rows': [self._mapOutput(element) for element in result],
+                'next_page_token': encode_token(next_offset, self._fingerprint, cursor) if more else None}
+
+    def page(self, page_size=PAGE_SIZE, page_token=None):
+        """
+        Returns {'rows': [...], 'next_page_token': token} for `page_size` rows starting where `page_token` points to.
+        The token is None once the last page has been returned. Plain row results that may not fit in one page are read
+        by system:index cursor, so resuming from a token costs one page whatever its position.
+        """
+        if not page_token:
+            return self._page(0, page_size, by_cursor=self._resumable(page_size))
+        offset, cursor = decode_cursor(page_token, self._fingerprint)
+        return self._page(offset, page_size, cursor)
+
+    def pages(self, page_size=PAGE_SIZE, page_token=None, max_workers=MAX_WORKERS):
+        """
+        Yields every page in order. The first page is fetched alone so small results cost a single request; if it is
+        full the following pages are fetched `max_workers` at a time by offset. Only a token issued by page() for a
+        cursor read is followed one page after the other.
+        """
+        offset, cursor = decode_cursor(page_token, self._fingerprint) if page_token else (0, None)
+        page = self._page(offset, page_size, cursor)
+        yield page
+        while page['next_page_token'] and cursor is not None:
+            page = self.page(page_size, page['next_page_token'])
+            yield page
+        while page['next_page_token']:
+            offset = decode_cursor(page['next_page_token'], self._fingerprint)[0]
+            offsets = [offset + i * page_size for i in range(max_workers)]
+            if self._rowLimit is not None:
+                offsets = [o for o in offsets if o < self._rowLimit]
+            for page in parallel_map(lambda o: self._page(o, page_size), offsets, max_workers):
+                yield page
+                if not page['next_page_token']:
+                    return
+
+    def iter_response(self, page_size=PAGE_SIZE, max_workers=1):
+        """
+        Yields the alias mapped rows one by one, fetching the next page only once the previous one has been consumed,
+        so memory is bounded by page_size * max_workers rows instead of the result size.
+        """
+        for page in self.pages(page_size, max_workers=max_workers):
+            rows = page['rows']
+            page['rows'] = None
+            for row in rows:
+                yield row
+
+    def response(self, max_rows=MAX_ROWS):
+        """
+        this will produce the following function chain in GEE, page by page:
+        # <Collection>.<filters>.<functions>.<sorts>.<reducers>.toList(page_size, offset).getInfo()
+        Results of more than max_rows rows (None for no cap) raise instead of filling the memory: read them with
+        pages() or iter_response().
+        """
+        rows = []
+        for row in self.iter_response(max_workers=MAX_WORKERS):
+            if max_rows is not None and len(rows) >= max_rows:
+                raise ValueError('the result has more than {0} rows, read it with pages() or iter_response()'.format(
+                    max_rows))
+            rows.append(row)
+        return rows
 
     def _getInfo(self):
         """docstring for Collection"""
-        return self._asset.getInfo()
+        return self.backend.get_info(self._asset)
 
     @cached_property
     def reduceGen(self):
+        if self.reducers is not None:
+            return _withRegion(self.reducers, self.geometry, self.plan)
         group_by = None
         if 'group' in self._parsed:
             group_by = self._parsed['group']
 
-        reducers = _reducers(self.select['_functions'], group_by, self.geometry)
+        reducers = _reducers(self.select['_functions'], group_by, self.geometry, self.plan)
 
         return reducers
+
+    def _footprint(self, image):
+        """Region an image is reduced over without a query geometry: its own footprint, or the world if unbounded"""
+        footprint = image.geometry()
+        world = ee.Geometry.Rectangle(WORLD_BOUNDS, 'EPSG:4326', False)
+        return ee.Geometry(ee.Algorithms.If(footprint.isUnbounded(), world, footprint))
@@ -1,31 +1,69 @@
 import ee
+from cached_property import cached_property
 
-from .collection import Collection
+from .collection import Collection, MAX_WORKERS
+from .utils.geometry import max_error, round_coordinates
+from .utils.parallel import parallel_map
+from .utils.partition import index_boundaries, mergeable, merge_partials, partial_reduce_columns
+from .utils.partition import partition_functions, partitions
+from .utils.retry import retry
+
+# Attempts per partition of a partitioned reduction
+PARTITION_RETRIES = 3
 
 
 class FeatureCollection(Collection):
     """docstring for FeatureCollection"""
 
-    def __init__(self, json, select, filters, asset_id, geometry=None):
+    def __init__(self, json, select, filters, asset_id, geometry=None, backend=None, flags=None, reducers=None):
         self.json = json
         self.select = select
+        self.flags = flags or {}
         super().__init__(json['data']['attributes']['jsonSql'], select, filters, asset_id, 'FeatureCollection',
-                         geometry)
+                         geometry, backend, reducers)
 
     def _geometry(self, geometry):
         return geometry
 
     def _mapOutputFList(self, feat):
+        """Renames the aliased columns of one result row on the client"""
+        if self.flags.get('precision') is not None and isinstance(feat, dict) and feat.get('geometry'):
+            feat = dict(feat, geometry=round_coordinates(feat['geometry'], self.flags['precision']))
         output = self.calculate_output_format(feat)
-        if len(output['alias']['result']) > 0:
-            return feat.rename(output['alias']['result'], output['alias']['alias'])
-        else:
+        if len(output['alias']['result']) == 0:
             return feat
 
+        row = dict(feat)
+        values = dict(row['properties']) if 'properties' in row else row
+        for result, alias in zip(output['alias']['result'], output['alias']['alias']):
+            if result in values:
+                values[alias] = values.pop(result)
+        if 'properties' in row:
+            row['properties'] = values
+        return row
+
+    def _mapOutput(self, element):
+        return self._mapOutputFList(element)
+
     def _initSelect(self):
+        # geometries are kept for the spatial filters of _where, and dropped by _project
         self._asset = self._asset.select(self.select['_columns'])
         return self
 
+    def _project(self):
+        """
+        After every filter, geometries are dropped unless the query selects the_geom. With flags={'precision': decimals}
+        selected geometries are simplified below that precision.
+        """
+        if not isinstance(self._asset, ee.featurecollection.FeatureCollection):
+            return self
+        if not self.select.get('geometry'):
+            self._asset = self._asset.select(self.select['_columns'], None, False)
+        elif self.flags.get('precision') is not None:
+            tolerance = max_error(self.flags['precision'])
+            self._asset = self._asset.map(lambda feature: feature.simplify(tolerance))
+        return self
+
     def _groupBy(self):
         """ data = feature collection
             select = list with column id you want to count/sum
@@ -40,12 +78,36 @@ class FeatureCollection(Collection):
 
         return self
 
-    def response(self):
+    @cached_property
+    def _partitioned_rows(self):
         """
-        this will produce the following function chain in GEE:
-        # FeatureCollection.<filters>.<functions>.<sorts>.<imageReducers>.limit(n).getInfo()
+        With flags={'partitions': n} aggregates are computed over n system:index ranges of the filtered collection (see
+        partitions), max_workers at a time, each retried on its own, and the partials merged into the rows a single
+        reduceColumns would return. None when the query has no aggregate or uses one whose partials cannot be merged.
         """
-        result = self._initSelect()._where()._groupBy()._sort()._limit()._getInfo()
-        alias_mapped_results = [self._mapOutputFList(element) for element in result]
+        functions = self.select['_functions']['columns']
+        if not self.flags.get('partitions') or not self.reduceGen['reduceColumns'] or not mergeable(functions):
+            return None
+        # partitioned before anything is selected: reduceColumns reads the columns it needs
+        self._where()
+        group_by = self._parsed.get('group')
+        outputs = partition_functions(functions)
+        columns = list(dict.fromkeys(column for _, column in outputs))
+        arguments = partial_reduce_columns(columns, group_by)
+
+        def reduce_partition(partition):
+            return retry(lambda: self.backend.get_info(partition.reduceColumns(**arguments)),
+                         self.flags.get('retries', PARTITION_RETRIES))
+
+        count = self.flags['partitions']
+        boundaries = self.backend.get_info(index_boundaries(self._asset, count)) if count > 1 else []
+        partials = parallel_map(reduce_partition, partitions(self._asset, boundaries),
+                                self.flags.get('max_workers', MAX_WORKERS))
+        merged = merge_partials(partials, columns, outputs, [group['value'] for group in group_by or []])
+        return merged['groups'] if group_by else [merged]
 
-        return alias_mapped_results
+    def _fetch(self, offset, count):
+        rows = self._partitioned_rows
+        if rows is None:
+            return super()._fetch(offset, count)
+        return rows[offset:offset + count]
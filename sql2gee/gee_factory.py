@@ -3,25 +3,54 @@ import json
 import ee
 from cached_property import cached_property
 
+from .backend import default_backend
+from .catalog import default_catalog
+from .collection import MAX_WORKERS, PAGE_SIZE
 from .feature_collection import FeatureCollection
 from .image import Image
 from .image_collection import ImageCollection
+from .utils.geometry import geojson_area
+from .utils.pushdown import DATE_PATTERN, conjuncts, is_time_range, time_filters, time_intervals
+from .utils.scale import PIXEL_BUDGET, plan_reduction
+from .utils.sqlParser import unquote
+from .utils.zonal import zone_properties
+
+# Column name SQL clients use for the geometry of a feature
+GEOMETRY_COLUMN = 'the_geom'
+
+
+def _where_columns(node, found):
+    """Columns compared in a WHERE tree: what its filters read, found without building them"""
+    if isinstance(node, dict):
+        if node.get('type') == 'operator' and node['left'][0]['type'] == 'literal':
+            found.add(node['left'][0]['value'])
+        for value in node.values():
+            _where_columns(value, found)
+    elif isinstance(node, list):
+        for item in node:
+            _where_columns(item, found)
+    return found
 
 
 class GeeFactory(object):
     """docstring for GeeFactory"""
 
-    def __init__(self, sql_scheme, geojson=None, flags=None):
+    def __init__(self, sql_scheme, geojson=None, flags=None, catalog=None, backend=None, select=None, reducers=None):
         """
-        Description here
+        Description here; a prepared query passes the `select` and the region-less `reducers` it planned once, for
+        the factory to use instead of validating the select and building the reducer graph again
         """
+        self.catalog = catalog or default_catalog()
+        self.backend = backend or default_backend()
         self.json = sql_scheme
         self._parsed = self.json['data']['attributes']['jsonSql']
         self.sql = self.json['data']['attributes']['query']
         self._asset_id = self.json['data']['attributes']['jsonSql']['from'].strip("'").strip('"')
         self.type = self.metadata['type']
         self.geojson = geojson
-        self.flags = flags  # <-- Will be used in a later version of the code
+        self.flags = flags  # <-- Execution options, e.g. {'tiles': 4} for tiled Image reductions
+        self._prepared_select = select
+        self._reducers = reducers
 
     def _geo_extraction(self, json_input):
         """
@@ -33,7 +62,9 @@ class GeeFactory(object):
         if isinstance(json_input, dict):
             for k, v in json_input.items():
                 if k == lookup_key and v == lookup_value and json_input['value'] == sql_function:
-                    yield json_input['arguments'][0]['value'].strip("'")
+                    # a $parameter of a prepared query has no geometry until it is bound
+                    if json_input['arguments'][0]['type'] == 'string':
+                        yield unquote(json_input['arguments'][0]['value'])
                 else:
                     for child_val in self._geo_extraction(v):
                         yield child_val
@@ -42,12 +73,12 @@ class GeeFactory(object):
                 for item_val in self._geo_extraction(item):
                     yield item_val
 
-    def _geojson_to_featurecollection(self, geojson):
-        """If Geojson kwarg is received or ST_GEOMFROMGEOJSON sql argument is used,
-        (convert it into a usable E.E. object.obtaining geojson data) c"""
-
+    @cached_property
+    def _features(self):
+        """GeoJSON features from ST_GEOMFROMGEOJSON arguments or the geojson kwarg, None if there are none"""
         geometries = [json.loads(x) for x in self._geo_extraction(self._parsed)]
 
+        geojson = self.geojson
         if geometries:
             geojson = {
                 "features": geometries,
@@ -55,38 +86,73 @@ class GeeFactory(object):
             }
         if isinstance(geojson, dict):
             assert geojson.get('features') is not None, "Expected key not found in item passed to geojoson"
-            return ee.FeatureCollection(geojson.get('features'))
+            return geojson.get('features')
         else:
             return None
 
-    @cached_property
-    def metadata(self):
-        """Property that holds the Metadata dictionary returned from Earth Engine."""
-        if 'ft:' in self._asset_id:
-            meta = ee.FeatureCollection(self._asset_id).limit(0).getInfo()
-            assert meta is not None, 'please enter a valid fusion table'
-
-            info = {
-                'type': meta['type'],
-                'columns': meta['columns'],
-                'id': self._asset_id,
-                'version': '',
-                'properties': meta['properties']
-            }
+    def _geojson_to_featurecollection(self, geojson):
+        """If Geojson kwarg is received or ST_GEOMFROMGEOJSON sql argument is used,
+        (convert it into a usable E.E. object.obtaining geojson data) c"""
+        if self._features is None:
+            return None
+        return ee.FeatureCollection(self._features)
 
-            return info
-        else:
-            info = ee.data.getAsset(self._asset_id)
+    @cached_property
+    def _zones(self):
+        """
+        Per feature (zonal) mode for Image and ImageCollection queries with several input features: enabled by a GROUP
+        BY on properties of the features, or by flags={'zonal': True}. Every feature becomes one result row.
+        """
+        if self.type not in ['IMAGE', 'IMAGE_COLLECTION'] or not self._features:
+            return None
+        keys = [group['value'] for group in self._parsed.get('group') or []]
+        properties = zone_properties(self._features)
+        if keys and all(key in properties for key in keys) or (self.flags or {}).get('zonal'):
+            return {'features': self._features, 'keys': keys or sorted(properties), 'properties': properties}
+        return None
 
-            assert info is not None, "data type not expected"
+    @cached_property
+    def _plan(self):
+        """
+        Scale, tileScale and maxPixels of the region reductions of Image and ImageCollection queries: the native scale
+        of the queried bands, coarsened if the area of the geometry (or the whole image) times the images composited
+        by each reduction holds more pixels than flags['pixel_budget']. Queries that reduce have their images counted by
+        Earth Engine in the reduction request itself, see _images.
+        """
+        if self.type not in ['IMAGE', 'IMAGE_COLLECTION']:
+            return None
+        names = self._select['_bands']
+        bands = [band for band in self.metadata.get('bands') or [] if not names or band['id'] in names]
+        area = sum(geojson_area(feature) for feature in self._features) if self._features else None
+        reduces = self.type == 'IMAGE_COLLECTION' and bands and self._select['functions']
+        images = self._images if reduces else 1
+        return plan_reduction(bands, area, (self.flags or {}).get('pixel_budget', PIXEL_BUDGET), images)
 
-            # if ('bands' in info) and (not info['bands']):
-            if info['type'] == 'IMAGE_COLLECTION':
-                meta = ee.ImageCollection(self._asset_id).limit(1).getInfo()['features'][0]
-                info['bands'] = meta['bands']
-                info['columns'] = {k: type(v).__name__ for k, v in meta['properties'].items()}
+    @cached_property
+    def _images(self):
+        """
+        Images each region reduction of an ImageCollection query composites, as an ee.Number: those passing the
+        WHERE filters, shared among the GROUP BY groups. Counted by Earth Engine within the reduction request.
+        """
+        collection = ee.ImageCollection(self._asset_id)
+        filters = self._filter or {}
+        for indexed in filters.get('indexed', []):
+            collection = collection.filter(indexed)
+        geometry = self._geojson_to_featurecollection(self.geojson)
+        if geometry is not None:
+            collection = collection.filterBounds(geometry)
+        if 'filter' in filters:
+            collection = collection.filter(filters['filter'])
+        images = ee.Number(collection.size())
+        keys = [group['value'] for group in self._parsed.get('group') or []]
+        if keys:
+            images = images.divide(ee.Number(collection.distinct(keys).size()).max(1)).ceil()
+        return images.max(1)
 
-        return info
+    @cached_property
+    def metadata(self):
+        """Property that holds the Metadata dictionary returned from Earth Engine."""
+        return self.catalog.metadata(self._asset_id, self.backend)
 
     @cached_property
     def _initSelect(self):
@@ -101,7 +167,7 @@ class GeeFactory(object):
         if 'bands' in self.metadata and self.metadata['bands']:
             info['_init_bands'] = [v['id'] for v in self.metadata['bands']]
         elif self.type == 'TABLE' or self.type == 'FEATURE_COLLECTION':
-            info['_init_cols'] = ee.FeatureCollection(self.metadata['id']).limit(1).getInfo()['columns']
+            info['_init_cols'] = self.catalog.table_columns(self._asset_id, self.backend)
 
         return info
 
@@ -124,6 +190,9 @@ class GeeFactory(object):
             '!=': ee.Filter.neq,
             'bedate': ee.Filter.date,
             'between': ee.Filter.rangeContains,
+            'in': lambda column, *values: ee.Filter.inList(column, list(values)),
+            'is': lambda column: ee.Filter.notNull([column]).Not(),
+            'is not': lambda column: ee.Filter.notNull([column]),
             'like': ee.Filter.eq,
             '%like%': ee.Filter.stringContains,
             '%like': ee.Filter.stringEndsWith,
@@ -147,18 +216,25 @@ class GeeFactory(object):
         elif 'type' in [*data] and data['type'] == 'operator':
             ########------------------------------------------- Latests leaf we will want to return. we will need to check if it is a band or a column.
             if data['left'][0]['value'] in self._initSelect['_init_cols']:
-                if 'time' in data['left'][0]['value'] and data['right'][0]['type'] in ['string', 'date']:
-                    ########------------------------------------------- Date management at filter level this is TEMPORAL TODO until we do have a proper way of identify it.
-                    data['right'][0]['value'] = ee.Date.parse('dd-mm-yyyy',
-                                                              data['right'][0]['value'].strip("'")).millis()
-                    data['right'][0]['type'] = 'date'
-                if data['right'][0]['type'] == 'string':
-                    return {'column': [data['left'][0]['value']],
-                            'filter': _filters[data['value']](data['left'][0]['value'],
-                                                              data['right'][0]['value'].strip("'"))}
-                else:
-                    return {'column': [data['left'][0]['value']],
-                            'filter': _filters[data['value']](data['left'][0]['value'], data['right'][0]['value'])}
+                for value in data['right']:
+                    if 'time' in data['left'][0]['value'] and value['type'] == 'string':
+                        ########------------------------------------------- Date management at filter level this is TEMPORAL TODO until we do have a proper way of identify it.
+                        value['value'] = ee.Date.parse(DATE_PATTERN, value['value'].strip("'")).millis()
+                        value['type'] = 'date'
+                operator = data['value']
+                values = [unquote(value['value']) if value['type'] == 'string' else value['value']
+                          for value in data['right'] if value['type'] != 'null']
+                negated = operator.startswith('not ')
+                if negated:
+                    operator = operator[len('not '):]
+                if operator == 'like' and values and isinstance(values[0], str):
+                    # 'abc%', '%abc' and '%abc%' patterns
+                    pattern = values[0]
+                    operator = ('%' if pattern.startswith('%') else '') + 'like' + \
+                               ('%' if len(pattern) > 1 and pattern.endswith('%') else '')
+                    values = [pattern.strip('%') if operator != 'like' else pattern]
+                _filter = _filters[operator](data['left'][0]['value'], *values)
+                return {'column': [data['left'][0]['value']], 'filter': _filter.Not() if negated else _filter}
             elif data['left']['value'] in self._initSelect['_init_bands']:
                 # todo think what to do with bands in filter where
                 raise Exception('error; non supported operation: filter by column ', data['left'][0]['value'])
@@ -185,16 +261,43 @@ class GeeFactory(object):
 
     @cached_property
     def _filter(self):
-        if 'where' in self._parsed:
-            return self._filterGen(self._parsed['where'][0])
-        else:
+        """
+        Filters of the WHERE clause. Comparisons of system:time_start/system:time_end with literals that must hold
+        for every row are merged into one interval per property and returned apart, under 'indexed', as the date
+        filters Earth Engine serves from the time index of the collection.
+        """
+        if 'where' not in self._parsed:
             return None
+        where = self._parsed['where'][0]
+        columns = self._initSelect.get('_init_cols') or []
+        pushed = [node for node in conjuncts(where) if is_time_range(node) and node['left'][0]['value'] in columns]
+        if not pushed:
+            return self._filterGen(where)
+
+        result = {'column': list(set(node['left'][0]['value'] for node in pushed)),
+                  'indexed': time_filters(time_intervals(pushed))}
+        for node in conjuncts(where):
+            if any(node is other for other in pushed):
+                continue
+            partial = self._filterGen(node)
+            if partial:
+                result['column'] = list(set(result['column'] + partial['column']))
+                result['filter'] = ee.Filter.And(result['filter'], partial['filter']) if 'filter' in result \
+                    else partial['filter']
+        return result
+
+    @cached_property
+    def _filter_columns(self):
+        """Columns the WHERE filters read, which the select keeps"""
+        return sorted(_where_columns(self._parsed.get('where', []), set()))
 
     @cached_property
     def _select(self):
         """
         This will receive the select statement of the query and transform it in the way we need it
         """
+        if self._prepared_select is not None:
+            return self._prepared_select
         selectArray = self.json['data']['attributes']['jsonSql']['select']
         selected = {
             '_init_cols': [],
@@ -210,7 +313,8 @@ class GeeFactory(object):
                 'bands': [],
                 'columns': []
             },
-            'others': []
+            'others': [],
+            'geometry': False
         }
         info = self._initSelect
 
@@ -218,7 +322,12 @@ class GeeFactory(object):
         for selectElement in selectArray:
             # This will retrieve the columns and bands inside select and check if the names belong to those in the data
             if selectElement['type'] == 'literal':
-                if '_init_cols' in info and selectElement['value'] in info['_init_cols']:
+                if selectElement['value'] == GEOMETRY_COLUMN:
+                    # geometries are only returned when asked for
+                    response['geometry'] = True
+                elif '_init_cols' in info and selectElement['value'] in info['_init_cols']:
+                    response['columns'].append(selectElement)
+                elif self._zones and selectElement['value'] in self._zones['properties']:
                     response['columns'].append(selectElement)
                 elif '_init_bands' in info and selectElement['value'] in info['_init_bands']:
                     response['bands'].append(selectElement)
@@ -228,6 +337,9 @@ class GeeFactory(object):
             # This will retrieve the columns and bands for our dataset and extend the cols/bands to select if they already hasn't being selected
             elif selectElement['type'] == 'function':
                 response['functions'].append(selectElement)
+                if any(args['type'] == 'literal' and args['value'] == GEOMETRY_COLUMN for args in
+                       selectElement['arguments']):
+                    response['geometry'] = True
                 # This will divide the functions that are related bands from those related columns so we can use the in the reducers.
                 if '_init_cols' in info:
                     # this will test if the arguments contains a column and if so it will added it to our select tree
@@ -259,15 +371,15 @@ class GeeFactory(object):
                     f = [args['value'] for args in selectElement['arguments'] if
                          args['type'] == 'literal' and args['value'] not in info['_init_cols'] and args['value']]
 
-                if f and len(f) == len(selectElement['arguments']) and 'rast' not in f:
+                if f and len(f) == len(selectElement['arguments']) and 'rast' not in f and GEOMETRY_COLUMN not in f:
                     raise NameError('column/band name not valid in function {0}: {1}'.format(selectElement['value'], f))
 
             elif selectElement['type'] == 'wildcard':
                 if '_init_cols' in info and len(info['_init_cols']) > 0:
-                    d = [{'type': 'literal', 'alias': None, 'value': f} for f in info['_init_cols']]
+                    d = [{'type': 'literal', 'alias': None, 'value': f, 'wildcard': True} for f in info['_init_cols']]
                     response['columns'].extend(d)
                 elif '_init_bands' in info and len(info['_init_bands']) > 0:
-                    d = [{'type': 'literal', 'alias': None, 'value': f} for f in info['_init_bands']]
+                    d = [{'type': 'literal', 'alias': None, 'value': f, 'wildcard': True} for f in info['_init_bands']]
                     response['bands'].extend(d)
 
             else:
@@ -277,29 +389,43 @@ class GeeFactory(object):
             if key in ['columns', 'bands']:
                 assert self._findDup(value), 'we cannot have 2 columns with the same alias'.format()
 
-        if self._filter:
-            response['_columns'] = list(
-                set([a['value'] for a in response['columns']]).union(selected['_init_cols']).union(
-                    self._filter['column']))
-        else:
-            response['_columns'] = list(set([a['value'] for a in response['columns']]).union(selected['_init_cols']))
+        # sorted, so the same query always builds the same request
+        response['_columns'] = sorted(set([a['value'] for a in response['columns']]).union(selected['_init_cols']).union(
+            self._filter_columns))
 
-        response['_bands'] = list(set([a['value'] for a in response['bands']]).union(selected['_init_bands']))
+        response['_bands'] = sorted(set([a['value'] for a in response['bands']]).union(selected['_init_bands']))
 
         return response
 
-    def response(self):
+    def _query(self):
         """
-        Description here
+        Builds the Image/ImageCollection/FeatureCollection object that executes the query
         """
         geom = self._geojson_to_featurecollection(self.geojson)
 
         if self.type == 'IMAGE':
-            return Image(self.sql, self.json, self._select, self._filter, self._asset_id, self.metadata, geom).response()
+            return Image(self.sql, self.json, self._select, self._filter, self._asset_id, self.metadata, geom,
+                         self.flags, self.backend, self._zones, self._plan)
         elif self.type == 'IMAGE_COLLECTION':
-            return ImageCollection(self.json, self._select, self._filter, self._asset_id, geom).response()
+            return ImageCollection(self.json, self._select, self._filter, self._asset_id, geom, self.backend,
+                                   self._zones, self.flags, self._plan, self._reducers)
         elif self.type == 'FEATURE_COLLECTION' or self.type == 'TABLE':
-            return FeatureCollection(self.json, self._select, self._filter, self._asset_id, geom).response()
+            return FeatureCollection(self.json, self._select, self._filter, self._asset_id, geom, self.backend,
+                                     self.flags, self._reducers)
         else:
             raise Exception('Invalid type {}'.format(self.type))
 
+    def response(self):
+        """
+        Description here
+        """
+        return self._query().response()
+
+    def page(self, page_size=PAGE_SIZE, page_token=None):
+        return self._query().page(page_size, page_token)
+
+    def pages(self, page_size=PAGE_SIZE, page_token=None, max_workers=MAX_WORKERS):
+        return self._query().pages(page_size, page_token, max_workers)
+
+    def iter_response(self, page_size=PAGE_SIZE, max_workers=1):
+        return self._query().iter_response(page_size, max_workers)
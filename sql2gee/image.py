@@ -1,13 +1,30 @@
-import json
-
 import ee
 from cached_property import cached_property
 
+from .backend import default_backend
+from .utils.aggregates import Aggregate, merge_aggregates, merge_frequencies, merge_histograms
+from .utils.parallel import parallel_map
+from .utils.scale import ReductionPlan, reduce_adaptively
+from .utils.zonal import ZONE_CHUNK, reduce_zones
+
+# Bounds of the tile grid when the query has no geometry, so it is laid without asking Earth Engine
+WORLD_BOUNDS = [-179, -89, 179, 89]
+# Buckets used for ST_HISTOGRAM(..., auto, ...) when it has to be computed tile by tile
+AUTO_BINS = 50
+# Statistics computed by ST_SUMMARYSTATS, in the order their reducers are combined
+SUMMARY_STATS = ['count', 'sum', 'mean', 'stdDev', 'min', 'max']
+MAX_WORKERS = 8
+
 
 class Image(object):
     """docstring for Image"""
 
-    def __init__(self, sql, json, select, filters, _asset_id, metadata, geometry=None):
+    def __init__(self, sql, json, select, filters, _asset_id, metadata, geometry=None, flags=None, backend=None,
+                 zones=None, plan=None):
+        self.flags = flags or {}
+        self.zones = zones
+        self.plan = plan or ReductionPlan()  # <-- scale/tileScale/maxPixels of the region reductions
+        self.backend = backend or default_backend()
         self.json = json
         self.select = select
         self.group_functions = select['functions']
@@ -20,86 +37,259 @@ class Image(object):
         return ee.Image(self._asset_id)
 
     def _geometry(self, geometry):
-        if geometry:
-            return geometry
-        else:
-            return ee.FeatureCollection(json.loads(
-                '{"type": "FeatureCollection","features":[{"type":"Feature", "properties": {}, "geometry": {"type":"Polygon", "coordinates": [[[-179,-89],[179,-89],[179,89],[-179,89],[-179,-89]]]}}]}').get(
-                'features'))
+        """The query geometry, or None to reduce over the footprint of the image"""
+        self._world = not geometry
+        return geometry or None
 
     @property
     def _bands_names(self):
         return [band['id'] for band in self.metadata['bands']]
 
     @property
-    def st_metadata(self):
-        """The image property Metadata dictionary returned from Earth Engine."""
-        return self.metadata
+    def _tiled(self):
+        """Tiled execution is enabled with flags={'tiles': n} (n x n grid) or {'tiles': (columns, rows)}"""
+        return bool(self.flags.get('tiles'))
 
     @cached_property
-    def _reduce_image(self):
-        """ Construct a combined reducer dictionary and pass it to a ReduceRegion().getInfo() command.
-        If a geometry has been passed to SQL2GEE, it will be passed to ensure only a subset of the band is examined.
+    def _tiles(self):
+        """Grid of tiles covering the bounds of the query geometry, each one clipped to the geometry."""
+        grid = self.flags['tiles']
+        columns, rows = (grid, grid) if isinstance(grid, int) else grid
+
+        if self._world:
+            west, south, east, north = WORLD_BOUNDS
+        else:
+            coordinates = self.backend.get_info(self.geometry.geometry().bounds())['coordinates'][0]
+            west, east = min(c[0] for c in coordinates), max(c[0] for c in coordinates)
+            south, north = min(c[1] for c in coordinates), max(c[1] for c in coordinates)
+
+        width = (east - west) / columns
+        height = (north - south) / rows
+        tiles = []
+        for i in range(columns):
+            for j in range(rows):
+                tile = ee.Geometry.Rectangle([west + i * width, south + j * height,
+                                              west + (i + 1) * width, south + (j + 1) * height], 'EPSG:4326', False)
+                tiles.append(tile if self._world else self.geometry.geometry().intersection(tile, ee.ErrorMargin(1)))
+        return tiles
+
+    def _reduce_tiles(self, image, reducer):
         """
-        d = {
-            'reducer': ee.Reducer.count().combine(ee.Reducer.sum(), outputPrefix='', sharedInputs=True
-                                                  ).combine(ee.Reducer.mean(), outputPrefix='',
-                                                            sharedInputs=True).combine(
-                ee.Reducer.sampleStdDev(), outputPrefix='', sharedInputs=True).combine(ee.Reducer.min(),
-                                                                                       outputPrefix='',
-                                                                                       sharedInputs=True).combine(
-                ee.Reducer.max(), outputPrefix='',
-                sharedInputs=True),
-            'bestEffort': True,
-            'maxPixels': 9e8,
-            'tileScale': 10
+        Runs one reduceRegion per tile at the native scale of the image, concurrently, and returns the partial results.
+        Reducers must be unweighted so each pixel is counted in exactly one tile (the one holding its centroid).
+        """
+        scale = image.select([0]).projection().nominalScale()
+        # tiles stay at the native scale: only their tileScale is raised if Earth Engine runs out of memory, and a
+        # tile holding more than the pixel budget of the plan fails instead of running unbounded (use more tiles)
+        plan = ReductionPlan(tile_scale=self.plan.tile_scale, max_pixels=self.plan.max_pixels)
+
+        def reduce_tile(tile):
+            return reduce_adaptively(self.backend, lambda plan: image.reduceRegion(
+                reducer=reducer, geometry=tile, scale=scale, maxPixels=plan.max_pixels, tileScale=plan.tile_scale),
+                plan)
+
+        return parallel_map(reduce_tile, self._tiles, self.flags.get('max_workers', MAX_WORKERS))
+
+    def _reduce_image_tiles(self, bands, stats):
+        """Tiled _reduce_image: per tile count/sum/sum of squares/min/max, merged into the stats of the whole image"""
+        parts = [part for part, needs in [('count', ['count', 'mean', 'stdDev']), ('sum', ['sum', 'mean', 'stdDev']),
+                                          ('min', ['min']), ('max', ['max'])] if set(needs) & set(stats)]
+        _reducers = {
+            'count': ee.Reducer.count,
+            'sum': lambda: ee.Reducer.sum().unweighted(),
+            'min': ee.Reducer.min,
+            'max': ee.Reducer.max
         }
-        if self.geometry:
-            d['geometry'] = self.geometry
-
-        return self._asset.select(self._bands_names).reduceRegion(**d).getInfo()
+        reducer = _reducers[parts[0]]()
+        for part in parts[1:]:
+            reducer = reducer.combine(_reducers[part](), outputPrefix='', sharedInputs=True)
+
+        image = self._asset.select(bands)
+        if 'stdDev' in stats:
+            image = image.addBands(image.toDouble().pow(2).rename([band + '__sq' for band in bands]))
+        partials = self._reduce_tiles(image, reducer)
+        if len(parts) == 1:
+            partials = [{band + '_' + parts[0]: value for band, value in partial.items()} for partial in partials]
+
+        result = {}
+        for band in bands:
+            aggregate = merge_aggregates([Aggregate(count=partial.get(band + '_count'),
+                                                    sum=partial.get(band + '_sum'),
+                                                    sumsq=partial.get(band + '__sq_sum'),
+                                                    min=partial.get(band + '_min'),
+                                                    max=partial.get(band + '_max')) for partial in partials])
+            values = {'count': aggregate.count,
+                      'sum': aggregate.sum,
+                      'mean': aggregate.mean,
+                      'stdDev': aggregate.stdDev(ddof=1),
+                      'min': aggregate.min,
+                      'max': aggregate.max}
+            result.update({band + '_' + stat: values[stat] for stat in stats})
+        return result
+
+    def _summary_bands(self, function):
+        """Bands passed to ST_SUMMARYSTATS by name or 1-based position; all the bands if none is given"""
+        bands = []
+        for argument in function['arguments']:
+            value = argument['value'].strip("'").strip('"') if isinstance(argument['value'], str) else argument['value']
+            if value in self._bands_names:
+                bands.append(value)
+            elif argument['type'] == 'number' and 0 < value <= len(self._bands_names):
+                bands.append(self._bands_names[value - 1])
+        return bands or self._bands_names
 
     @cached_property
-    def histogram(self):
-        """Retrieve ST_HISTOGRAM()-like info. This will return a dictionary object with bands as keys, and for each
-        band a nested list of (2xn) for bin and frequency. If the user wants us to use the optimum bin number,
-        they can pass n-bins 'auto' instead of an integer.
-        """
-        tmp_dic = {}
-
+    def _histogram_arguments(self):
         for function in self.group_functions:
             if function['value'].lower() == "st_histogram":
                 values = [args['value'] for args in function['arguments']]
                 assert len(values) > 0, "ST_Histogram must be called with arguments"
 
-        hist_args = self.extract_postgis_arguments(values, ['raster', 'band_id', 'n_bins', 'bool'])
-        _, band_of_interest, input_bin_num, dont_flip_order = hist_args
-        reducer = None
-        if not input_bin_num:
-            reducer = ee.Reducer.autoHistogram(maxBuckets=50)
-        else:
-            input_max = self._reduce_image[
-                            band_of_interest + '_max'] + 1  # In EE counting the min -> max range is exc. at max, so need to increment here.
-            input_min = self._reduce_image[band_of_interest + '_min']
+        return self.extract_postgis_arguments(values, ['raster', 'band_id', 'n_bins', 'bool'])
 
-            reducer = ee.Reducer.fixedHistogram(input_min, input_max, input_bin_num)
+    @cached_property
+    def _stats_plan(self):
+        """
+        Bands and statistics the query functions need from _reduce_image: ST_SUMMARYSTATS needs every statistic of
+        its bands, a fixed-bin ST_HISTOGRAM only the min and max of its band. Returns (bands, stats).
+        """
+        bands = []
+        stats = set()
+        for function in self.group_functions:
+            name = function['value'].lower()
+            if name == 'st_summarystats':
+                needed = self._summary_bands(function)
+                stats.update(SUMMARY_STATS)
+            elif name == 'st_histogram' and (self._histogram_arguments[2] or self._tiled):
+                needed = [self._histogram_arguments[1]]
+                stats.update(['min', 'max'])
+            else:
+                continue
+            for band in needed:
+                if band not in bands:
+                    bands.append(band)
+
+        return bands, [stat for stat in SUMMARY_STATS if stat in stats]
+
+    @property
+    def st_metadata(self):
+        """The image property Metadata dictionary returned from Earth Engine."""
+        return self.metadata
 
+    def _region_arguments(self, reducer, plan):
         d = {
             'reducer': reducer,
-            'bestEffort': True,
-            'maxPixels': 9e6,
-            'tileScale': 10,
-
+            'bestEffort': True
         }
-        if self.geometry:
+        d.update(plan.arguments())
+        if self.geometry is not None:
             d['geometry'] = self.geometry
+        return d
+
+    def _stats_request(self, plan):
+        """Server side dictionary with the statistics of _stats_plan, as <band>_<stat> keys"""
+        bands, stats = self._stats_plan
+        _reducers = {
+            'count': ee.Reducer.count,
+            'sum': ee.Reducer.sum,
+            'mean': ee.Reducer.mean,
+            'stdDev': ee.Reducer.sampleStdDev,
+            'min': ee.Reducer.min,
+            'max': ee.Reducer.max
+        }
+        reducer = _reducers[stats[0]]()
+        for stat in stats[1:]:
+            reducer = reducer.combine(_reducers[stat](), outputPrefix='', sharedInputs=True)
+
+        return self._asset.select(bands).reduceRegion(**self._region_arguments(reducer, plan))
+
+    def _histogram_request(self, stats, plan):
+        """
+        Server side ST_HISTOGRAM of the band. Fixed bins take their range from the min/max in `stats`, which is
+        resolved by Earth Engine in the same request.
+        """
+        _, band_of_interest, input_bin_num, _ = self._histogram_arguments
+        if not input_bin_num:
+            reducer = ee.Reducer.autoHistogram(maxBuckets=50)
+        else:
+            # In EE counting the min -> max range is exc. at max, so need to increment here.
+            input_max = ee.Number(stats.get(band_of_interest + '_max')).add(1)
+            input_min = ee.Number(stats.get(band_of_interest + '_min'))
+            reducer = ee.Reducer.fixedHistogram(input_min, input_max, input_bin_num)
+
+        return self._asset.select([band_of_interest]).reduceRegion(**self._region_arguments(reducer, plan)).get(
+            band_of_interest)
+
+    def _valuecount_request(self, plan):
+        _, band_of_interest, _ = self._valuecount_arguments
+        reducer = ee.Reducer.frequencyHistogram().unweighted()
+        return self._asset.select(band_of_interest).reduceRegion(**self._region_arguments(reducer, plan)).get(
+            band_of_interest)
+
+    @cached_property
+    def _evaluated(self):
+        """
+        Every reduction the query needs, built as a single ee.Dictionary and fetched with one getInfo(), so a query
+        with ST_SUMMARYSTATS, ST_HISTOGRAM and ST_VALUECOUNT costs one round trip. It is rebuilt with an escalated
+        plan if Earth Engine runs out of memory or time.
+        """
+        functions = [function['value'].lower() for function in self.group_functions]
+
+        def build(plan):
+            requests = {}
+            stats = None
+            if self._stats_plan[0]:
+                stats = self._stats_request(plan)
+                requests['stats'] = stats
+            if 'st_histogram' in functions:
+                requests['histogram'] = self._histogram_request(stats, plan)
+            if 'st_valuecount' in functions:
+                requests['valuecount'] = self._valuecount_request(plan)
+            return ee.Dictionary(requests)
+
+        if not self._stats_plan[0] and not {'st_histogram', 'st_valuecount'} & set(functions):
+            return {}
+        return reduce_adaptively(self.backend, build, self.plan)
+
+    @cached_property
+    def _reduce_image(self):
+        """ Combined reduction of the bands and statistics in _stats_plan, computed once for all the functions of the
+        query. If a geometry has been passed to SQL2GEE, it will be passed to ensure only a subset of the band is
+        examined.
+        """
+        bands, stats = self._stats_plan
+        if self._tiled:
+            return self._reduce_image_tiles(bands, stats)
+
+        result = self._evaluated['stats']
+        if len(stats) == 1:
+            # single output reducers name their outputs after the band only
+            result = {band + '_' + stats[0]: value for band, value in result.items()}
+        return result
+
+    @cached_property
+    def histogram(self):
+        """Retrieve ST_HISTOGRAM()-like info. This will return a dictionary object with bands as keys, and for each
+        band a nested list of (2xn) for bin and frequency. If the user wants us to use the optimum bin number,
+        they can pass n-bins 'auto' instead of an integer.
+        """
+        tmp_dic = {}
 
-        tmp_response = self._asset.select([band_of_interest]).reduceRegion(**d).getInfo()
+        _, band_of_interest, input_bin_num, dont_flip_order = self._histogram_arguments
+        if self._tiled:
+            # Tiles need the same buckets to be merged, so auto bins fall back to a fixed histogram over min -> max
+            input_max = self._reduce_image[band_of_interest + '_max'] + 1
+            input_min = self._reduce_image[band_of_interest + '_min']
+            reducer = ee.Reducer.fixedHistogram(input_min, input_max, input_bin_num or AUTO_BINS).unweighted()
+            partials = self._reduce_tiles(self._asset.select([band_of_interest]), reducer)
+            histogram = merge_histograms([partial.get(band_of_interest) for partial in partials])
+        else:
+            histogram = self._evaluated['histogram']
 
         if dont_flip_order:
-            tmp_dic[band_of_interest] = tmp_response[band_of_interest]
+            tmp_dic[band_of_interest] = histogram
         else:
-            tmp_dic[band_of_interest] = tmp_response[band_of_interest][:][::-1]
+            tmp_dic[band_of_interest] = histogram[:][::-1]
 
         return tmp_dic
 
@@ -121,8 +311,15 @@ class Image(object):
     @cached_property
     def summary_stats(self):
         """Return a dictionary object of summary stats like the postgis function ST_SUMMARYSTATS()."""
+        bands = []
+        for function in self.group_functions:
+            if function['value'].lower() == 'st_summarystats':
+                for band in self._summary_bands(function):
+                    if band not in bands:
+                        bands.append(band)
+
         d = {}
-        for band in self._bands_names:
+        for band in bands:
             d[band] = {'count': self._reduce_image[band + '_count'],
                        'sum': self._reduce_image[band + '_sum'],
                        'mean': self._reduce_image[band + '_mean'],
@@ -133,35 +330,32 @@ class Image(object):
         return d
 
     @cached_property
-    def st_valuecount(self):
-        """Return only metadata for a specifically requested band, like postgis function"""
-        # tmp_dic = {}
+    def _valuecount_arguments(self):
         for function in self.group_functions:
             if function['value'].lower() == "st_valuecount":
                 values = [args['value'] for args in function['arguments']]
                 assert len(values) > 0, "raster string and bandnum integer (or band key string) must be provided"
-                _, band_of_interest, no_drop_no_data_val = self.extract_postgis_arguments(values,
-                                                                                          ['raster', 'band_id', 'bool'])
 
-        d = {
-            'reducer': ee.Reducer.frequencyHistogram().unweighted(),
-            'bestEffort': True,
-            'maxPixels': 9e8,
-            'tileScale': 10
-        }
+        return self.extract_postgis_arguments(values, ['raster', 'band_id', 'bool'])
 
-        if self.geometry:
-            d['geometry'] = self.geometry
+    @cached_property
+    def st_valuecount(self):
+        """Return only metadata for a specifically requested band, like postgis function"""
+        _, band_of_interest, no_drop_no_data_val = self._valuecount_arguments
 
-        tmp_response = self._asset.select(band_of_interest).reduceRegion(**d).getInfo()
+        if self._tiled:
+            partials = self._reduce_tiles(self._asset.select(band_of_interest),
+                                          ee.Reducer.frequencyHistogram().unweighted())
+            tmp_response = {band_of_interest: merge_frequencies([partial.get(band_of_interest)
+                                                                 for partial in partials])}
+        else:
+            tmp_response = {band_of_interest: self._evaluated['valuecount']}
 
         if no_drop_no_data_val != True:
             try:
                 del tmp_response[band_of_interest]['null']
             except KeyError:
                 pass
-        # else:
-        # tmp_dic[band_of_interest] = tmp_response[band_of_interest]
 
         return tmp_response
 
@@ -228,5 +422,59 @@ class Image(object):
 
         return [response]
 
+    def _reduce_zones(self, bands, reducer):
+        image = self._asset.select(bands)
+        return reduce_zones(self.backend, image, self.zones['features'], reducer,
+                            self.flags.get('zone_chunk', ZONE_CHUNK), self.flags.get('max_workers', MAX_WORKERS),
+                            scale=self.plan.scale or image.select([0]).projection().nominalScale(),
+                            tileScale=self.plan.tile_scale)
+
+    def _zonal_image(self):
+        """
+        Zonal mode: ST_SUMMARYSTATS and ST_VALUECOUNT computed for every input feature with reduceRegions, one row per
+        feature holding its zone keys.
+        """
+        rows = [{key: (feature.get('properties') or {}).get(key) for key in self.zones['keys']}
+                for feature in self.zones['features']]
+        for func in self.group_functions:
+            alias = func['alias'] if func['alias'] else func['value'].lower()
+            name = func['value'].lower()
+            if name == 'st_summarystats':
+                bands = self._summary_bands(func)
+                reducer = ee.Reducer.count()
+                for stat in [ee.Reducer.sum(), ee.Reducer.mean(), ee.Reducer.sampleStdDev(), ee.Reducer.min(),
+                             ee.Reducer.max()]:
+                    reducer = reducer.combine(stat, outputPrefix='', sharedInputs=True)
+                for row, zone in zip(rows, self._reduce_zones(bands, reducer)):
+                    row[alias] = {band: {'count': zone.get(band + '_count'),
+                                         'sum': zone.get(band + '_sum'),
+                                         'mean': zone.get(band + '_mean'),
+                                         'stdev': zone.get(band + '_stdDev'),
+                                         'min': zone.get(band + '_min'),
+                                         'max': zone.get(band + '_max')} for band in bands}
+            elif name == 'st_valuecount':
+                _, band_of_interest, no_drop_no_data_val = self._valuecount_arguments
+                zones = self._reduce_zones([band_of_interest], ee.Reducer.frequencyHistogram().unweighted())
+                for row, zone in zip(rows, zones):
+                    counts = dict(zone.get(band_of_interest) or {})
+                    if no_drop_no_data_val != True:
+                        counts.pop('null', None)
+                    row[alias] = {band_of_interest: counts}
+            else:
+                raise Exception('error; non supported operation per zone: {0}'.format(func['value']))
+        return rows
+
     def response(self):
-        return self._image()
+        rows = self._zonal_image() if self.zones else self._image()
+        return rows[self.json.get('offset') or 0:]
+
+    def page(self, page_size=None, page_token=None):
+        """Image queries always return a single row, so there is only one page"""
+        return {'rows': self.response(), 'next_page_token': None}
+
+    def pages(self, page_size=None, page_token=None, max_workers=None):
+        yield self.page(page_size, page_token)
+
+    def iter_response(self, page_size=None, max_workers=None):
+        for row in self.response():
+            yield row
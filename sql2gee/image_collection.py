@@ -1,66 +1,73 @@
+import copy
+import threading
+
 import ee
+from cached_property import cached_property
 
-from .collection import Collection
+from .collection import Collection, MAX_WORKERS
+from .utils.geometry import round_coordinates
+from .utils.pagination import encode_token
+from .utils.parallel import fetch_chunks
+from .utils.retry import retry
+from .utils.scale import is_resource_error
+from .utils.zonal import ZONE_CHUNK, reduce_zones
 import logging 
 logger = logging.getLogger(__name__)
 
+# Image properties too heavy to return unless the query names them (SELECT * leaves them out)
+HEAVY_PROPERTIES = ['system:footprint']
+# Property of every group representative holding the images of its group
+GROUP_MEMBERS = 'sql2gee_members'
+# Groups evaluated per request, and attempts per request, when a GROUP BY page is fetched
+GROUP_CHUNK = 250
+GROUP_RETRIES = 3
+
 
 class ImageCollection(Collection):
     """docstring for ImageCollection"""
 
-    def __init__(self, json, select, filters, asset_id, geometry=None):
+    def __init__(self, json, select, filters, asset_id, geometry=None, backend=None, zones=None, flags=None,
+                 plan=None, reducers=None):
         self.json = json
         self.select = select
-        super().__init__(json['data']['attributes']['jsonSql'], select, filters, asset_id, 'ImageCollection', geometry)
+        self.zones = zones
+        self.flags = flags or {}
+        self.plan = plan
+        self._lock = threading.Lock()
+        super().__init__(json['data']['attributes']['jsonSql'], select, filters, asset_id, 'ImageCollection', geometry,
+                         backend, reducers)
 
     def _initSelect(self):
         # For image collections select only affects bands and there is not a way of selecting also the columns/properties
         self._asset = self._asset.select(self.select['_bands'])
         return self
 
-    def _initGroupsReducer(self, data, parents=[], proParents={}):
-        keys = [*data]
-        groups = None
-        result = []
-        dparents = list(parents)
-        pparents = dict(proParents)
-        if 'groups' in keys:  ########---------------------------- Leaf with groups:
-            groups = data['groups']
-            if (len(keys) > 1):  ########------------------------- If groups not alone:
-                keys.remove('groups')
-                dparents.append(ee.Filter.eq(keys[0], data[keys[0]]))
-                pparents.update({keys[0]: data[keys[0]]})
-        else:  ########------------------------------------------- Latests leaf we will want to return
-            keys.remove('count')
-            properties = dict(data)
-            return {'filter': [ee.Filter.eq(keys[0], data[keys[0]]), *dparents],
-                    'properties': {**{keys[0]: data[keys[0]]}, **pparents}}
-
-        if groups:  ########-------------------------------------- leaf group iteration
-            for group in groups:
-                partialR = self._initGroupsReducer(group, dparents, pparents)
-                ##----------------------------------------------- to keep it in a 2d array
-                if isinstance(partialR, list):
-                    result.extend(partialR)
-                else:
-                    result.append(partialR)
-        return result  ########----------------------------------- Return result in: [{properties:{key: value},filters:[ee.Filter.eq('month','historical'),ee.Filter.eq('model','historical'),...]},...]
-
     def _collectionReducer(self):
-        crossP = self._asset.reduceColumns(**self.reduceGen['reduceColumns'])
-        mysubsets = self._initGroupsReducer(crossP.getInfo())
-        del crossP
-        if len(mysubsets) == self._asset.size().getInfo():
-            # no need to reduce
-            return self._asset
-        else:
-            collection = self._asset
-            myList = ee.List([collection.filter(ee.Filter(filters['filter'])).reduce(
-                **self.reduceGen['reduceImage']).setMulti(filters['properties']) for filters in mysubsets])
-            return ee.ImageCollection(myList)
+        """
+        Groups the collection server side: one image per distinct combination of the GROUP BY properties is joined to
+        every image sharing those values, and each group is reduced to one image carrying the group values. Nothing is
+        evaluated to discover the groups, and the request does not grow with their number.
+        """
+        keys = [group['value'] for group in self._parsed['group']]
+        representatives = self._asset.distinct(keys)
+        # groups come out ordered by their keys, as the grouped reduceColumns output did
+        for key in reversed(keys):
+            representatives = representatives.sort(key)
+        condition = ee.Filter.And(*[ee.Filter.equals(leftField=key, rightField=key) for key in keys])
+        groups = ee.Join.saveAll(GROUP_MEMBERS).apply(representatives, self._asset, condition)
+        reducer = self.reduceGen['reduceImage']
+
+        def reduce_group(image):
+            members = ee.ImageCollection.fromImages(ee.Image(image).get(GROUP_MEMBERS))
+            return members.reduce(**reducer).copyProperties(image, keys)
+
+        return ee.ImageCollection(groups.map(reduce_group))
 
     def _ComputeReducer(self, img):
-        reduction = img.reduceRegion(**self.reduceGen['reduceRegion'])
+        arguments = self.reduceGen['reduceRegion']
+        if 'geometry' not in arguments:
+            arguments = dict(arguments, geometry=self._footprint(img))
+        reduction = img.reduceRegion(**arguments)
         properties = img.toDictionary(img.propertyNames()).combine(reduction)#.combine(img.toDictionary(['system:time_start', 'system:footprint', 'system:asset_size', 'system:index','time_start','time_end']))
         return ee.Feature(None, properties)
 
@@ -75,28 +82,116 @@ class ImageCollection(Collection):
 
         return self
 
+    def _fetch(self, offset, count):
+        """
+        Region reductions that run out of memory or time are rebuilt with an escalated plan (smaller tiles, then a
+        coarser scale) and the rows fetched again
+        """
+        plan = self.plan
+        try:
+            return self._fetch_rows(offset, count)
+        except Exception as error:
+            escalated = plan.escalate() if plan is not None and is_resource_error(error) else None
+            if escalated is None or not self.reduceGen['reduceRegion']:
+                raise
+            self._replan(plan, escalated)
+            return self._fetch(offset, count)
+
+    def _replan(self, failed, plan):
+        """Rebuilds the query with `plan`, once for all the pages that failed with the `failed` plan"""
+        with self._lock:
+            if self.plan is not failed:
+                return
+            replanned = copy.copy(self)
+            for name in ['_prepared', 'reduceGen']:
+                replanned.__dict__.pop(name, None)
+            replanned.plan = plan
+            replanned._asset = replanned._assetInit()
+            self.__dict__.update(_prepared=replanned._prepared, reduceGen=replanned.reduceGen, plan=plan)
+
+    def _fetch_rows(self, offset, count):
+        """
+        Grouped pages are evaluated in chunks of GROUP_CHUNK groups instead of in one request that reduces every
+        group: the first chunk alone, the next ones up to max_workers at a time only while chunks come back full. A
+        chunk failing with a transient error is retried on its own; rows are merged in result order.
+        """
+        if not (self.reduceGen['reduceImage'] and 'group' in self._parsed):
+            return super()._fetch(offset, count)
+        self._prepared
+
+        def fetch(start, size):
+            return retry(lambda: super(ImageCollection, self)._fetch(start, size),
+                         self.flags.get('retries', GROUP_RETRIES))
+
+        return fetch_chunks(fetch, offset, count, self.flags.get('group_chunk', GROUP_CHUNK),
+                            self.flags.get('max_workers', MAX_WORKERS))
+
+    def _project(self):
+        """
+        Plain row selects come back as bare features carrying only the selected properties, instead of whole images
+        with their bands, geometry and every property. The image id is copied explicitly, copyProperties leaves it out.
+        """
+        if self.select['functions'] or not isinstance(self._asset, ee.imagecollection.ImageCollection):
+            return self
+        properties = [column['value'] for column in self.select['columns']
+                      if not (column.get('wildcard') and column['value'] in HEAVY_PROPERTIES)]
+
+        def project(image):
+            # an empty list would copy every property
+            feature = ee.Feature(None).copyProperties(image, properties) if properties else ee.Feature(None)
+            return feature.set({'system:index': image.get('system:index'), 'system:id': image.get('system:id')})
+
+        self._asset = ee.FeatureCollection(self._asset.map(project))
+        return self
+
+    def _mapOutput(self, element):
+        return self._mapOutputIList(element)
+
     def _mapOutputIList(self, image):
+        """
+        Projects and renames the properties of one result row on the client, so the whole response costs a single
+        round trip to Earth Engine whatever the row count.
+        """
         output = self.calculate_output_format(image)
         output_alias = output['alias']
-        if len(output_alias['result']) == 0:
-            # image['properties']['system:id'] = image['id'] if 'id' in image.keys() else None
-            image_dictionary = ee.Dictionary(image['properties'])
-            return image_dictionary.select(output['output'], True).getInfo()
-
-        if type(image) is dict:
-            image['properties']['system:id'] = image['id'] if 'id' in image.keys() else None
-            image_dictionary = ee.Dictionary(image['properties'])
-            return image_dictionary.select(output['output'], True).rename(output_alias['result'], output_alias['alias']).getInfo()
-        else:
+        if type(image) is not dict:
             return image.select(output['output'], True).rename(output_alias['result'], output_alias['alias'])
 
-    def response(self):
+        properties = dict(image['properties'])
+        if len(output_alias['result']) > 0 and 'system:id' not in properties:
+            properties['system:id'] = image['id'] if 'id' in image.keys() else None
+
+        row = {key: properties[key] for key in output['output'] if key in properties}
+        if self.flags.get('precision') is not None and 'system:footprint' in row:
+            row['system:footprint'] = round_coordinates(row['system:footprint'], self.flags['precision'])
+        for result, alias in zip(output_alias['result'], output_alias['alias']):
+            if result in row:
+                row[alias] = row.pop(result)
+        return row
+
+    @cached_property
+    def _zonal_rows(self):
         """
-        this will produce the following function chain in GEE:
-        # ImageCollection.<filters>.<functions>.<sorts>.<imageReducers>.limit(n).getInfo()
+        Zonal mode: the filtered collection is reduced to one image, which is then reduced over every input feature
+        with chunked, concurrent reduceRegions calls. One row per feature, in input order.
         """
-        result = self._initSelect()._where()._groupBy()._sort()._limit()._getInfo()
-        
-        alias_mapped_results = [self._mapOutputIList(element) for element in result]
+        if not self.reduceGen['reduceImage']:
+            raise Exception('error; zonal queries need an aggregate function over a band')
+        self._initSelect()._where()
+        image = self._asset.reduce(**self.reduceGen['reduceImage'])
+        region = self.reduceGen['reduceRegion']
+        return reduce_zones(self.backend, image, self.zones['features'], region['reducer'],
+                            self.flags.get('zone_chunk', ZONE_CHUNK), self.flags.get('max_workers', MAX_WORKERS),
+                            scale=region['scale'], tileScale=region['tileScale'])
+
+    def _page(self, offset, page_size, cursor=None, by_cursor=None):
+        if not self.zones:
+            return super()._page(offset, page_size, cursor, by_cursor)
 
-        return alias_mapped_results
+        rows = self._zonal_rows[self._rowOffset:]
+        end = min(offset + page_size, len(rows))
+        if self._rowLimit is not None:
+            end = min(end, self._rowLimit)
+        more = end < len(rows) and (self._rowLimit is None or end < self._rowLimit)
+        return {'rows': [self._mapOutput({'properties': row}) for row in rows[offset:end]],
+                'next_page_token': encode_token(end, self._fingerprint) if more else None}
@@ -0,0 +1,142 @@
+import copy
+import json
+import threading
+
+from .backend import default_backend
+from .catalog import default_catalog
+from .gee_factory import GeeFactory
+from .utils.jsonSql import JsonSql
+from .utils.reduce import _reducers
+from .utils.sqlParser import SqlParseError
+
+
+def _parameters(node, found):
+    """Collects the names of the $parameters of a jsonSql tree"""
+    if isinstance(node, dict):
+        if node.get('type') == 'parameter':
+            found.append(node['value'])
+        for value in node.values():
+            _parameters(value, found)
+    elif isinstance(node, list):
+        for item in node:
+            _parameters(item, found)
+    return found
+
+
+def _literal(name, value):
+    """
+    jsonSql node of a bound parameter value: numbers stay numbers, GeoJSON is passed as its JSON string and quotes in
+    strings are escaped as the parser expects them ('')
+    """
+    if isinstance(value, bool) or value is None:
+        raise TypeError('parameter ${0}: unsupported value {1!r}'.format(name, value))
+    if isinstance(value, (int, float)):
+        return {'value': value, 'type': 'number'}
+    if isinstance(value, dict):
+        value = json.dumps(value)
+    return {'value': "'{0}'".format(str(value).replace("'", "''")), 'type': 'string'}
+
+
+def _bound_geometry(node):
+    """True if a ST_GeomFromGeoJSON of the tree takes a $parameter"""
+    if isinstance(node, dict):
+        if node.get('type') == 'function' and node['value'] == 'ST_GeomFromGeoJSON' and _parameters(node, []):
+            return True
+        return any(_bound_geometry(value) for value in node.values())
+    if isinstance(node, list):
+        return any(_bound_geometry(item) for item in node)
+    return False
+
+
+def _bind(node, values):
+    if isinstance(node, dict):
+        if node.get('type') == 'parameter':
+            return _literal(node['value'], values[node['value']])
+        return {key: _bind(value, values) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_bind(item, values) for item in node]
+    return node
+
+
+class PreparedQuery(object):
+    """
+    A query parsed and planned once, executed many times with different $parameter values:
+
+        statement = SQL2GEE.prepare("select sum(pr) from 'IDAHO_EPSCOR/GRIDMET' where system:time_start > $start")
+        statement.response(start=1522548800000)
+
+    The parse tree, the schema validation of the SELECT and the reducer graph are built once per statement; each
+    execution only binds the values and rebuilds what depends on them: the filters, the geometry, the zones and the
+    reduction plan. Parameters may only appear in the WHERE clause, as comparison values or as the ST_GeomFromGeoJSON
+    argument. A grouped (or flags={'zonal': True}) Image query with a bound geometry may be zonal, and its SELECT read
+    properties of the bound features, so it is only parsed once.
+    """
+
+    def __init__(self, sql, geojson=None, flags=None, backend=None, results=None, catalog=None):
+        self.sql = sql
+        self.geojson = geojson
+        self.flags = flags
+        self.backend = backend or default_backend()
+        self.results = results
+        self.catalog = catalog or default_catalog()
+        self.json = JsonSql(sql).to_json()
+        parsed = self.json['data']['attributes']['jsonSql']
+        self.parameters = list(dict.fromkeys(_parameters(parsed.get('where', []), [])))
+        outside = set(_parameters({k: v for k, v in parsed.items() if k != 'where'}, []))
+        if outside:
+            raise SqlParseError('parameters are only supported in WHERE: {0}'.format(
+                ', '.join('$' + name for name in sorted(outside))))
+
+        # the plan: metadata and validated select of the template query; its reducer graph is built on first use
+        self._template = GeeFactory(self.json, geojson, flags, self.catalog, self.backend)
+        self._zonal = self._template.type in ['IMAGE', 'IMAGE_COLLECTION'] and _bound_geometry(parsed.get('where')) \
+            and bool(parsed.get('group') or (flags or {}).get('zonal'))
+        self._select = None if self._zonal else self._template._select
+        self._reducers = None
+        self._lock = threading.Lock()
+
+    def _scheme(self, values):
+        missing = [name for name in self.parameters if name not in values]
+        unknown = [name for name in values if name not in self.parameters]
+        if missing or unknown:
+            raise ValueError('prepared query expects {0}, got {1}'.format(
+                ', '.join('$' + name for name in self.parameters) or 'no parameters',
+                ', '.join('$' + name for name in sorted(values)) or 'none'))
+        scheme = copy.deepcopy(self.json)
+        attributes = scheme['data']['attributes']
+        if 'where' in attributes['jsonSql']:
+            attributes['jsonSql']['where'] = _bind(attributes['jsonSql']['where'], values)
+        return scheme
+
+    def query(self, **values):
+        """A SQL2GEE for the bound values, reusing the plan of the statement"""
+        from .sql2gee import SQL2GEE
+
+        scheme = self._scheme(values)
+        query = SQL2GEE(scheme, self.geojson, self.flags, self.backend, self.results)
+        reducers = self._planned() if self._template.type in ['IMAGE_COLLECTION', 'FEATURE_COLLECTION', 'TABLE'] \
+            else None
+        query.factory = GeeFactory(scheme, self.geojson, self.flags, self.catalog, query._backend, self._select,
+                                   reducers)
+        query.stats.type = query.factory.type
+        return query
+
+    def _planned(self):
+        """Reducer graph of the statement, without region: every execution adds its own geometry and plan"""
+        if self._select is None:
+            return None
+        with self._lock:
+            if self._reducers is None:
+                parsed = self.json['data']['attributes']['jsonSql']
+                self._reducers = _reducers(self._select['_functions'], parsed.get('group'))
+        return self._reducers
+
+    def response(self, **values):
+        return self.query(**values).response()
+
+    def page(self, page_size=None, page_token=None, **values):
+        query = self.query(**values)
+        return query.page(page_size, page_token) if page_size else query.page(page_token=page_token)
+
+    async def aresponse(self, **values):
+        return await self.query(**values).aresponse()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+
+from .utils.lruCache import DiskStore, LRUCache
+
+# Execution flags that do not change the result of a query
+_NEUTRAL_FLAGS = ['cache', 'stats']
+
+
+class ResultCache(object):
+    """
+    Cache of query results. Keys are a canonical form of the parsed query (the jsonSql tree, so formatting and
+    keyword case do not matter), the geometry, the execution flags and the asset updateTime/version, so an updated
+    asset is never answered from a stale entry. Results are stored as serialized JSON: the memory tier is an LRU
+    bounded by entry count and total bytes, the optional disk tier is shared between processes.
+    """
+
+    def __init__(self, maxsize=256, maxbytes=64 * 1024 * 1024, ttl=600, ttls=None, path=None):
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})  # <-- Per asset TTLs in seconds, e.g. {'GLIMS/2016': 86400}
+        self._cache = LRUCache(maxsize=maxsize, path=path, maxbytes=maxbytes)
+        self._generations = DiskStore(os.path.join(path, 'generations')) if path else None
+        self._generation = {}
+        self._lock = threading.Lock()
+
+    def key(self, asset_id, canonical, geojson=None, flags=None, version=None, call=None):
+        """
+        Cache key of a query. `canonical` is the serialized jsonSql tree, `call` tells apart the ways of fetching
+        the result (the whole response, or a given page).
+        """
+        flags = {k: v for k, v in (flags or {}).items() if k not in _NEUTRAL_FLAGS}
+        payload = json.dumps([asset_id, self._current(asset_id), canonical, geojson, flags, version, call],
+                             sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """The cached result, or None"""
+        value = self._cache.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, asset_id=None):
+        self._cache.set(key, json.dumps(value, separators=(',', ':')), ttl=self.ttls.get(asset_id, self.ttl))
+
+    def invalidate(self, asset_id=None):
+        """Drops the results of one asset, or every result if no asset id is given"""
+        if asset_id is None:
+            self._cache.clear()
+            return
+        # results of the asset become unreachable: every key includes the asset generation
+        with self._lock:
+            generation = self._current(asset_id) + 1
+            self._generation[asset_id] = generation
+            if self._generations:
+                self._generations.set(asset_id, generation)
+
+    def _current(self, asset_id):
+        if asset_id not in self._generation and self._generations:
+            record = self._generations.get(asset_id)
+            if record is not None:
+                self._generation[asset_id] = record[0]
+        return self._generation.get(asset_id, 0)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+_results = ResultCache()
+
+
+def default_result_cache():
+    """The result cache shared by every query that does not get its own"""
+    return _results
+
+
+def configure(maxsize=256, maxbytes=64 * 1024 * 1024, ttl=600, ttls=None, path=None):
+    """
+    Replaces the shared result cache, e.g. configure(ttls={'GLIMS/2016': 86400}, path='/var/cache/sql2gee/results')
+    """
+    global _results
+    _results = ResultCache(maxsize=maxsize, maxbytes=maxbytes, ttl=ttl, ttls=ttls, path=path)
+    return _results
@@ -1,15 +1,295 @@
+import asyncio
+import copy
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cached_property import cached_property
+
+from .backend import default_backend
+from .collection import MAX_WORKERS, PAGE_SIZE
 from .gee_factory import GeeFactory
+from .results import default_result_cache
+from .stats import InstrumentedBackend, QueryStats, finished, record_cache
+from .utils.jsonSql import JsonSql
+from .utils.parallel import parallel_map
+from .utils.singleFlight import SingleFlight
+
+# Identical queries running concurrently in this process share one execution
+_in_flight = SingleFlight()
+
+# Queries the async API runs at the same time; the rest wait, without blocking the event loop
+ASYNC_WORKERS = 32
+_async_executor = None
+
+
+def async_executor():
+    """Thread pool the async API runs the blocking Earth Engine calls on"""
+    global _async_executor
+    if _async_executor is None:
+        _async_executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix='sql2gee')
+    return _async_executor
+
+
+def set_async_workers(max_workers):
+    """Bounds the number of queries the async API runs concurrently"""
+    global _async_executor, ASYNC_WORKERS
+    previous, ASYNC_WORKERS, _async_executor = _async_executor, max_workers, None
+    if previous is not None:
+        previous.shutdown(wait=False)
+    return async_executor()
+
+
+# Queries of a batch evaluated concurrently
+BATCH_WORKERS = 8
+
+
+class BatchResult(object):
+    """
+    Outcome of SQL2GEE.batch(): `results[i]` and `errors[i]` belong to the i-th query (one of them is None), `queries`
+    holds the SQL2GEE objects with their own stats and `stats` the batch totals.
+    """
+
+    def __init__(self, queries, results, errors, stats):
+        self.queries = queries
+        self.results = results
+        self.errors = errors
+        self.stats = stats
+
+    @property
+    def ok(self):
+        return all(error is None for error in self.errors)
+
+    def __iter__(self):
+        return iter(zip(self.results, self.errors))
+
+    def __len__(self):
+        return len(self.results)
 
 
 class SQL2GEE(object):
     """docstring for SQL2GEE"""
 
-    def __init__(self, sqlscheme, geojson=None, flags=None):
-        self.flags = flags  # <-- Will be used in a later version of the code
-        self.factory = GeeFactory(sqlscheme, geojson, flags)
-        self._asset_id = self.factory._asset_id
-        self.type = self.factory.type
-        self.metadata = self.factory.metadata
+    def __init__(self, sqlscheme, geojson=None, flags=None, backend=None, results=None):
+        if isinstance(sqlscheme, str):
+            sqlscheme = JsonSql(sqlscheme).to_json()
+        # Execution options, e.g. {'tiles': 4} for tiled Image reductions, {'stats': False}, {'measure_bytes': True},
+        # {'validate': True} to check the asset and columns on construction
+        self.flags = flags
+        self.geojson = geojson
+        self.json = sqlscheme
+        attributes = sqlscheme['data']['attributes']
+        # serialized before planning, which rewrites parts of the tree into ee objects
+        self._canonical = json.dumps(attributes['jsonSql'], sort_keys=True, default=str)
+        self._asset_id = attributes['jsonSql']['from'].strip("'").strip('"')
+        self.results = results if results is not None else default_result_cache()
+        self.stats = QueryStats(self._asset_id, attributes['query'], (flags or {}).get('measure_bytes', False))
+        self._backend = backend or default_backend()
+        if (flags or {}).get('stats', True):
+            self._backend = InstrumentedBackend(self._backend, self.stats)
+        self._finished = False
+        if (flags or {}).get('validate', False):
+            self.validate()
+
+    def validate(self):
+        """
+        Fetches the metadata and plans the query now, raising for a missing asset or an unknown column or band that
+        would otherwise only be reported by the first response() or page()
+        """
+        with self.stats.stage('plan'):
+            self.factory._select
+            self.factory._filter
+        return self
+
+    @cached_property
+    def factory(self):
+        """Fetched on first use so the async API can do it off the event loop"""
+        with self.stats.stage('metadata'):
+            factory = GeeFactory(self.json, self.geojson, self.flags, backend=self._backend)
+            self.stats.type = factory.type
+        return factory
+
+    @property
+    def type(self):
+        return self.factory.type
+
+    @property
+    def metadata(self):
+        return self.factory.metadata
+
+    def _start(self):
+        """Every execution gets its own stats; the first one also holds the metadata lookup"""
+        if self._finished:
+            stats = self.stats
+            self.stats = QueryStats(stats.asset_id, stats.sql, stats.measure_bytes)
+            self.stats.type = stats.type
+            if isinstance(self._backend, InstrumentedBackend):
+                self._backend.stats = self.stats
+        self._finished = True
+
+    def _query(self):
+        """Plans and builds the executor of the query, timing both stages"""
+        with self.stats.stage('plan'):
+            self.factory._select
+            self.factory._filter
+        with self.stats.stage('build'):
+            return self.factory._query()
+
+    def _version(self):
+        """Asset version the cached results are keyed on, revalidated by the catalog once its entry expires"""
+        factory = self.factory
+        with self.stats.stage('metadata'):
+            return factory.catalog.version(self._asset_id, self._backend)
+
+    def _key(self, call, version):
+        return self.results.key(self._asset_id, self._canonical, self.factory.geojson, self.flags, version, call)
+
+    def _execute(self, function, call):
+        """
+        Runs function(executor), answering from and filling the result cache. Concurrent identical queries are
+        coalesced into one execution whose result they all receive.
+        """
+        self._start()
+        cache = (self.flags or {}).get('cache', True)
+        # metadata is resolved before the cache stage, so the stages do not nest
+        version = self._version()
+        with self.stats.stage('cache'):
+            key = self._key(call, version)
+            result = self.results.get(key) if cache else None
+        if cache:
+            record_cache(self._backend, 'result', result is not None)
+        if result is None:
+            def run():
+                query = self._query()
+                with self.stats.stage('execute'):
+                    response = function(query)
+                if cache:
+                    self.results.set(key, response, self._asset_id)
+                return response
+
+            result, shared = _in_flight.do(key, run)
+            record_cache(self._backend, 'in_flight', shared)
+            if shared:
+                result = copy.deepcopy(result)
+        finished(self.stats)
+        return result
+
+    def _stream(self, function):
+        """Like _execute for generators: the execute stage covers the time spent producing items, not consuming them"""
+        self._start()
+        query = self._query()
+        iterator = iter(function(query))
+        try:
+            while True:
+                with self.stats.stage('execute'):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                yield item
+        finally:
+            # published on exhaustion or when the consumer stops early; errors were already published by stage()
+            if self.stats.error is None:
+                finished(self.stats)
 
     def response(self):
-        return self.factory.response()
+        return self._execute(lambda query: query.response(), ['response'])
+
+    def iter_response(self, page_size=PAGE_SIZE, max_workers=1):
+        """
+        Generator over the result rows. Pages are fetched lazily and alias mapped one at a time, so peak memory is
+        bounded by page_size (times max_workers if pages are prefetched concurrently) rather than by the result size.
+        """
+        return self._stream(lambda query: query.iter_response(page_size, max_workers))
+
+    def page(self, page_size=PAGE_SIZE, page_token=None):
+        """
+        Returns one page of the result: {'rows': [...], 'next_page_token': token}.
+        Pass the token back to get the following page; it is None after the last one.
+        """
+        return self._execute(lambda query: query.page(page_size, page_token), ['page', page_size, page_token])
+
+    def pages(self, page_size=PAGE_SIZE, page_token=None, max_workers=MAX_WORKERS):
+        """Iterates over every page of the result, fetching up to max_workers pages concurrently"""
+        return self._stream(lambda query: query.pages(page_size, page_token, max_workers))
+
+    async def _run_async(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(async_executor(), function, *args)
+
+    async def aresponse(self):
+        """
+        Async variant of response(): the metadata lookup, planning and Earth Engine evaluation run on a bounded thread
+        pool (see set_async_workers) so the event loop is never blocked. Returns the same rows as response().
+        """
+        return await self._run_async(self.response)
+
+    async def apage(self, page_size=PAGE_SIZE, page_token=None):
+        """Async variant of page()"""
+        return await self._run_async(self.page, page_size, page_token)
+
+    @staticmethod
+    def prepare(sql, geojson=None, flags=None, backend=None, results=None):
+        """
+        Parses and plans a query with $parameters in its WHERE clause once, for many executions:
+        SQL2GEE.prepare("select * from 'TIGER/2018/States' where ALAND > $area").response(area=1e11)
+        """
+        from .prepared import PreparedQuery
+
+        return PreparedQuery(sql, geojson, flags, backend, results)
+
+    @staticmethod
+    def batch(queries, max_workers=BATCH_WORKERS, geojson=None, flags=None, backend=None, results=None):
+        """
+        Runs many queries concurrently. Every item is a SQL string, a parsed jsonSql scheme, or a dict with 'sql' plus
+        optional 'geojson' and 'flags' overriding the batch ones. The metadata of every distinct asset is fetched once
+        for the whole batch, then at most max_workers queries are evaluated at a time. A failing query does not stop
+        the others: the BatchResult holds either its rows or its error, in input order.
+        """
+        start = time.perf_counter()
+        items = [query if isinstance(query, dict) and 'sql' in query else {'sql': query} for query in queries]
+        built = [None] * len(items)
+        rows = [None] * len(items)
+        errors = [None] * len(items)
+        for i, item in enumerate(items):
+            try:
+                built[i] = SQL2GEE(item['sql'], item.get('geojson', geojson), item.get('flags', flags), backend,
+                                   results)
+            except Exception as error:
+                errors[i] = error
+
+        # one metadata lookup per asset, after which every query of that asset reads the catalog
+        assets = {}
+        for i, query in enumerate(built):
+            if query is not None:
+                assets.setdefault(query._asset_id, []).append(i)
+
+        def metadata(indexes):
+            try:
+                built[indexes[0]].factory
+            except Exception:
+                pass
+
+        parallel_map(metadata, assets.values(), max_workers)
+        metadata_seconds = time.perf_counter() - start
+
+        def run(i):
+            if built[i] is None:
+                return
+            try:
+                rows[i] = built[i].response()
+            except Exception as error:
+                errors[i] = error
+
+        parallel_map(run, range(len(items)), max_workers)
+
+        stats = [query.stats for query in built if query is not None]
+        return BatchResult(built, rows, errors, {
+            'queries': len(items),
+            'errors': sum(error is not None for error in errors),
+            'assets': len(assets),
+            'seconds': time.perf_counter() - start,
+            'metadata_seconds': metadata_seconds,
+            'ee_calls': sum(query_stats.ee_calls for query_stats in stats),
+            'ee_seconds': sum(query_stats.ee_seconds for query_stats in stats),
+            'cache_hits': sum(sum(query_stats.cache_hits.values()) for query_stats in stats)
+        })
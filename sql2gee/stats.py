@@ -0,0 +1,279 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .backend import EarthEngineBackend
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+class QueryStats(object):
+    """
+    Instrumentation of one SQL2GEE query: wall time per stage (metadata, plan, build, execute), Earth Engine calls,
+    and cache hits/misses. Thread safe, since pages and tiles are fetched from worker threads. Request and response
+    sizes are only measured with measure_bytes, since it serializes every request and response once more.
+    """
+
+    def __init__(self, asset_id=None, sql=None, measure_bytes=False):
+        self.asset_id = asset_id
+        self.sql = sql
+        self.type = None
+        self.measure_bytes = measure_bytes
+        self.stages = OrderedDict()
+        self.ee_calls = 0
+        self.ee_seconds = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.cache_hits = {}
+        self.cache_misses = {}
+        self.error = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block, adding it to the stage `name`. Time spent in a stage opened inside it is only counted
+        in the inner one, so stages never overlap. An error ends the query: it is recorded, and the stats are published
+        once, by the outermost stage.
+        """
+        start = time.perf_counter()
+        nested = []
+        opened = self._opened()
+        opened.append(nested)
+        try:
+            yield self
+        except Exception as error:
+            self._close(name, start, nested)
+            if self.error is None:
+                self.error = repr(error)
+            if not opened:
+                finished(self)
+            raise
+        self._close(name, start, nested)
+
+    def _opened(self):
+        """Seconds spent in the stages nested in each stage open on this thread, innermost last"""
+        if not hasattr(self._local, 'opened'):
+            self._local.opened = []
+        return self._local.opened
+
+    def _close(self, name, start, nested):
+        elapsed = time.perf_counter() - start
+        opened = self._opened()
+        opened.pop()
+        if opened:
+            opened[-1].append(elapsed)
+        self._add_stage(name, elapsed - sum(nested))
+
+    def _add_stage(self, name, elapsed):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def record_call(self, elapsed, request_bytes=0, response_bytes=0):
+        with self._lock:
+            self.ee_calls += 1
+            self.ee_seconds += elapsed
+            self.request_bytes += request_bytes
+            self.response_bytes += response_bytes
+
+    def record_cache(self, cache, hit):
+        with self._lock:
+            counts = self.cache_hits if hit else self.cache_misses
+            counts[cache] = counts.get(cache, 0) + 1
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        return {
+            'asset_id': self.asset_id,
+            'type': self.type,
+            'sql': self.sql,
+            'stages': dict(self.stages),
+            'total_seconds': self.total,
+            'ee_calls': self.ee_calls,
+            'ee_seconds': self.ee_seconds,
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'cache_hits': dict(self.cache_hits),
+            'cache_misses': dict(self.cache_misses),
+            'error': self.error
+        }
+
+    def __repr__(self):
+        return 'QueryStats({0})'.format(json.dumps(self.as_dict(), default=str))
+
+
+class InstrumentedBackend(EarthEngineBackend):
+    """Forwards every request to another backend, recording its duration and payload sizes in a QueryStats"""
+
+    def __init__(self, backend, stats):
+        self.backend = backend
+        self.stats = stats
+
+    def _call(self, function, argument, request_bytes):
+        start = time.perf_counter()
+        response = function(argument)
+        response_bytes = 0
+        if self.stats.measure_bytes:
+            response_bytes = len(json.dumps(response, separators=(',', ':'), default=str))
+        self.stats.record_call(time.perf_counter() - start, request_bytes, response_bytes)
+        return response
+
+    def get_info(self, ee_object):
+        request_bytes = len(ee_object.serialize()) if self.stats.measure_bytes else 0
+        return self._call(self.backend.get_info, ee_object, request_bytes)
+
+    def get_asset(self, asset_id):
+        return self._call(self.backend.get_asset, asset_id, len(asset_id) if self.stats.measure_bytes else 0)
+
+
+def record_cache(backend, cache, hit):
+    """Counts a cache hit/miss in the stats of the query `backend` belongs to, if it is instrumented"""
+    stats = getattr(backend, 'stats', None)
+    if stats is not None:
+        stats.record_cache(cache, hit)
+
+
+class Histogram(object):
+    """Cumulative Prometheus style histogram"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+    """
+    Process wide counters and histograms aggregated from every finished query, exported in the Prometheus text
+    format by render().
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def _inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(self._buckets)
+        self.histograms[key].observe(value)
+
+    def observe(self, stats):
+        """Adds a finished query to the metrics"""
+        labels = {'type': stats.type or 'unknown'}
+        with self._lock:
+            self._inc('sql2gee_queries_total', labels)
+            if stats.error:
+                self._inc('sql2gee_query_errors_total', labels)
+            self._inc('sql2gee_ee_calls_total', labels, stats.ee_calls)
+            self._inc('sql2gee_ee_request_bytes_total', labels, stats.request_bytes)
+            self._inc('sql2gee_ee_response_bytes_total', labels, stats.response_bytes)
+            for cache, count in stats.cache_hits.items():
+                self._inc('sql2gee_cache_hits_total', {'cache': cache}, count)
+            for cache, count in stats.cache_misses.items():
+                self._inc('sql2gee_cache_misses_total', {'cache': cache}, count)
+            for stage, seconds in stats.stages.items():
+                self._observe('sql2gee_stage_seconds', dict(labels, stage=stage), seconds)
+            self._observe('sql2gee_query_seconds', labels, stats.total)
+            self._observe('sql2gee_ee_seconds', labels, stats.ee_seconds)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted(set(name for name, _ in self.counters)):
+                lines.append('# TYPE {0} counter'.format(name))
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append('{0}{1} {2}'.format(name, _labels(labels), value))
+            for name in sorted(set(name for name, _ in self.histograms)):
+                lines.append('# TYPE {0} histogram'.format(name))
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append('{0}_bucket{1} {2}'.format(name, _labels(labels + (('le', str(bound)),)),
+                                                                cumulative))
+                    lines.append('{0}_sum{1} {2}'.format(name, _labels(labels), histogram.sum))
+                    lines.append('{0}_count{1} {2}'.format(name, _labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(key, value) for key, value in labels) + '}'
+
+
+def log_stats(stats, level=logging.INFO):
+    """Listener that emits every finished query as one structured (JSON) log record"""
+    logger.log(level, json.dumps(stats.as_dict(), default=str), extra={'sql2gee_stats': stats.as_dict()})
+
+
+_metrics = Metrics()
+_listeners = []
+
+
+def default_metrics():
+    """The metrics every finished query is added to"""
+    return _metrics
+
+
+def add_listener(callback):
+    """Calls callback(stats) with the QueryStats of every finished query"""
+    _listeners.append(callback)
+    return callback
+
+
+def remove_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+@contextmanager
+def listening(callback):
+    """Context manager form of add_listener()/remove_listener()"""
+    add_listener(callback)
+    try:
+        yield callback
+    finally:
+        remove_listener(callback)
+
+
+def finished(stats):
+    """Publishes a finished query to the metrics and the listeners; a failing listener never fails the query"""
+    _metrics.observe(stats)
+    for callback in list(_listeners):
+        try:
+            callback(stats)
+        except Exception:
+            logger.exception('sql2gee stats listener failed')
@@ -0,0 +1,119 @@
+import math
+from collections import OrderedDict
+
+
+class Aggregate(object):
+    """
+    Mergeable partial aggregate of a set of values: count, sum, sum of squares, min and max.
+    Partials computed over disjoint partitions (tiles, collection ranges, ...) merge exactly into the aggregate of
+    the whole set, from which mean, variance and standard deviation are derived.
+    """
+
+    def __init__(self, count=0, sum=0, sumsq=0, min=None, max=None):
+        self.count = count or 0
+        self.sum = sum or 0
+        self.sumsq = sumsq or 0
+        self.min = min
+        self.max = max
+
+    def merge(self, other):
+        return Aggregate(count=self.count + other.count,
+                         sum=self.sum + other.sum,
+                         sumsq=self.sumsq + other.sumsq,
+                         min=_extreme(min, self.min, other.min),
+                         max=_extreme(max, self.max, other.max))
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def variance(self, ddof=0):
+        """Population variance by default, sample variance with ddof=1"""
+        if self.count - ddof <= 0:
+            return None
+        return max(self.sumsq - self.sum * self.sum / self.count, 0) / (self.count - ddof)
+
+    def stdDev(self, ddof=0):
+        variance = self.variance(ddof)
+        return math.sqrt(variance) if variance is not None else None
+
+    def __repr__(self):
+        return 'Aggregate(count={0}, sum={1}, sumsq={2}, min={3}, max={4})'.format(self.count, self.sum, self.sumsq,
+                                                                                  self.min, self.max)
+
+
+class Moments(object):
+    """
+    Mergeable count, mean and sum of squared deviations from the mean (M2) of a set of values. Partials are merged
+    with Chan's pairwise update, which stays exact for large values with a small spread, where sum of squares minus
+    squared sum cancels out.
+    """
+
+    def __init__(self, count=0, mean=0, m2=0):
+        self.count = count or 0
+        self.mean = mean if self.count else 0
+        self.m2 = m2 if self.count else 0
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            return other
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        return Moments(count=count,
+                       mean=self.mean + delta * other.count / count,
+                       m2=self.m2 + other.m2 + delta * delta * self.count * other.count / count)
+
+    def variance(self, ddof=0):
+        """Population variance by default, sample variance with ddof=1"""
+        if self.count - ddof <= 0:
+            return None
+        return self.m2 / (self.count - ddof)
+
+    def stdDev(self, ddof=0):
+        variance = self.variance(ddof)
+        return math.sqrt(variance) if variance is not None else None
+
+    def __repr__(self):
+        return 'Moments(count={0}, mean={1}, m2={2})'.format(self.count, self.mean, self.m2)
+
+
+def merge_moments(moments):
+    merged = Moments()
+    for partial in moments:
+        merged = merged.merge(partial)
+    return merged
+
+
+def _extreme(function, a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return function(a, b)
+
+
+def merge_aggregates(aggregates):
+    merged = Aggregate()
+    for aggregate in aggregates:
+        merged = merged.merge(aggregate)
+    return merged
+
+
+def merge_histograms(histograms):
+    """Bin by bin sum of [[bin, count], ...] histograms computed with the same bins; empty partials are skipped"""
+    merged = OrderedDict()
+    for histogram in histograms:
+        for bucket, count in histogram or []:
+            merged[bucket] = merged.get(bucket, 0) + count
+    return [[bucket, count] for bucket, count in merged.items()]
+
+
+def merge_frequencies(frequencies):
+    """Key by key sum of {value: count} dictionaries, keys sorted like Earth Engine returns them"""
+    merged = {}
+    for frequency in frequencies:
+        for key, count in (frequency or {}).items():
+            merged[key] = merged.get(key, 0) + count
+    return {key: merged[key] for key in sorted(merged)}
@@ -0,0 +1,60 @@
+import math
+
+# Metres per degree at the equator, to turn a number of decimals into a simplification tolerance
+METRES_PER_DEGREE = 111320
+
+
+def round_coordinates(geometry, decimals):
+    """Rounds every coordinate of a GeoJSON geometry (or LinearRing footprint) to `decimals` places"""
+    if not isinstance(geometry, dict):
+        return geometry
+    geometry = dict(geometry)
+    if 'coordinates' in geometry:
+        geometry['coordinates'] = _round(geometry['coordinates'], decimals)
+    if 'geometries' in geometry:
+        geometry['geometries'] = [round_coordinates(part, decimals) for part in geometry['geometries']]
+    return geometry
+
+
+def _round(coordinates, decimals):
+    if isinstance(coordinates, (list, tuple)):
+        return [_round(c, decimals) for c in coordinates]
+    return round(coordinates, decimals) if isinstance(coordinates, float) else coordinates
+
+
+def max_error(decimals):
+    """Simplification tolerance (metres) below the resolution of coordinates rounded to `decimals` places"""
+    return METRES_PER_DEGREE * 10 ** -decimals / 2
+
+
+# WGS84 equatorial radius, for the area of GeoJSON geometries
+EARTH_RADIUS = 6378137
+
+
+def geojson_area(geometry):
+    """Approximate area, in square metres, of a GeoJSON geometry, Feature or FeatureCollection on the sphere"""
+    if not isinstance(geometry, dict):
+        return 0
+    if geometry.get('type') == 'FeatureCollection':
+        return sum(geojson_area(feature) for feature in geometry.get('features') or [])
+    if geometry.get('type') == 'Feature':
+        return geojson_area(geometry.get('geometry'))
+    if geometry.get('type') == 'GeometryCollection':
+        return sum(geojson_area(part) for part in geometry.get('geometries') or [])
+    if geometry.get('type') == 'Polygon':
+        return _polygon_area(geometry['coordinates'])
+    if geometry.get('type') == 'MultiPolygon':
+        return sum(_polygon_area(polygon) for polygon in geometry['coordinates'])
+    return 0
+
+
+def _polygon_area(rings):
+    area = abs(_ring_area(rings[0])) if rings else 0
+    return max(area - sum(abs(_ring_area(ring)) for ring in rings[1:]), 0)
+
+
+def _ring_area(ring):
+    total = 0
+    for (lon1, lat1), (lon2, lat2) in zip([c[:2] for c in ring], [c[:2] for c in ring[1:] + ring[:1]]):
+        total += math.radians(lon2 - lon1) * (2 + math.sin(math.radians(lat1)) + math.sin(math.radians(lat2)))
+    return total * EARTH_RADIUS * EARTH_RADIUS / 2
@@ -1,4 +1,4 @@
-from requests import get
+from .sqlParser import parse
 
 
 class JsonSql(object):
@@ -8,5 +8,12 @@ class JsonSql(object):
         self.sql = sql
 
     def to_json(self):
+        """Parses the query in process, returning the same structure as the sql2SQL conversion service"""
+        return parse(self.sql)
+
+    def to_remote_json(self):
+        """Converts the query with the remote sql2SQL service; only used by tests/fixtures/record.py"""
+        from requests import get
+
         url = 'https://api.resourcewatch.org/v1/convert/sql2SQL'
         return get(url, params={'sql': self.sql}).json()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class DiskStore(object):
+    """
+    JSON file per key under a directory. Values must be JSON serializable; writes are atomic so several processes
+    can share the same directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        """Returns (value, expires) or None"""
+        try:
+            with open(self._file(key)) as f:
+                record = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if record.get('key') != key:
+            return None
+        return record['value'], record['expires']
+
+    def set(self, key, value, expires=None):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'key': key, 'expires': expires, 'value': value}, f)
+            os.replace(tmp, self._file(key))
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+
+class LRUCache(object):
+    """
+    Thread safe in-memory LRU cache with optional expiry (seconds) and an optional on-disk tier.
+    Entries read from disk are promoted to memory; evicted entries stay on disk until they expire.
+    With `maxbytes` the memory tier is also bounded by the total size of its values, as measured by `sizeof`
+    (by default their length, e.g. of serialized JSON strings).
+    """
+
+    def __init__(self, maxsize=128, ttl=None, path=None, maxbytes=None, sizeof=len):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.disk = DiskStore(path) if path else None
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _expires(self, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                value, expires, size = self._data[key]
+                if expires is None or expires > time.time():
+                    self._data.move_to_end(key)
+                    return value
+                self._pop(key)
+
+        if self.disk:
+            record = self.disk.get(key)
+            if record is not None:
+                value, expires = record
+                if expires is None or expires > time.time():
+                    self._store(key, value, expires)
+                    return value
+                self.disk.delete(key)
+        return default
+
+    def set(self, key, value, ttl=None):
+        expires = self._expires(ttl)
+        self._store(key, value, expires)
+        if self.disk:
+            self.disk.set(key, value, expires)
+
+    def _store(self, key, value, expires):
+        size = self.sizeof(value) if self.maxbytes else 0
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes and size > self.maxbytes:
+                return
+            self._data[key] = (value, expires, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes and self.nbytes > self.maxbytes):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+        if self.disk:
+            self.disk.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+        if self.disk:
+            self.disk.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,33 @@
+import base64
+import hashlib
+import json
+
+
+def query_fingerprint(parsed):
+    """Short stable hash of a jsonSql tree, used to tie page tokens to the query that produced them"""
+    return hashlib.sha1(json.dumps(parsed, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+
+
+def encode_token(offset, fingerprint, cursor=None):
+    """Opaque resume token for the page starting at `offset`, or right after the row whose system:index is `cursor`"""
+    payload = {'offset': offset, 'query': fingerprint}
+    if cursor is not None:
+        payload['cursor'] = cursor
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token, fingerprint):
+    """Returns the (offset, cursor) stored in a page token, checking it was issued for the same query"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        offset = int(payload['offset'])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError('invalid page token: {0}'.format(token))
+    if payload.get('query') != fingerprint or offset < 0:
+        raise ValueError('page token was not issued for this query')
+    return offset, payload.get('cursor')
+
+
+def decode_token(token, fingerprint):
+    """Returns the offset stored in a page token, checking it was issued for the same query"""
+    return decode_cursor(token, fingerprint)[0]
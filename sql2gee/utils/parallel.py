@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parallel_map(function, items, max_workers=4):
+    """Calls function on every item from a thread pool and returns the results in input order"""
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(function, items))
+
+
+def fetch_chunks(fetch, offset, count, chunk_size, max_workers=4):
+    """
+    Fetches up to count rows from offset with fetch(offset, count), chunk_size rows per call. The first chunk is
+    fetched alone and the following ones max_workers at a time, stopping at the first chunk that is not full, so a
+    small result costs a single call. Rows are returned in order.
+    """
+    pending = chunks(offset, count, chunk_size)
+    rows = []
+    while pending:
+        wave, pending = pending[:max_workers if rows else 1], pending[max_workers if rows else 1:]
+        for (start, size), part in zip(wave, parallel_map(lambda chunk: fetch(*chunk), wave, max_workers)):
+            rows.extend(part)
+            if len(part) < size:
+                return rows
+    return rows
+
+
+def chunks(offset, count, chunk_size):
+    """(offset, count) of the consecutive chunks of at most chunk_size items covering count items from offset"""
+    return [(start, min(chunk_size, offset + count - start)) for start in range(offset, offset + count, chunk_size)]
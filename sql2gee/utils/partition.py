@@ -0,0 +1,131 @@
+import ee
+
+from .aggregates import Aggregate, Moments, merge_aggregates, merge_moments
+from .reduce import _group, _groupGen
+
+# Property partitions are split on
+INDEX = 'system:index'
+
+# Aggregate functions whose partials merge exactly, in the order _reducerGenerator combines them, and the name of
+# their Earth Engine output
+MERGEABLE = [('avg', 'mean'), ('mean', 'mean'), ('max', 'max'), ('min', 'min'), ('var', 'variance'),
+             ('stdev', 'stdDev'), ('count', 'count'), ('sum', 'sum')]
+
+
+def mergeable(selectFunctions):
+    """True if every aggregate function of the query can be computed over partitions and merged"""
+    names = [name for name, _ in MERGEABLE]
+    return bool(selectFunctions) and all(function['value'].lower() in names for function in selectFunctions)
+
+
+def partition_functions(selectFunctions):
+    """[(output name, column), ...] in the order reduceColumns returns the function values"""
+    functions = []
+    for name, output in MERGEABLE:
+        functions.extend((output, function['arguments'][0]['value']) for function in selectFunctions
+                         if function['value'].lower() == name)
+    return functions
+
+
+def index_boundaries(collection, count):
+    """
+    Server side list of the count - 1 system:index values splitting the collection in `count` parts of the same size
+    (empty for an empty collection). Fetched with a single small request before the partitions are reduced.
+    """
+    ids = collection.aggregate_array(INDEX).sort()
+    size = ids.size()
+    boundaries = ee.List.sequence(1, count - 1).map(
+        lambda k: ids.get(ee.Number(k).multiply(size).divide(count).floor()))
+    return ee.Algorithms.If(size.gt(0), boundaries, ee.List([]))
+
+
+def index_ranges(boundaries):
+    """[(lower, upper), ...] system:index ranges, lower included and upper excluded, None meaning unbounded"""
+    bounds = [None] + list(boundaries) + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def partitions(collection, boundaries):
+    """
+    Splits the collection in disjoint system:index ranges at `boundaries` (see index_boundaries): every feature,
+    with or without a geometry, belongs to exactly one partition.
+    """
+    parts = []
+    for lower, upper in index_ranges(boundaries):
+        part = collection
+        if lower is not None:
+            part = part.filter(ee.Filter.gte(INDEX, lower))
+        if upper is not None:
+            part = part.filter(ee.Filter.lt(INDEX, upper))
+        parts.append(part)
+    return parts
+
+
+def partial_reduce_columns(columns, groupBy=None):
+    """
+    reduceColumns arguments computing, for every column (and group), the count/sum/min/max/variance partial the
+    mergeable functions are derived from
+    """
+    reducer = ee.Reducer.count()
+    for partial in [ee.Reducer.sum(), ee.Reducer.min(), ee.Reducer.max(), ee.Reducer.variance()]:
+        reducer = reducer.combine(partial, sharedInputs=True)
+    reducer = reducer.unweighted().repeat(len(columns))
+    selectors = list(columns)
+    if groupBy:
+        reducer = _group(reducer, _groupGen(groupBy, len(selectors)))
+        selectors.extend(group['value'] for group in groupBy)
+    return {'reducer': reducer, 'selectors': selectors}
+
+
+def _aggregate(partial, i):
+    return Aggregate(count=partial['count'][i], sum=partial['sum'][i], min=partial['min'][i], max=partial['max'][i])
+
+
+def _moments(partial, i):
+    count = partial['count'][i]
+    mean = partial['sum'][i] / count if count else 0
+    return Moments(count=count, mean=mean, m2=count * (partial['variance'][i] or 0))
+
+
+def _merge_leaves(partials, columns, functions):
+    aggregates = {column: merge_aggregates(_aggregate(partial, i) for partial in partials)
+                  for i, column in enumerate(columns)}
+    moments = {column: merge_moments(_moments(partial, i) for partial in partials)
+               for i, column in enumerate(columns)}
+    values = {
+        'mean': lambda column: moments[column].mean if moments[column].count else None,
+        'max': lambda column: aggregates[column].max,
+        'min': lambda column: aggregates[column].min,
+        'variance': lambda column: moments[column].variance(),
+        'stdDev': lambda column: moments[column].stdDev(),
+        'count': lambda column: aggregates[column].count,
+        'sum': lambda column: aggregates[column].sum
+    }
+    row = {}
+    for output, column in functions:
+        row.setdefault(output, []).append(values[output](column))
+    return row
+
+
+def _group_order(value):
+    return (value is None, type(value).__name__, value if value is not None else 0)
+
+
+def merge_partials(partials, columns, functions, keys=None):
+    """
+    Merges the partial_reduce_columns outputs of every partition into the output reduceColumns gives for the whole
+    collection: {<output>: [values]} or, grouped, {'groups': [...]} nested from the last GROUP BY key to the first.
+    """
+    keys = list(reversed(keys or []))
+    return _merge(partials, columns, functions, keys)
+
+
+def _merge(partials, columns, functions, keys):
+    if not keys:
+        return _merge_leaves(partials, columns, functions)
+    key, groups = keys[0], {}
+    for partial in partials:
+        for group in partial.get('groups') or []:
+            groups.setdefault(group[key], []).append(group)
+    return {'groups': [dict({key: value}, **_merge(groups[value], columns, functions, keys[1:]))
+                       for value in sorted(groups, key=_group_order)]}
@@ -0,0 +1,100 @@
+import math
+
+import ee
+
+# Image acquisition times, which Earth Engine serves from the time index of a collection
+TIME_PROPERTIES = ['system:time_start', 'system:time_end']
+# Bounds of an interval open on one side, in milliseconds since the epoch (years 1 and 9999)
+MIN_TIME = -62135596800000
+MAX_TIME = 253402300799999
+# Date strings in WHERE comparisons, as a Joda pattern: MM is the month, mm would be minutes
+DATE_PATTERN = 'dd-MM-yyyy'
+
+# Comparison -> (inclusive lower bound, exclusive upper bound) offsets from the compared value, None if unbounded
+_BOUNDS = {
+    '>': (1, None),
+    '>=': (0, None),
+    '<': (None, 0),
+    '<=': (None, 1),
+    '=': (0, 1)
+}
+
+
+def conjuncts(node):
+    """The predicates of a WHERE tree that must all hold: its operands joined by AND, recursively"""
+    if node.get('type') == 'conditional' and node['value'].lower() == 'and':
+        return conjuncts(node['left'][0]) + conjuncts(node['right'][0])
+    return [node]
+
+
+def is_time_range(node):
+    """True for comparisons of an acquisition time with a literal, e.g. system:time_start > 1522548800000"""
+    return node.get('type') == 'operator' and node['value'] in _BOUNDS \
+        and node['left'][0]['type'] == 'literal' and node['left'][0]['value'] in TIME_PROPERTIES \
+        and node['right'][0]['type'] in ['number', 'string', 'date']
+
+
+def _millis(node):
+    if node['type'] == 'number':
+        return node['value']
+    if node['type'] == 'date':
+        return ee.Number(node['value'])
+    return ee.Date.parse(DATE_PATTERN, node['value'].strip("'")).millis()
+
+
+def _shift(value, offset):
+    """
+    The whole millisecond `offset` ms past `value`. Acquisition times are whole milliseconds, so a fractional value is
+    rounded to the side the comparison keeps: t > 1.5 is t >= 2 (floor + 1), t >= 1.5 is t >= 2 (ceil), t < 1.5 is
+    t < 2 (ceil) and t <= 1.5 is t < 2 (floor + 1)
+    """
+    if isinstance(value, int):
+        return value + offset
+    if isinstance(value, float):
+        return (math.floor(value) if offset > 0 else math.ceil(value)) + offset
+    value = ee.Number(value)
+    return (value.floor() if offset > 0 else value.ceil()).add(offset)
+
+
+def _tightest(values, function):
+    """max/min of the bounds; on the client when they are all numbers, else in the request"""
+    if all(isinstance(value, (int, float)) for value in values):
+        return function(values)
+    merged = ee.Number(values[0])
+    for value in values[1:]:
+        merged = merged.max(value) if function is max else merged.min(value)
+    return merged
+
+
+def time_intervals(nodes):
+    """
+    Merges the time comparisons of `nodes` into one [start, end) interval per property: {property: [start, end]},
+    with None for an unbounded side
+    """
+    bounds = {}
+    for node in nodes:
+        value = _millis(node['right'][0])
+        lower, upper = _BOUNDS[node['value']]
+        lowers, uppers = bounds.setdefault(node['left'][0]['value'], ([], []))
+        if lower is not None:
+            lowers.append(_shift(value, lower))
+        if upper is not None:
+            uppers.append(_shift(value, upper))
+    return {prop: [_tightest(lowers, max) if lowers else None, _tightest(uppers, min) if uppers else None]
+            for prop, (lowers, uppers) in bounds.items()}
+
+
+def time_filters(intervals):
+    """
+    Filters of the intervals: ee.Filter.date on system:time_start, the filter filterDate() builds and the time index
+    serves, and a single range filter on system:time_end
+    """
+    filters = []
+    for prop, (start, end) in intervals.items():
+        start = MIN_TIME if start is None else start
+        end = MAX_TIME if end is None else end
+        if prop == 'system:time_start':
+            filters.append(ee.Filter.date(ee.Date(start), ee.Date(end)))
+        else:
+            filters.append(ee.Filter.rangeContains(prop, start, _shift(end, -1)))
+    return filters
@@ -47,21 +47,26 @@ def _reduceImage(selectFunctions=None):
         return None
 
 
-def _reduceRegion(selectFunctions=None, geometry=None, scale=90):
+def _reduceRegion(selectFunctions=None, geometry=None, scale=90, plan=None):
     """
-    Description here
+    Description here; `plan` (a ReductionPlan) overrides the default scale, tileScale and maxPixels
     """
     reducers, selectors = _reducerGenerator(selectFunctions, None, 'image')
-    if reducers and geometry:
-        return {
+    if reducers:
+        arguments = {
             'reducer': reducers,
-            'geometry': geometry,
             'scale': scale,
             'bestEffort': True,
             'maxPixels': 9e8,
             'tileScale': 16
 
         }
+        if plan is not None:
+            arguments.update(plan.arguments())
+        # without a geometry every image is reduced over its own footprint
+        if geometry is not None:
+            arguments['geometry'] = geometry
+        return arguments
     else:
         return None
 
@@ -143,7 +148,19 @@ def _reducerGenerator(selectFunctions, groupBy=None, reducerFor='column'):
     return reducers, selectors
 
 
-def _reducers(selectFunctions, groupBy=None, geometry=None):
+def _withRegion(reducers, geometry=None, plan=None):
+    """_reducers built without geometry and plan, with the reduceRegion arguments of `geometry` and `plan`"""
+    if not reducers['reduceRegion']:
+        return reducers
+    region = dict(reducers['reduceRegion'])
+    if plan is not None:
+        region.update(plan.arguments())
+    if geometry is not None:
+        region['geometry'] = geometry
+    return dict(reducers, reduceRegion=region)
+
+
+def _reducers(selectFunctions, groupBy=None, geometry=None, plan=None):
     functions = dict(selectFunctions)
     if len(functions['columns']) == 0 and len(functions['bands']) > 0 and groupBy != None:
         functions['columns'] = [{'type': 'function',
@@ -153,4 +170,4 @@ def _reducers(selectFunctions, groupBy=None, geometry=None):
 
     return {'reduceColumns': _reduceColumns(functions['columns'], groupBy),
             'reduceImage': _reduceImage(functions['bands']),
-            'reduceRegion': _reduceRegion(functions['bands'], geometry)}  ## result output
+            'reduceRegion': _reduceRegion(functions['bands'], geometry, plan=plan)}  ## result output
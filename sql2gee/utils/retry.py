@@ -0,0 +1,27 @@
+import time
+
+import ee
+
+# Earth Engine errors that may not happen again: overloaded servers and rate limits. Timeouts and memory errors are
+# not retried as they are: the same request runs out again, it needs smaller tiles or a coarser scale (utils.scale)
+TRANSIENT_ERRORS = ['too many concurrent', 'too many requests', 'rate limit', 'quota exceeded', 'internal error',
+                    'service unavailable']
+
+
+def is_transient(error):
+    """True for the Earth Engine errors worth retrying"""
+    return isinstance(error, ee.EEException) and any(text in str(error).lower() for text in TRANSIENT_ERRORS)
+
+
+def retry(function, attempts=3, backoff=1.0, retriable=is_transient):
+    """
+    Calls function until it succeeds, at most `attempts` times, waiting backoff, 2 * backoff, ... seconds between
+    attempts. Errors that are not retriable, and the error of the last attempt, are raised.
+    """
+    for attempt in range(attempts):
+        try:
+            return function()
+        except Exception as error:
+            if attempt + 1 >= attempts or not retriable(error):
+                raise
+            time.sleep(backoff * 2 ** attempt)
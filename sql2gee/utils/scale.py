@@ -0,0 +1,124 @@
+import math
+
+import ee
+
+from .geometry import METRES_PER_DEGREE
+
+# Most pixels a region reduction is planned to read: past it the scale is coarsened
+PIXEL_BUDGET = 1e9
+# tileScale values tried in order, from the fastest to the one needing the least memory per tile
+TILE_SCALES = [1, 4, 16]
+# Pixels read at which a reduction starts on the next tileScale
+TILE_PIXELS = [1e7, 1e8]
+# Times the scale is doubled after every tileScale failed
+MAX_COARSENING = 3
+# Earth Engine errors a smaller tile or a coarser scale can avoid
+RESOURCE_ERRORS = ['memory limit exceeded', 'out of memory', 'timed out', 'too many pixels',
+                   'computed value is too large']
+
+
+def band_scale(band):
+    """Native pixel size of a band in metres, from getAsset() or getInfo() band metadata; None if unknown"""
+    grid = band.get('grid') or {}
+    if 'affineTransform' in grid:
+        size, crs = grid['affineTransform'].get('scaleX'), grid.get('crsCode')
+    elif band.get('crs_transform'):
+        size, crs = band['crs_transform'][0], band.get('crs')
+    else:
+        return None
+    if not size:
+        return None
+    return abs(size) * (METRES_PER_DEGREE if crs == 'EPSG:4326' else 1)
+
+
+def band_pixels(band):
+    """Pixels of a band, from its metadata dimensions; None if unknown"""
+    dimensions = (band.get('grid') or {}).get('dimensions') or band.get('dimensions')
+    if isinstance(dimensions, dict):
+        dimensions = [dimensions.get('width'), dimensions.get('height')]
+    if not dimensions or not all(dimensions):
+        return None
+    return dimensions[0] * dimensions[1]
+
+
+class ReductionPlan(object):
+    """
+    scale, tileScale and maxPixels of a region reduction. A scale of None leaves it to Earth Engine (the default
+    projection of the image); as the pixels read are then unknown, the tileScale defaults to the largest one.
+    """
+
+    def __init__(self, scale=None, tile_scale=None, max_pixels=PIXEL_BUDGET, coarsening=0):
+        self.scale = scale
+        if tile_scale is None:
+            tile_scale = TILE_SCALES[0] if scale is not None else TILE_SCALES[-1]
+        self.tile_scale = tile_scale
+        self.max_pixels = max_pixels
+        self.coarsening = coarsening
+
+    def arguments(self):
+        arguments = {'tileScale': self.tile_scale, 'maxPixels': self.max_pixels}
+        if self.scale is not None:
+            arguments['scale'] = self.scale
+        return arguments
+
+    def escalate(self):
+        """The plan to retry with after a resource error: smaller tiles first, then a coarser scale; None if spent"""
+        larger = [tile_scale for tile_scale in TILE_SCALES if tile_scale > self.tile_scale]
+        if larger:
+            return ReductionPlan(self.scale, larger[0], self.max_pixels, self.coarsening)
+        if self.scale is not None and self.coarsening < MAX_COARSENING:
+            scale = self.scale.multiply(2) if isinstance(self.scale, ee.ComputedObject) else self.scale * 2
+            return ReductionPlan(scale, self.tile_scale, self.max_pixels, self.coarsening + 1)
+        return None
+
+    def __repr__(self):
+        return 'ReductionPlan(scale={0}, tile_scale={1}, max_pixels={2})'.format(self.scale, self.tile_scale,
+                                                                                 self.max_pixels)
+
+
+def plan_reduction(bands, area=None, budget=PIXEL_BUDGET, images=1):
+    """
+    Plans a reduction of `bands` (metadata dictionaries) of `images` images over `area` square metres, or over the
+    whole bands if the area is None: the finest native scale of the bands while the pixels read fit in the budget, a
+    coarser one past it, and a tileScale growing with the pixels read.
+    `images` may be an ee.Number counted by Earth Engine: the scale is then computed in the reduction request itself,
+    and the tileScale is planned from the pixels of a single image.
+    """
+    scales = [scale for scale in map(band_scale, bands) if scale]
+    if not scales:
+        return ReductionPlan(max_pixels=budget)
+    scale = min(scales)
+    if area is not None:
+        pixels = area / (scale * scale)
+    else:
+        pixels = max([pixels for pixels in map(band_pixels, bands) if pixels] or [0])
+    if isinstance(images, ee.ComputedObject):
+        tile_scale = TILE_SCALES[sum(min(pixels, budget) >= threshold for threshold in TILE_PIXELS)]
+        coarsening = ee.Number(pixels).multiply(images).divide(budget).sqrt().max(1)
+        return ReductionPlan(coarsening.multiply(scale), tile_scale, budget)
+    pixels *= images
+    if pixels > budget:
+        scale *= math.sqrt(pixels / budget)
+        pixels = budget
+    tile_scale = TILE_SCALES[sum(pixels >= threshold for threshold in TILE_PIXELS)]
+    return ReductionPlan(scale, tile_scale, budget)
+
+
+def is_resource_error(error):
+    """True for the errors a reduction may not hit with smaller tiles or a coarser scale"""
+    return any(text in str(error).lower() for text in RESOURCE_ERRORS)
+
+
+def reduce_adaptively(backend, build, plan):
+    """
+    Evaluates build(plan), escalating the plan (see ReductionPlan.escalate) and retrying while Earth Engine runs out
+    of memory or time
+    """
+    while True:
+        try:
+            return backend.get_info(build(plan))
+        except Exception as error:
+            escalated = plan.escalate() if is_resource_error(error) else None
+            if escalated is None:
+                raise
+            plan = escalated
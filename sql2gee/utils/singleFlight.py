@@ -0,0 +1,49 @@
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the function, the ones arriving while it is
+    in flight wait for it and get the same result (or exception) instead of running it again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Returns (result, shared), shared being True for the callers that waited on someone else's call"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        # the outcome is published before the key is released, so a caller joining in between gets it too
+        try:
+            call.result = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            call.done.set()
+            with self._lock:
+                del self._calls[key]
+        return call.result, False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,308 @@
+import re
+
+_TOKENS = [
+    ('ws', r'\s+'),
+    ('string', r"'(?:[^']|'')*'"),
+    ('qident', r'"(?:[^"]|"")*"'),
+    ('number', r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w:])'),
+    ('ident', r'[A-Za-z_][\w:./-]*'),
+    ('param', r'\$[A-Za-z_]\w*'),
+    ('op', r'<=|>=|<>|!=|=|<|>'),
+    ('punct', r'[(),*;]'),
+]
+_TOKEN_RE = re.compile('|'.join('(?P<{0}>{1})'.format(name, pattern) for name, pattern in _TOKENS))
+_TABLE_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|[^\s,;()]+""")
+
+_KEYWORDS = {'select', 'from', 'where', 'group', 'order', 'by', 'limit', 'offset', 'and', 'or', 'as', 'asc',
+             'desc', 'like', 'not', 'between', 'in', 'is', 'null'}
+
+
+class SqlParseError(ValueError):
+    """Raised when a query cannot be parsed into jsonSql"""
+
+
+class Token(object):
+    """docstring for Token"""
+
+    def __init__(self, kind, value, pos):
+        self.kind = kind
+        self.value = value
+        self.pos = pos
+
+    @property
+    def keyword(self):
+        if self.kind == 'ident' and self.value.lower() in _KEYWORDS:
+            return self.value.lower()
+        return None
+
+    def __repr__(self):
+        return 'Token({0}, {1!r}, {2})'.format(self.kind, self.value, self.pos)
+
+
+class SqlParser(object):
+    """
+    In-process recursive descent parser for the SQL subset supported by sql2gee.
+    It emits the same jsonSql tree the sql2SQL conversion service returns:
+    {'select': [...], 'from': ..., 'where': [...], 'group': [...], 'orderBy': [...], 'limit': n, 'offset': n}
+    WHERE predicates are comparisons, [NOT] LIKE, [NOT] BETWEEN a AND b, [NOT] IN (...) and IS [NOT] NULL, all as
+    operator nodes with every compared value in 'right' (a single {'type': 'null'} one for IS NULL).
+    """
+
+    def __init__(self, sql):
+        self.sql = sql
+        self._pos = 0
+        self._token = None
+        self._advance()
+
+    def _error(self, message):
+        return SqlParseError('{0} at position {1}: {2}'.format(message, self._token.pos if self._token else
+                                                               len(self.sql), self.sql))
+
+    def _advance(self):
+        """Moves to the next non blank token; self._token is None at the end of the query"""
+        while self._pos < len(self.sql):
+            match = _TOKEN_RE.match(self.sql, self._pos)
+            if not match:
+                self._token = None
+                raise SqlParseError('unexpected character {0!r} at position {1}: {2}'.format(
+                    self.sql[self._pos], self._pos, self.sql))
+            self._pos = match.end()
+            if match.lastgroup != 'ws':
+                self._token = Token(match.lastgroup, match.group(), match.start())
+                return
+        self._token = None
+
+    def _peek_keyword(self, *keywords):
+        return self._token is not None and self._token.keyword in keywords
+
+    def _accept_keyword(self, keyword):
+        if self._peek_keyword(keyword):
+            self._advance()
+            return True
+        return False
+
+    def _expect_keyword(self, keyword):
+        if not self._accept_keyword(keyword):
+            raise self._error('expected {0}'.format(keyword.upper()))
+
+    def _accept_punct(self, value):
+        if self._token is not None and self._token.kind == 'punct' and self._token.value == value:
+            self._advance()
+            return True
+        return False
+
+    def _expect_punct(self, value):
+        if not self._accept_punct(value):
+            raise self._error("expected '{0}'".format(value))
+
+    def parse(self):
+        """Returns the jsonSql dictionary for the query"""
+        result = {}
+        self._expect_keyword('select')
+        result['select'] = self._select_list()
+        self._expect_keyword('from')
+        result['from'] = self._table()
+
+        if self._accept_keyword('where'):
+            result['where'] = [self._or_expression()]
+        if self._accept_keyword('group'):
+            self._expect_keyword('by')
+            result['group'] = self._group_list()
+        if self._accept_keyword('order'):
+            self._expect_keyword('by')
+            result['orderBy'] = self._order_list()
+        if self._accept_keyword('limit'):
+            result['limit'] = self._integer('LIMIT')
+        if self._accept_keyword('offset'):
+            result['offset'] = self._integer('OFFSET')
+
+        self._accept_punct(';')
+        if self._token is not None:
+            raise self._error('unexpected token {0!r}'.format(self._token.value))
+        return result
+
+    def _integer(self, clause):
+        token = self._token
+        if token is None or token.kind != 'number' or not re.match(r'^\d+$', token.value):
+            raise self._error('{0} expects a positive integer'.format(clause))
+        self._advance()
+        return int(token.value)
+
+    def _table(self):
+        """
+        Asset ids are paths like CGIAR/SRTM90_V4 or ft:<id>, so they are matched on the raw text instead of tokens.
+        Quotes are kept, GeeFactory strips them.
+        """
+        if self._token is None:
+            raise self._error('expected a table name')
+        match = _TABLE_RE.match(self.sql, self._token.pos)
+        self._pos = match.end()
+        self._advance()
+        return match.group()
+
+    def _select_list(self):
+        elements = [self._select_element()]
+        while self._accept_punct(','):
+            elements.append(self._select_element())
+        return elements
+
+    def _select_element(self):
+        if self._accept_punct('*'):
+            return {'value': '*', 'alias': None, 'type': 'wildcard'}
+        element = self._value()
+        node = {'value': element['value'], 'alias': self._alias(), 'type': element['type']}
+        if element['type'] == 'function':
+            node['arguments'] = element['arguments']
+        return node
+
+    def _alias(self):
+        if self._accept_keyword('as'):
+            if self._token is None or self._token.kind not in ['ident', 'qident', 'string']:
+                raise self._error('expected an alias')
+            return self._name()
+        if self._token is not None and self._token.kind in ['ident', 'qident'] and not self._token.keyword:
+            return self._name()
+        return None
+
+    def _name(self):
+        token = self._token
+        self._advance()
+        if token.kind == 'qident':
+            return token.value[1:-1].replace('""', '"')
+        if token.kind == 'string':
+            return token.value[1:-1].replace("''", "'")
+        return token.value
+
+    def _value(self):
+        """A column, a literal or a function call"""
+        token = self._token
+        if token is None:
+            raise self._error('unexpected end of query')
+        if token.kind == 'string':
+            self._advance()
+            return {'value': token.value, 'type': 'string'}
+        if token.kind == 'number':
+            self._advance()
+            return {'value': self._number(token.value), 'type': 'number'}
+        if token.kind == 'punct' and token.value == '*':
+            self._advance()
+            return {'value': '*', 'type': 'wildcard'}
+        if token.kind == 'param':
+            # placeholder of a prepared query, e.g. $start; bound to a literal before execution
+            self._advance()
+            return {'value': token.value[1:], 'type': 'parameter'}
+        if token.kind in ['ident', 'qident'] and not token.keyword:
+            name = self._name()
+            if self._accept_punct('('):
+                return {'value': name, 'alias': None, 'type': 'function', 'arguments': self._arguments()}
+            return {'value': name, 'type': 'literal'}
+        raise self._error('unexpected token {0!r}'.format(token.value))
+
+    def _number(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+    def _arguments(self):
+        arguments = []
+        if self._accept_punct(')'):
+            return arguments
+        arguments.append(self._value())
+        while self._accept_punct(','):
+            arguments.append(self._value())
+        self._expect_punct(')')
+        return arguments
+
+    def _or_expression(self):
+        node = self._and_expression()
+        while self._accept_keyword('or'):
+            node = {'type': 'conditional', 'value': 'or', 'left': [node], 'right': [self._and_expression()]}
+        return node
+
+    def _and_expression(self):
+        node = self._predicate()
+        while self._accept_keyword('and'):
+            node = {'type': 'conditional', 'value': 'and', 'left': [node], 'right': [self._predicate()]}
+        return node
+
+    def _predicate(self):
+        """Brackets only group, they are not kept in the tree"""
+        if self._accept_punct('('):
+            node = self._or_expression()
+            self._expect_punct(')')
+            return node
+
+        left = self._value()
+        if self._token is not None and self._token.kind == 'op':
+            operator = self._token.value
+            self._advance()
+            return {'type': 'operator', 'value': operator, 'left': [left], 'right': [self._value()]}
+        if self._accept_keyword('is'):
+            operator = 'is not' if self._accept_keyword('not') else 'is'
+            self._expect_keyword('null')
+            return {'type': 'operator', 'value': operator, 'left': [left], 'right': [{'value': None, 'type': 'null'}]}
+
+        negated = self._accept_keyword('not')
+        if self._accept_keyword('like'):
+            operator, right = 'like', [self._value()]
+        elif self._accept_keyword('between'):
+            low = self._value()
+            self._expect_keyword('and')
+            operator, right = 'between', [low, self._value()]
+        elif self._accept_keyword('in'):
+            self._expect_punct('(')
+            operator, right = 'in', self._arguments()
+            if not right:
+                raise self._error('IN expects at least one value')
+        elif negated:
+            raise self._error('expected LIKE, BETWEEN or IN after NOT')
+        else:
+            if left['type'] == 'function':
+                return left
+            raise self._error('expected a comparison operator')
+
+        return {'type': 'operator', 'value': 'not ' + operator if negated else operator, 'left': [left], 'right': right}
+
+    def _group_list(self):
+        groups = [self._value()]
+        while self._accept_punct(','):
+            groups.append(self._value())
+        return groups
+
+    def _order_list(self):
+        orders = [self._order_element()]
+        while self._accept_punct(','):
+            orders.append(self._order_element())
+        return orders
+
+    def _order_element(self):
+        element = self._value()
+        direction = 'asc'
+        if self._accept_keyword('desc'):
+            direction = 'desc'
+        else:
+            self._accept_keyword('asc')
+        return {'value': element['value'], 'alias': None, 'type': element['type'], 'direction': direction}
+
+
+def unquote(value):
+    """The text of a quoted string literal, '' escapes included: 'O''Brien' -> O'Brien"""
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    return value
+
+
+def parse(sql):
+    """Returns the sql2SQL envelope ({'data': {'attributes': {'query', 'jsonSql'}}}) for a query"""
+    return {
+        'data': {
+            'type': 'result',
+            'id': 'undefined',
+            'attributes': {
+                'query': sql,
+                'jsonSql': SqlParser(sql).parse()
+            },
+            'relationships': {}
+        }
+    }
@@ -0,0 +1,46 @@
+import ee
+
+from .parallel import parallel_map
+
+# Features sent per reduceRegions request
+ZONE_CHUNK = 500
+# Property holding the position of each feature in the input, so rows come back in input order
+ZONE_INDEX = 'sql2gee_zone'
+
+
+def zone_properties(features):
+    """Names of the properties found in any of the GeoJSON features"""
+    names = set()
+    for feature in features:
+        names.update((feature.get('properties') or {}).keys())
+    return names
+
+
+def zone_collections(features, chunk_size=ZONE_CHUNK):
+    """Splits GeoJSON features in ee.FeatureCollections of at most chunk_size, tagging each with its position"""
+    collections = []
+    for start in range(0, len(features), chunk_size):
+        chunk = [dict(feature, properties=dict(feature.get('properties') or {}, **{ZONE_INDEX: i}))
+                 for i, feature in enumerate(features[start:start + chunk_size], start)]
+        collections.append(ee.FeatureCollection(chunk))
+    return collections
+
+
+def reduce_zones(backend, image, features, reducer, chunk_size=ZONE_CHUNK, max_workers=4, **arguments):
+    """
+    Reduces the image over every feature with reduceRegions: the features are sent in chunks of chunk_size, up to
+    max_workers chunks at a time, without their geometries coming back. Outputs are named like reduceRegion ones
+    (<band> or <band>_<output>). Returns the properties of every feature plus its outputs, in input order.
+    """
+    reducer = reducer.forEachBand(image)
+
+    def reduce_chunk(collection):
+        reduced = image.reduceRegions(collection=collection, reducer=reducer, **arguments)
+        return backend.get_info(reduced.select(['.*'], None, False))['features']
+
+    rows = [None] * len(features)
+    for chunk in parallel_map(reduce_chunk, zone_collections(features, chunk_size), max_workers):
+        for feature in chunk:
+            properties = dict(feature['properties'])
+            rows[properties.pop(ZONE_INDEX)] = properties
+    return rows
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from sql2gee.backend import EarthEngineBackend, ReplayBackend
+
+
+# getAsset responses of the fake backends, by asset type
+METADATA = {
+    'TABLE': lambda asset_id: {'type': 'TABLE', 'id': asset_id},
+    'IMAGE': lambda asset_id: {'type': 'IMAGE', 'id': asset_id, 'bands': [{'id': 'elevation'}], 'properties': {}}
+}
+
+
+class Expression(object):
+    """Minimal stand-in for an ee.ComputedObject"""
+
+    def __init__(self, expression, value):
+        self.expression = expression
+        self.value = value
+
+    def serialize(self):
+        return self.expression
+
+    def getInfo(self):
+        return self.value
+
+
+class FakeBackend(EarthEngineBackend):
+    """
+    Offline backend answering getAsset after `delay` seconds with the METADATA of an asset type, or with
+    metadata(asset_id) if it is a function, and getInfo with info(ee_object), or the value of Expression stand-ins
+    without it. Every asset requested is appended to `calls`.
+    """
+
+    def __init__(self, metadata='TABLE', delay=0, info=None):
+        self.metadata = METADATA[metadata] if isinstance(metadata, str) else metadata
+        self.delay = delay
+        self.info = info
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_asset(self, asset_id):
+        with self._lock:
+            self.calls.append(asset_id)
+        if self.delay:
+            time.sleep(self.delay)
+        return self.metadata(asset_id)
+
+    def get_info(self, ee_object):
+        if self.info is None:
+            return super().get_info(ee_object)
+        return self.info(ee_object)
+
+
+@pytest.fixture(scope='session')
+def offline_ee():
+    """Initializes ee with the algorithm signatures bundled with the API, so expressions can be built and serialized"""
+    from ee import apitestcase
+
+    return ReplayBackend({'algorithms': apitestcase.GetAlgorithms()}).initialize()
+
+
+@pytest.fixture
+def expression():
+    """Builds Expression stand-ins: expression(serialized, value)"""
+    return Expression
+
+
+@pytest.fixture
+def fake_backend():
+    """Builds FakeBackends: fake_backend(), fake_backend('IMAGE'), fake_backend(get_asset, delay=0.1)"""
+    return FakeBackend
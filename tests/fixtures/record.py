@@ -0,0 +1,24 @@
+"""
+Replaces the hand written expectations of sql2SQL.json with the output of the sql2SQL service for every query it
+holds:
+
+    python -m tests.fixtures.record
+"""
+import json
+import os
+
+from sql2gee.utils.jsonSql import JsonSql
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'sql2SQL.json')
+
+
+def record():
+    with open(FIXTURES) as f:
+        fixtures = json.load(f)
+    recorded = [{'sql': fixture['sql'], 'response': JsonSql(fixture['sql']).to_remote_json()} for fixture in fixtures]
+    with open(FIXTURES, 'w') as f:
+        json.dump(recorded, f, indent=2)
+
+
+if __name__ == '__main__':
+    record()
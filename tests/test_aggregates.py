@@ -0,0 +1,31 @@
+import statistics
+
+from sql2gee.utils.aggregates import Aggregate, merge_aggregates, merge_frequencies, merge_histograms
+
+
+def _aggregate(values):
+    return Aggregate(count=len(values), sum=sum(values), sumsq=sum(v * v for v in values),
+                     min=min(values) if values else None, max=max(values) if values else None)
+
+
+def test_merged_partials_equal_whole_set_stats():
+    values = [3.0, 7.5, 1.25, 9.0, 4.0, 4.0, 12.5, 0.5]
+    merged = merge_aggregates([_aggregate(values[:3]), _aggregate([]), _aggregate(values[3:])])
+    assert merged.count == len(values)
+    assert merged.min == min(values) and merged.max == max(values)
+    assert abs(merged.mean - statistics.mean(values)) < 1e-12
+    assert abs(merged.stdDev(ddof=1) - statistics.stdev(values)) < 1e-12
+    assert abs(merged.variance() - statistics.pvariance(values)) < 1e-12
+    return
+
+
+def test_empty_aggregate_has_no_derived_stats():
+    assert Aggregate().mean is None
+    assert Aggregate(count=1, sum=2, sumsq=4).stdDev(ddof=1) is None
+    return
+
+
+def test_histograms_and_frequencies_merge_bin_by_bin():
+    assert merge_histograms([[[0, 1], [10, 2]], None, [[0, 3], [10, 0]]]) == [[0, 4], [10, 2]]
+    assert merge_frequencies([{'1': 2, 'null': 1}, {}, {'1': 1, '2': 5}]) == {'1': 3, '2': 5, 'null': 1}
+    return
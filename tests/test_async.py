@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+
+import ee
+import pytest
+
+from sql2gee import SQL2GEE
+
+
+def missing(asset_id):
+    raise ee.EEException('Asset not found: {0}'.format(asset_id))
+
+
+def test_construction_does_not_block(fake_backend):
+    backend = fake_backend()
+    q = SQL2GEE("select NAME from 'TIGER/2018/States' limit 3", backend=backend)
+    assert backend.calls == [], "Metadata was fetched on the calling thread at construction"
+    assert q.stats.sql == "select NAME from 'TIGER/2018/States' limit 3"
+    return
+
+
+def test_validate_reports_a_missing_asset_on_construction(fake_backend):
+    backend = fake_backend(missing)
+    q = SQL2GEE("select NAME from 'TIGER/2018/Missing'", backend=backend)
+    assert backend.calls == []
+    with pytest.raises(ee.EEException):
+        q.validate()
+    with pytest.raises(ee.EEException):
+        SQL2GEE("select NAME from 'TIGER/2018/Missing'", flags={'validate': True}, backend=fake_backend(missing))
+    return
+
+
+def test_aresponse_runs_off_the_event_loop(fake_backend):
+    queries = [SQL2GEE("select NAME from 'TIGER/2018/States' limit 3", backend=fake_backend()) for _ in range(4)]
+    threads = set()
+
+    def blocking_response():
+        threads.add(threading.get_ident())
+        time.sleep(0.1)
+        return [{'NAME': 'Texas'}]
+
+    for q in queries:
+        q.response = blocking_response
+
+    async def run():
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.time())
+                await asyncio.sleep(0.01)
+
+        results = await asyncio.gather(ticker(), *[q.aresponse() for q in queries])
+        return results[1:], ticks
+
+    start = time.time()
+    results, ticks = asyncio.run(run())
+    assert results == [[{'NAME': 'Texas'}]] * 4
+    assert time.time() - start < 0.35, "Queries did not run concurrently"
+    assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.09, "Event loop was blocked"
+    assert threading.get_ident() not in threads
+    return
@@ -0,0 +1,30 @@
+import time
+
+import ee
+import pytest
+
+from sql2gee.backend import RecordingBackend, ReplayBackend, ReplayError
+
+
+def test_replay_answers_recorded_requests(tmp_path, monkeypatch, expression, fake_backend):
+    monkeypatch.setattr(ee.data, 'getAlgorithms', lambda: {})
+    recorder = RecordingBackend(fake_backend())
+    assert recorder.get_info(expression('{"a": 1}', [1, 2])) == [1, 2]
+    assert recorder.get_asset('TIGER/2018/States') == {'id': 'TIGER/2018/States', 'type': 'TABLE'}
+    recorder.save(str(tmp_path / 'recordings.json'))
+
+    replay = ReplayBackend(str(tmp_path / 'recordings.json'))
+    assert replay.get_info(expression('{"a": 1}', None)) == [1, 2]
+    assert replay.get_asset('TIGER/2018/States')['type'] == 'TABLE'
+    assert [method for method, _ in replay.calls] == ['getInfo', 'getAsset']
+    with pytest.raises(ReplayError):
+        replay.get_info(expression('{"a": 2}', None))
+    return
+
+
+def test_replay_injects_latency():
+    replay = ReplayBackend({'getInfo': {}, 'getAsset': {'x': {}}}, latency=0.05)
+    start = time.time()
+    replay.get_asset('x')
+    assert time.time() - start >= 0.05
+    return
@@ -0,0 +1,26 @@
+from sql2gee import SQL2GEE
+from sql2gee.catalog import default_catalog
+from sql2gee.utils.sqlParser import SqlParseError
+
+
+def test_batch_shares_metadata_and_keeps_input_order(monkeypatch, fake_backend):
+    default_catalog().invalidate()
+
+    def response(self):
+        if 'fail' in self.stats.sql:
+            raise NameError('column/band name not valid: fail')
+        return [{'sql': self.stats.sql}]
+
+    monkeypatch.setattr(SQL2GEE, 'response', response)
+    queries = ["select NAME from 'TIGER/2018/States' where STATEFP = '{0:02d}'".format(i) for i in range(6)]
+    queries += ["select fail from 'GLIMS/2016'", 'select from', {'sql': "select area from 'GLIMS/2016'"}]
+    backend = fake_backend()
+    batch = SQL2GEE.batch(queries, max_workers=4, backend=backend)
+
+    assert sorted(backend.calls) == ['GLIMS/2016', 'TIGER/2018/States'], "Metadata was fetched more than once"
+    assert [rows[0]['sql'] for rows in batch.results[:6]] == queries[:6], "Results are not in input order"
+    assert isinstance(batch.errors[6], NameError) and isinstance(batch.errors[7], SqlParseError)
+    assert batch.results[8] == [{'sql': "select area from 'GLIMS/2016'"}] and batch.errors[8] is None
+    assert not batch.ok and len(batch) == 9
+    assert batch.stats['queries'] == 9 and batch.stats['errors'] == 2 and batch.stats['assets'] == 2
+    return
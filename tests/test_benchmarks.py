@@ -0,0 +1,35 @@
+import os
+
+from benchmarks.queries import QUERIES
+from benchmarks.run import STAGES, compare, run_query
+from sql2gee import catalog
+from sql2gee.backend import ReplayBackend
+
+RECORDINGS = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'recordings.json')
+
+
+def test_benchmark_queries_replay_offline():
+    backend = ReplayBackend(RECORDINGS).initialize()
+    for query in QUERIES:
+        catalog.default_catalog().invalidate()
+        _, calls = run_query(query, backend)
+        assert calls > 0, "{0} made no Earth Engine call".format(query['name'])
+    return
+
+
+def test_reducers_are_timed_when_first_built():
+    backend = ReplayBackend(RECORDINGS).initialize()
+    query = [query for query in QUERIES if query['name'] == 'image_collection_aggregate'][0]
+    timings, _ = run_query(query, backend)
+    assert timings['reducers'] > 1e-5, "The reducers were already built when their stage was timed"
+    return
+
+
+def test_baseline_is_scaled_to_the_machine():
+    def run(calibration, p50):
+        stages = {stage: {'p50': p50} for stage in STAGES}
+        return {'calibration': calibration, 'queries': {'q': {'stages': stages, 'ee_calls': 1, 'ee_calls_cold': 2}}}
+
+    assert compare(run(2.0, 0.002), run(1.0, 0.001), 0.25) == [], "A twice slower machine was reported as a regression"
+    assert len(compare(run(1.0, 0.002), run(1.0, 0.001), 0.25)) == len(STAGES)
+    return
@@ -0,0 +1,53 @@
+from sql2gee.catalog import MetadataCatalog
+from sql2gee.utils.lruCache import LRUCache
+
+TABLE = {'type': 'TABLE', 'name': 'projects/earthengine-public/assets/TIGER/2018/States',
+         'id': 'TIGER/2018/States', 'updateTime': '2019-06-17T17:48:10.661679Z', 'sizeBytes': '3543775'}
+
+
+def _versions(fake_backend, responses):
+    """Backend answering the successive getAsset calls with `responses`, the last one repeated"""
+    def get_asset(asset_id):
+        return dict(responses[min(len(backend.calls), len(responses)) - 1])
+
+    backend = fake_backend(get_asset)
+    return backend
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None, "Least recently used entry was not evicted"
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    return
+
+
+def test_lru_disk_tier_survives_new_instance(tmp_path):
+    LRUCache(path=str(tmp_path)).set('TIGER/2018/States', TABLE)
+    assert LRUCache(path=str(tmp_path)).get('TIGER/2018/States') == TABLE
+    return
+
+
+def test_catalog_serves_repeated_queries_from_memory(fake_backend):
+    backend = _versions(fake_backend, [TABLE])
+    catalog = MetadataCatalog(ttl=3600)
+    assert catalog.metadata('TIGER/2018/States', backend) == TABLE
+    assert catalog.metadata('TIGER/2018/States', backend) == TABLE
+    assert len(backend.calls) == 1, "Metadata was fetched more than once inside the TTL"
+    return
+
+
+def test_catalog_revalidates_on_version_change(fake_backend):
+    updated = dict(TABLE, updateTime='2021-01-01T00:00:00Z')
+    backend = _versions(fake_backend, [TABLE, TABLE, updated])
+    catalog = MetadataCatalog(ttl=0)
+    catalog.metadata('TIGER/2018/States', backend)
+    entry = catalog._cache.get('TIGER/2018/States')
+    assert catalog.metadata('TIGER/2018/States', backend) == TABLE
+    assert catalog._cache.get('TIGER/2018/States')['metadata'] is entry['metadata'], "Unchanged asset was reloaded"
+    assert catalog.metadata('TIGER/2018/States', backend) == updated
+    assert len(backend.calls) == 3
+    return
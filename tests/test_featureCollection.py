@@ -0,0 +1,73 @@
+import json
+
+from sql2gee.catalog import MetadataCatalog
+from sql2gee.gee_factory import GeeFactory
+from sql2gee.utils.jsonSql import JsonSql
+
+AOI = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'properties': {}, 'geometry': {
+    'type': 'Polygon', 'coordinates': [[[-3.8, 40.3], [-3.6, 40.3], [-3.6, 40.5], [-3.8, 40.3]]]}}]}
+COLUMNS = {'NAME': 'String', 'ALAND': 'Long', 'system:index': 'String'}
+
+
+def _calls(serialized, node, found):
+    """Every function invocation reachable from `node`, resolving the value references of the serialized graph"""
+    if isinstance(node, dict):
+        if 'valueReference' in node:
+            return _calls(serialized, serialized['values'][node['valueReference']], found)
+        if 'functionDefinitionValue' in node:
+            return _calls(serialized, serialized['values'][node['functionDefinitionValue']['body']], found)
+        if 'functionInvocationValue' in node:
+            found.append(node['functionInvocationValue'])
+        for value in node.values():
+            _calls(serialized, value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _calls(serialized, value, found)
+    return found
+
+
+def test_spatial_filter_sees_the_geometry(offline_ee, fake_backend):
+    backend = fake_backend(info=lambda ee_object: {'columns': COLUMNS})
+    sql = "select NAME from 'TIGER/2018/States' where ALAND > 1"
+    query = GeeFactory(JsonSql(sql).to_json(), AOI, catalog=MetadataCatalog(), backend=backend)._query()
+    serialized = json.loads(query._prepared.serialize())
+    calls = _calls(serialized, serialized['values'][serialized['result']], [])
+
+    def drops_geometry(call):
+        return call['functionName'] == 'Feature.select' and \
+            call['arguments'].get('retainGeometry') == {'constantValue': False}
+
+    spatial = [call for call in calls if call['functionName'] == 'Collection.filter' and
+               any(inner['functionName'] == 'Filter.intersects' for inner in _calls(serialized, call['arguments'], []))]
+    assert spatial, "The query geometry was not filtered on"
+    for call in spatial:
+        assert not any(drops_geometry(inner) for inner in _calls(serialized, call['arguments']['collection'], [])), \
+            "Geometries were dropped before the spatial filter"
+    assert any(drops_geometry(call) for call in calls), "Geometries were not dropped from the rows"
+    return
+
+
+def test_partitions_split_the_unselected_collection_by_index(offline_ee, fake_backend):
+    requests = []
+
+    def info(ee_object):
+        serialized = json.loads(ee_object.serialize())
+        names = [call['functionName'] for call in _calls(serialized, serialized['values'][serialized['result']], [])]
+        requests.append(names)
+        if 'Collection.limit' in names:
+            return {'columns': COLUMNS}
+        if 'Collection.reduceColumns' not in names:
+            return ['b', 'm']
+        return {'count': [2], 'sum': [10.0], 'min': [4.0], 'max': [6.0], 'variance': [1.0]}
+
+    sql = "select sum(ALAND), count(ALAND) from 'TIGER/2018/States' where ALAND > 1"
+    factory = GeeFactory(JsonSql(sql).to_json(), AOI, {'partitions': 3}, catalog=MetadataCatalog(),
+                         backend=fake_backend(info=info))
+    assert factory._query().response() == [{'count': [6], 'sum': [30.0]}], "Partials were not merged"
+    reductions = [names for names in requests if 'Collection.reduceColumns' in names]
+    assert len(reductions) == 3
+    assert all('Feature.select' not in names for names in reductions), "Partitions were reduced after selecting"
+    # system:index < 'b', 'b' <= system:index < 'm' (gte serializes as not lessThan), 'm' <= system:index
+    assert sorted(names.count('Filter.lessThan') for names in reductions) == [1, 1, 2]
+    assert sorted(names.count('Filter.not') for names in reductions) == [0, 1, 1]
+    return
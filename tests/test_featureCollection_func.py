@@ -121,3 +121,109 @@ def test_limit_on_tables():
     response = SQL2GEE(JsonSql(sql + str(limit)).to_json()).response()
     assert len(response) == limit, err
     return
+
+
+def test_paginated_table_query():
+    """Pages follow each other through the resume token and add up to the whole table"""
+    sql = 'select NAME from "TIGER/2018/States"'
+    q = SQL2GEE(JsonSql(sql).to_json())
+    first = q.page(page_size=20)
+    assert len(first['rows']) == 20
+    second = q.page(page_size=20, page_token=first['next_page_token'])
+    assert len(second['rows']) == 20
+    assert first['rows'][0] != second['rows'][0], "Resume token did not move to the next page"
+    pages = list(q.pages(page_size=20, max_workers=3))
+    assert [len(p['rows']) for p in pages] == [20, 20, 16]
+    assert pages[-1]['next_page_token'] is None
+    assert sum([p['rows'] for p in pages], []) == q.response()
+    return
+
+
+def test_iter_response_streams_every_row():
+    sql = 'select ALAND as land from "TIGER/2018/States" limit 30'
+    q = SQL2GEE(JsonSql(sql).to_json())
+    rows = q.iter_response(page_size=7)
+    first = next(rows)
+    assert 'land' in first['properties'] and 'ALAND' not in first['properties'], "Alias not applied"
+    assert [first] + list(rows) == q.response()
+    return
+
+
+def test_query_stats():
+    sql = 'select NAME from "TIGER/2018/States" limit 3'
+    q = SQL2GEE(JsonSql(sql).to_json(), flags={'cache': False, 'measure_bytes': True})
+    q.response()
+    assert list(q.stats.stages) == ['metadata', 'cache', 'plan', 'build', 'execute']
+    assert q.stats.ee_calls >= 1 and q.stats.response_bytes > 0, "Earth Engine calls were not instrumented"
+    return
+
+
+def test_repeated_query_is_answered_from_the_result_cache():
+    sql = "select sum(area) from 'GLIMS/2016' where anlys_time = '2016-01-01T00:00:00' group by anlys_time"
+    first = SQL2GEE(JsonSql(sql).to_json()).response()
+    q = SQL2GEE(JsonSql(sql).to_json())
+    assert q.response() == first
+    assert q.stats.cache_hits.get('result') == 1 and 'execute' not in q.stats.stages, "Result cache was not used"
+    return
+
+
+def test_aresponse_matches_response():
+    import asyncio
+    sql = 'select NAME, ALAND as land from "TIGER/2018/States" limit 5'
+    expected = SQL2GEE(JsonSql(sql).to_json(), flags={'cache': False}).response()
+
+    async def run():
+        return await asyncio.gather(*[SQL2GEE(sql, flags={'cache': False}).aresponse() for _ in range(3)])
+
+    assert asyncio.run(run()) == [expected] * 3
+    return
+
+
+def test_batch_queries():
+    sql = "select NAME from 'TIGER/2018/States' where STUSPS = '{0}'"
+    batch = SQL2GEE.batch([sql.format(state) for state in ['TX', 'CA', 'NY']] + ["select foo from 'TIGER/2018/States'"])
+    assert [rows[0]['properties']['NAME'] for rows in batch.results[:3]] == ['Texas', 'California', 'New York']
+    assert isinstance(batch.errors[3], NameError), "Per query error was not kept"
+    return
+
+
+def test_multi_key_order_by_with_limit():
+    sql = 'select NAME, REGION, ALAND from "TIGER/2018/States" order by REGION asc, ALAND desc limit 12'
+    q = SQL2GEE(JsonSql(sql).to_json(), flags={'cache': False})
+    rows = [row['properties'] for row in q.response()]
+    keys = [(row['REGION'], -row['ALAND']) for row in rows]
+    assert len(rows) == 12 and keys == sorted(keys), "Rows are not ordered by REGION then ALAND desc"
+    assert 'Collection.limit' in q.factory._query()._prepared.serialize(), "ORDER BY + LIMIT did not compile to a top-k"
+    every = SQL2GEE(JsonSql('select NAME, REGION, ALAND from "TIGER/2018/States"').to_json()).response()
+    expected = sorted(((row['properties']['REGION'], -row['properties']['ALAND']) for row in every))[:12]
+    assert keys == expected, "Ties of REGION at the limit were not decided by ALAND"
+    return
+
+
+def test_multi_key_order_by_relies_on_stable_sort():
+    sql = 'select NAME, REGION, DIVISION from "TIGER/2018/States" order by REGION desc, DIVISION asc, NAME asc'
+    rows = [row['properties'] for row in SQL2GEE(JsonSql(sql).to_json(), flags={'cache': False}).response()]
+    keys = [(row['REGION'], row['DIVISION'], row['NAME']) for row in rows]
+    expected = sorted(sorted(keys, key=lambda key: key[1:]), key=lambda key: key[0], reverse=True)
+    assert keys == expected, "Collection.sort did not keep the order of ties"
+    return
+
+
+def test_geometry_only_when_selected():
+    sql = 'select NAME from "TIGER/2018/States" limit 2'
+    assert all(row['geometry'] is None for row in SQL2GEE(JsonSql(sql).to_json()).response()), "Geometry returned"
+    sql = 'select NAME, the_geom from "TIGER/2018/States" limit 2'
+    rows = SQL2GEE(JsonSql(sql).to_json(), flags={'precision': 3}).response()
+    assert rows[0]['geometry']['type'] in ['Polygon', 'MultiPolygon'], "Selected geometry was dropped"
+    return
+
+
+def test_partitioned_reduction_matches_single_reduction():
+    sql = "select sum(ALAND), avg(AWATER), count(ALAND) from 'TIGER/2018/States' group by REGION"
+    expected = SQL2GEE(JsonSql(sql).to_json(), flags={'cache': False}).response()
+    partitioned = SQL2GEE(JsonSql(sql).to_json(), flags={'partitions': 4, 'cache': False}).response()
+    assert [row['REGION'] for row in partitioned] == [row['REGION'] for row in expected]
+    for row, whole in zip(partitioned, expected):
+        assert row['sum'] == whole['sum'] and row['count'] == whole['count']
+        assert abs(row['mean'][0] - whole['mean'][0]) < 1e-6 * whole['mean'][0]
+    return
@@ -0,0 +1,15 @@
+from sql2gee.utils.geometry import max_error, round_coordinates
+
+
+def test_round_coordinates():
+    footprint = {'type': 'LinearRing', 'coordinates': [[-124.83354858089547, 25.003807946517743], [-66.97, 49.46]]}
+    assert round_coordinates(footprint, 2) == {'type': 'LinearRing', 'coordinates': [[-124.83, 25.0], [-66.97, 49.46]]}
+    collection = {'type': 'GeometryCollection', 'geometries': [{'type': 'Point', 'coordinates': [1.23456, 7]}]}
+    assert round_coordinates(collection, 1)['geometries'][0]['coordinates'] == [1.2, 7]
+    assert round_coordinates(None, 3) is None
+    return
+
+
+def test_max_error_is_below_precision():
+    assert max_error(4) < 111320 * 1e-4
+    return
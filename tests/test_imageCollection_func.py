@@ -24,44 +24,10 @@ def test_metadata_image_collection_query():
     sql = "select * from 'IDAHO_EPSCOR/GRIDMET' limit 2"
     q = SQL2GEE(JsonSql(sql).to_json())
     response = q.response()
-    assert response == [{'status': 'permanent', 'system:asset_size': 27580337, 'system:footprint': {
-        'coordinates': [[-124.83354858089547, 25.003807946517743], [-122.08046873314143, 24.995926537448984],
-                        [-116.66640625473028, 24.963260502976674], [-110.35000001111823, 24.98231582244473],
-                        [-104.93593745133236, 24.982315818720387], [-100.42421873312358, 24.995926491821308],
-                        [-95.91249996019583, 24.982315874124307], [-90.49843745062729, 24.982315828547943],
-                        [-85.98671867951936, 24.995926496850476], [-80.57265622055839, 24.963260508093065],
-                        [-74.25624993114793, 24.982315802057173], [-66.9914877989776, 24.937365013255352],
-                        [-66.97329042095092, 49.4620585688528], [-74.25625003685488, 49.462575843249724],
-                        [-83.27968745024836, 49.46257586252526], [-90.49843747394075, 49.462575896553865],
-                        [-103.1312499346856, 49.46257587117741], [-113.9593748919571, 49.46257584884527],
-                        [-124.85170940475892, 49.4620585601637], [-124.83354858089547, 25.003807946517743]],
-        'type': 'LinearRing'}, 'system:index': '19790101', 'system:time_end': 284083200000,
-                         'system:time_start': 284018400000}, {'status': 'permanent', 'system:asset_size': 27598811,
-                                                              'system:footprint': {'coordinates': [
-                                                                  [-124.83354858089547, 25.003807946517743],
-                                                                  [-122.08046873314143, 24.995926537448984],
-                                                                  [-116.66640625473028, 24.963260502976674],
-                                                                  [-110.35000001111823, 24.98231582244473],
-                                                                  [-104.93593745133236, 24.982315818720387],
-                                                                  [-100.42421873312358, 24.995926491821308],
-                                                                  [-95.91249996019583, 24.982315874124307],
-                                                                  [-90.49843745062729, 24.982315828547943],
-                                                                  [-85.98671867951936, 24.995926496850476],
-                                                                  [-80.57265622055839, 24.963260508093065],
-                                                                  [-74.25624993114793, 24.982315802057173],
-                                                                  [-66.9914877989776, 24.937365013255352],
-                                                                  [-66.97329042095092, 49.4620585688528],
-                                                                  [-74.25625003685488, 49.462575843249724],
-                                                                  [-83.27968745024836, 49.46257586252526],
-                                                                  [-90.49843747394075, 49.462575896553865],
-                                                                  [-103.1312499346856, 49.46257587117741],
-                                                                  [-113.9593748919571, 49.46257584884527],
-                                                                  [-124.85170940475892, 49.4620585601637],
-                                                                  [-124.83354858089547, 25.003807946517743]],
-                                                                  'type': 'LinearRing'},
-                                                              'system:index': '19790102',
-                                                              'system:time_end': 284169600000,
-                                                              'system:time_start': 284104800000}]
+    assert response == [{'status': 'permanent', 'system:asset_size': 27580337, 'system:index': '19790101',
+                         'system:time_end': 284083200000, 'system:time_start': 284018400000},
+                        {'status': 'permanent', 'system:asset_size': 27598811, 'system:index': '19790102',
+                         'system:time_end': 284169600000, 'system:time_start': 284104800000}]
     return
 
 
@@ -157,52 +123,22 @@ def test_image_collection_with_greater_where_clause():
     sql = "select * from 'NCEP_RE/sea_level_pressure' where system:time_start > 1522548800000 limit 5"
     response = SQL2GEE(JsonSql(sql).to_json()).response()
     assert response == [{'system:asset_size': 14821,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_2018040106',
                          'system:time_end': 1522562400000,
                          'system:time_start': 1522562400000},
                         {'system:asset_size': 14740,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_2018040112',
                          'system:time_end': 1522584000000,
                          'system:time_start': 1522584000000},
                         {'system:asset_size': 14818,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_2018040118',
                          'system:time_end': 1522605600000,
                          'system:time_start': 1522605600000},
                         {'system:asset_size': 14715,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_2018040200',
                          'system:time_end': 1522627200000,
                          'system:time_start': 1522627200000},
                         {'system:asset_size': 14769,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_2018040206',
                          'system:time_end': 1522648800000,
                          'system:time_start': 1522648800000}]
@@ -214,52 +150,22 @@ def test_image_collection_with_geometry_where_clause():
     response = SQL2GEE(JsonSql(sql).to_json()).response()
     assert len(response) == 5
     assert response == [{'system:asset_size': 12575,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_1948010100',
                          'system:time_end': -694310400000,
                          'system:time_start': -694310400000},
                         {'system:asset_size': 12815,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_1948010106',
                          'system:time_end': -694288800000,
                          'system:time_start': -694288800000},
                         {'system:asset_size': 13149,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_1948010112',
                          'system:time_end': -694267200000,
                          'system:time_start': -694267200000},
                         {'system:asset_size': 13324,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_1948010118',
                          'system:time_end': -694245600000,
                          'system:time_start': -694245600000},
                         {'system:asset_size': 13417,
-                         'system:footprint': {'coordinates': [[-180, -90],
-                                                              [180, -90],
-                                                              [180, 90],
-                                                              [-180, 90],
-                                                              [-180, -90]],
-                                              'type': 'LinearRing'},
                          'system:index': 'slp_1948010200',
                          'system:time_end': -694224000000,
                          'system:time_start': -694224000000}]
@@ -319,19 +225,97 @@ def test_image_collection_group_by_without_where_clause_and_multiple_aliases():
 #     assert len(response) == 5
 #     assert "first_slp" in response[0].keys()
 #     assert "average_slp" in response[0].keys()
-#     assert response == [{'average_slp': 101500, 'first_slp': 101500, 'system:asset_size': 12575, 'system:footprint': {
-#         'coordinates': [[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]], 'type': 'LinearRing'},
-#                          'system:time_start': -694310400000},
-#                         {'average_slp': 101400, 'first_slp': 101400, 'system:asset_size': 12815, 'system:footprint': {
-#                             'coordinates': [[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]],
-#                             'type': 'LinearRing'}, 'system:time_start': -694288800000},
-#                         {'average_slp': 101580, 'first_slp': 101580, 'system:asset_size': 13149, 'system:footprint': {
-#                             'coordinates': [[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]],
-#                             'type': 'LinearRing'}, 'system:time_start': -694267200000},
-#                         {'average_slp': 101150, 'first_slp': 101150, 'system:asset_size': 13324, 'system:footprint': {
-#                             'coordinates': [[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]],
-#                             'type': 'LinearRing'}, 'system:time_start': -694245600000},
-#                         {'average_slp': 101370, 'first_slp': 101370, 'system:asset_size': 13417, 'system:footprint': {
-#                             'coordinates': [[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]],
-#                             'type': 'LinearRing'}, 'system:time_start': -694224000000}]
+#     assert response == [{'average_slp': 101500, 'first_slp': 101500, 'system:asset_size': 12575, #                          'system:time_start': -694310400000},
+#                         {'average_slp': 101400, 'first_slp': 101400, 'system:asset_size': 12815, 'system:time_start': -694288800000},
+#                         {'average_slp': 101580, 'first_slp': 101580, 'system:asset_size': 13149, 'system:time_start': -694267200000},
+#                         {'average_slp': 101150, 'first_slp': 101150, 'system:asset_size': 13324, 'system:time_start': -694245600000},
+#                         {'average_slp': 101370, 'first_slp': 101370, 'system:asset_size': 13417, 'system:time_start': -694224000000}]
 #     return
+
+
+def test_image_collection_single_round_trip(monkeypatch):
+    """Alias mapping is done on the client, so the response costs one getInfo() whatever the row count"""
+    sql = "select status as st, pr from 'IDAHO_EPSCOR/GRIDMET' limit 50"
+    q = SQL2GEE(JsonSql(sql).to_json())
+    calls = []
+    get_info = ee.computedobject.ComputedObject.getInfo
+
+    def counting_get_info(self):
+        calls.append(self)
+        return get_info(self)
+
+    monkeypatch.setattr(ee.computedobject.ComputedObject, 'getInfo', counting_get_info)
+    response = q.response()
+    assert len(response) == 50
+    assert response[0] == {'st': 'permanent'}
+    assert len(calls) == 1, "Expected exactly one Earth Engine call, got {0}".format(len(calls))
+    return
+
+
+def test_projected_rows_keep_the_image_id():
+    sql = "select system:index as idx, status as st from 'IDAHO_EPSCOR/GRIDMET' limit 3"
+    rows = SQL2GEE(JsonSql(sql).to_json(), flags={'cache': False}).response()
+    assert len(rows) == 3 and all(row['idx'] for row in rows), "The image id was dropped: {0}".format(rows)
+    assert len(set(row['idx'] for row in rows)) == 3
+    return
+
+
+def test_zonal_aggregate_per_polygon():
+    sql = ("select avg(tmmx) as tmmx, name from 'IDAHO_EPSCOR/GRIDMET' "
+           "where system:time_start > 1522548800000 and system:time_start < 1523548800000 group by name")
+    features = [{"type": "Feature", "properties": {"name": name}, "geometry": {"type": "Polygon", "coordinates": [
+        [[x, y], [x + 0.5, y], [x + 0.5, y + 0.5], [x, y + 0.5], [x, y]]]}}
+        for name, x, y in [('florida', -81.5, 27.5), ('montana', -110.5, 47.0)]]
+    response = SQL2GEE(JsonSql(sql).to_json(), geojson={"type": "FeatureCollection", "features": features}).response()
+    assert [row['name'] for row in response] == ['florida', 'montana'], "Rows are not one per input polygon"
+    assert response[0]['tmmx'] > response[1]['tmmx']
+    return
+
+
+def test_no_spatial_filter_without_geometry():
+    """Without a geometry the collection is not intersected with a world polygon"""
+    sql = "select status from 'IDAHO_EPSCOR/GRIDMET' where status='permanent' limit 2"
+    q = SQL2GEE(JsonSql(sql).to_json())
+    assert 'intersects' not in q.factory._query()._prepared.serialize(), "Unbounded query applied filterBounds"
+    assert len(q.response()) == 2
+    return
+
+
+def test_footprint_only_when_selected():
+    sql = "select system:footprint, system:index from 'IDAHO_EPSCOR/GRIDMET' limit 1"
+    row = SQL2GEE(JsonSql(sql).to_json(), flags={'precision': 2}).response()[0]
+    assert row['system:footprint']['type'] == 'LinearRing', "Explicitly selected footprint was dropped"
+    assert row['system:footprint']['coordinates'][0] == [-124.83, 25.0], "Footprint was not rounded"
+    return
+
+
+def test_group_by_is_grouped_server_side(monkeypatch):
+    """Groups are formed by a join in the same request: no getInfo() discovers them beforehand"""
+    sql = ("select avg(pr) as pr, system:index from 'IDAHO_EPSCOR/GRIDMET' "
+           "where system:time_start > 1522548800000 and system:time_start < 1523548800000 group by system:index")
+    q = SQL2GEE(JsonSql(sql).to_json())
+    q.factory
+    calls = []
+    get_info = ee.computedobject.ComputedObject.getInfo
+
+    def counting_get_info(self):
+        calls.append(self)
+        return get_info(self)
+
+    monkeypatch.setattr(ee.computedobject.ComputedObject, 'getInfo', counting_get_info)
+    response = q.response()
+    assert len(response) > 1 and 'pr' in response[0]
+    assert [row['system:index'] for row in response] == sorted(row['system:index'] for row in response)
+    assert len(calls) == 1, "Expected exactly one Earth Engine call, got {0}".format(len(calls))
+    return
+
+
+def test_time_range_is_pushed_down_to_filter_date():
+    sql = ("select system:index from 'IDAHO_EPSCOR/GRIDMET' "
+           "where system:time_start >= 1522548800000 and system:time_start < 1523548800000 and status = 'permanent'")
+    q = SQL2GEE(JsonSql(sql).to_json())
+    serialized = q.factory._query()._prepared.serialize()
+    assert 'Filter.dateRangeContains' in serialized, "Time range was not compiled to a date filter"
+    assert 'Filter.greaterThan' not in serialized and 'Filter.lessThan' not in serialized
+    assert len(q.response()) == 12
+    return
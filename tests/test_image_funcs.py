@@ -294,3 +294,77 @@ def test_valuecount_categorical_true():
 
     assert response == correct, "Incorrect response returned"
     return
+
+
+def test_tiled_summarystats_matches_single_request_extremes():
+    """Tiled execution merges per tile partials; min and max must match the single reduceRegion"""
+    sql = "SELECT ST_SUMMARYSTATS() FROM 'CGIAR/SRTM90_V4'"
+    geojson = {"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}, "geometry": {
+        "type": "Polygon", "coordinates": [[[-43.39, -4.74], [-43.39, -4.95], [-43.17, -4.80], [-43.39, -4.74]]]}}]}
+    single = SQL2GEE(JsonSql(sql).to_json(), geojson=geojson).response()[0]['st_summarystats']['elevation']
+    tiled = SQL2GEE(JsonSql(sql).to_json(), geojson=geojson, flags={'tiles': 3}).response()[0]['st_summarystats']
+    assert tiled['elevation']['min'] == single['min']
+    assert tiled['elevation']['max'] == single['max']
+    assert tiled['elevation']['count'] > 0
+    return
+
+
+def test_tiled_reduction_counts_edge_pixels_once():
+    # two tiles split on a meridian through SRTM pixel centres (1/1200 degree pixels aligned on -180)
+    step = 1 / 1200
+    west, south = -3 + step / 2, 40 + step / 2
+    east, north = west + 120 * step, south + 60 * step
+    polygon = {"type": "Polygon", "coordinates": [[[west, south], [east, south], [east, north], [west, north],
+                                                   [west, south]]]}
+    geojson = {"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}, "geometry": polygon}]}
+    sql = "SELECT ST_SUMMARYSTATS() FROM 'CGIAR/SRTM90_V4'"
+    tiled = SQL2GEE(JsonSql(sql).to_json(), geojson=geojson, flags={'tiles': (2, 1), 'cache': False}).response()
+    image = ee.Image('CGIAR/SRTM90_V4')
+    whole = image.reduceRegion(ee.Reducer.count().unweighted(), ee.Geometry(polygon),
+                               scale=image.projection().nominalScale()).getInfo()['elevation']
+    assert tiled[0]['st_summarystats']['elevation']['count'] == whole, "Pixels on the tile edge were counted twice"
+    return
+
+
+def test_summarystats_only_reduces_requested_band():
+    sql = "SELECT ST_SUMMARYSTATS(rast, lossyear) FROM 'UMD/hansen/global_forest_change_2015'"
+    result = SQL2GEE(JsonSql(sql).to_json()).response()[0]['st_summarystats']
+    assert list(result.keys()) == ['lossyear'], "Only the requested band should be summarised"
+    assert set(result['lossyear'].keys()) == {'count', 'sum', 'mean', 'stdev', 'min', 'max'}
+    return
+
+
+def test_raster_functions_are_fused_in_one_request(monkeypatch):
+    """ST_HISTOGRAM, ST_SUMMARYSTATS and ST_VALUECOUNT of one query are evaluated with a single getInfo()"""
+    sql = ("SELECT ST_HISTOGRAM(rast, 'seasonality', 12, true), ST_SUMMARYSTATS(rast, 'seasonality'), "
+           "ST_VALUECOUNT(rast, 'seasonality', false) FROM 'JRC/GSW1_2/GlobalSurfaceWater'")
+    geojson = {"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}, "geometry": {
+        "type": "Polygon", "coordinates": [[[-43.39, -4.74], [-43.39, -4.95], [-43.17, -4.80], [-43.39, -4.74]]]}}]}
+    q = SQL2GEE(JsonSql(sql).to_json(), geojson=geojson)
+    calls = []
+    get_info = ee.computedobject.ComputedObject.getInfo
+
+    def counting_get_info(self):
+        calls.append(self)
+        return get_info(self)
+
+    monkeypatch.setattr(ee.computedobject.ComputedObject, 'getInfo', counting_get_info)
+    result = q.response()[0]
+    assert len(result['st_histogram']['seasonality']) == 12
+    assert 'seasonality' in result['st_summarystats']
+    assert 'seasonality' in result['st_valuecount']
+    assert len(calls) == 1, "Expected a single Earth Engine call, got {0}".format(len(calls))
+    return
+
+
+def test_ST_SUMMARYSTATS_per_polygon():
+    """GROUP BY a property of the input features returns one row per polygon, computed with reduceRegions"""
+    sql = "SELECT ST_SUMMARYSTATS(rast, 'elevation') as stats, name FROM 'CGIAR/SRTM90_V4' group by name"
+    features = [{"type": "Feature", "properties": {"name": name}, "geometry": {"type": "Polygon", "coordinates": [
+        [[x, y], [x + 0.1, y], [x + 0.1, y + 0.1], [x, y + 0.1], [x, y]]]}}
+        for name, x, y in [('madrid', -3.7, 40.4), ('alps', 7.6, 45.9), ('coast', -9.2, 38.7)]]
+    geojson = {"type": "FeatureCollection", "features": features}
+    rows = SQL2GEE(JsonSql(sql).to_json(), geojson=geojson, flags={'zone_chunk': 2}).response()
+    assert [row['name'] for row in rows] == ['madrid', 'alps', 'coast'], "Rows are not one per input polygon"
+    assert rows[1]['stats']['elevation']['mean'] > rows[0]['stats']['elevation']['mean']
+    return
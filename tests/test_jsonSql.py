@@ -0,0 +1,83 @@
+import json
+import os
+
+import pytest
+
+from sql2gee.utils.jsonSql import JsonSql
+from sql2gee.utils.sqlParser import SqlParseError
+
+# Expected jsonSql for every query used in the test suite and in sql2gee/test.py, written by hand in the sql2SQL output
+# format: they are not sql2SQL output until tests/fixtures/record.py has replaced them with the service responses
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'sql2SQL.json')
+
+with open(FIXTURES) as f:
+    RECORDED = json.load(f)
+
+
+@pytest.mark.parametrize('recorded', RECORDED, ids=[r['sql'][:60] for r in RECORDED])
+def test_parser_matches_expected_jsonSql(recorded):
+    response = JsonSql(recorded['sql']).to_json()
+    assert response == recorded['response'], "Local jsonSql differs from the expected jsonSql"
+    return
+
+
+def test_geojson_argument_is_kept_as_string():
+    sql = "select * from 'NCEP_RE/sea_level_pressure' where ST_INTERSECTS(ST_SetSRID(ST_GeomFromGeoJSON('{\"type\":\"Point\",\"coordinates\":[-110.2,19.9]}'),4326),the_geom) limit 5"
+    where = JsonSql(sql).to_json()['data']['attributes']['jsonSql']['where'][0]
+    geojson = where['arguments'][0]['arguments'][0]['arguments'][0]
+    assert geojson['type'] == 'string'
+    assert json.loads(geojson['value'].strip("'")) == {"type": "Point", "coordinates": [-110.2, 19.9]}
+    return
+
+
+def test_conditional_tree():
+    sql = "select status from 'IDAHO_EPSCOR/GRIDMET' where status = 'permanent' or (pr > 1 and pr <= 2.5)"
+    where = JsonSql(sql).to_json()['data']['attributes']['jsonSql']['where']
+    assert where == [{'type': 'conditional', 'value': 'or',
+                      'left': [{'type': 'operator', 'value': '=', 'left': [{'value': 'status', 'type': 'literal'}],
+                                'right': [{'value': "'permanent'", 'type': 'string'}]}],
+                      'right': [{'type': 'conditional', 'value': 'and',
+                                 'left': [{'type': 'operator', 'value': '>',
+                                           'left': [{'value': 'pr', 'type': 'literal'}],
+                                           'right': [{'value': 1, 'type': 'number'}]}],
+                                 'right': [{'type': 'operator', 'value': '<=',
+                                            'left': [{'value': 'pr', 'type': 'literal'}],
+                                            'right': [{'value': 2.5, 'type': 'number'}]}]}]}]
+    return
+
+
+def _where(sql):
+    return JsonSql(sql).to_json()['data']['attributes']['jsonSql']['where'][0]
+
+
+def test_predicates():
+    column = [{'value': 'pr', 'type': 'literal'}]
+    assert _where("select * from 'IDAHO_EPSCOR/GRIDMET' where pr between 1 and 2.5 and pr > 0")['left'][0] == \
+        {'type': 'operator', 'value': 'between', 'left': column,
+         'right': [{'value': 1, 'type': 'number'}, {'value': 2.5, 'type': 'number'}]}
+    assert _where("select * from 'IDAHO_EPSCOR/GRIDMET' where pr not in (1, 2)") == \
+        {'type': 'operator', 'value': 'not in', 'left': column,
+         'right': [{'value': 1, 'type': 'number'}, {'value': 2, 'type': 'number'}]}
+    assert _where("select * from 'IDAHO_EPSCOR/GRIDMET' where pr not like 'a%'") == \
+        {'type': 'operator', 'value': 'not like', 'left': column, 'right': [{'value': "'a%'", 'type': 'string'}]}
+    assert _where("select * from 'IDAHO_EPSCOR/GRIDMET' where pr is not null") == \
+        {'type': 'operator', 'value': 'is not', 'left': column, 'right': [{'value': None, 'type': 'null'}]}
+    assert _where("select * from 'IDAHO_EPSCOR/GRIDMET' where pr is null")['value'] == 'is'
+    return
+
+
+@pytest.mark.parametrize('sql', [
+    'select ALAND from "TIGER/2018/States" where ALAND in ()',
+    'select ALAND from "TIGER/2018/States" where ALAND not = 1',
+    'select ALAND from "TIGER/2018/States" where ALAND is 1',
+    'select ALAND from "TIGER/2018/States" where ALAND between 1',
+    'select from "TIGER/2018/States"',
+    'select count(ALAND from "TIGER/2018/States"',
+    'select ALAND from "TIGER/2018/States" where ALAND',
+    'select ALAND from "TIGER/2018/States" limit ten',
+    'select ALAND from "TIGER/2018/States" limit 1 trailing',
+])
+def test_invalid_queries_raise(sql):
+    with pytest.raises(SqlParseError):
+        JsonSql(sql).to_json()
+    return
@@ -0,0 +1,91 @@
+import pytest
+
+from sql2gee.collection import Collection
+from sql2gee.utils.pagination import decode_cursor, decode_token, encode_token, query_fingerprint
+
+PARSED = {'select': [{'value': 'NAME', 'alias': None, 'type': 'literal'}], 'from': '"TIGER/2018/States"'}
+
+
+class Rows(Collection):
+    """Plain row result of features with the given ids, recording the offset and cursor reads"""
+    _cursor_paging = True
+
+    def __init__(self, ids, limit=None, offset=None):
+        self._parsed = dict(PARSED, limit=limit, offset=offset)
+        self.select = {'functions': []}
+        self.ids = ids
+        self.offsets = []
+        self.cursors = []
+
+    def _fetch(self, offset, count):
+        self.offsets.append(offset)
+        return [{'id': id} for id in self.ids[offset:offset + count]]
+
+    def _fetch_after(self, cursor, count, skip=0):
+        self.cursors.append(cursor)
+        return [{'id': id} for id in self.ids if cursor is None or id > cursor][skip:skip + count]
+
+
+def test_page_token_round_trip():
+    fingerprint = query_fingerprint(PARSED)
+    assert decode_token(encode_token(5000, fingerprint), fingerprint) == 5000
+    return
+
+
+def test_page_token_is_bound_to_its_query():
+    token = encode_token(20, query_fingerprint(PARSED))
+    other = query_fingerprint(dict(PARSED, limit=10))
+    with pytest.raises(ValueError):
+        decode_token(token, other)
+    with pytest.raises(ValueError):
+        decode_token('not-a-token', other)
+    return
+
+
+def test_pages_are_read_by_offset():
+    rows = Rows(['a', 'b', 'c', 'd', 'e'])
+    pages = list(rows.pages(page_size=2, max_workers=4))
+    assert [[row['id'] for row in page['rows']] for page in pages] == [['a', 'b'], ['c', 'd'], ['e']]
+    assert sorted(rows.offsets) == [0, 2, 4, 6, 8], "Pages after the first one were not fetched together by offset"
+    assert rows.cursors == [], "Iterating every page sorted the collection for a cursor"
+    limited = Rows(['a', 'b', 'c', 'd', 'e'], limit=3)
+    assert [row['id'] for row in limited.iter_response(page_size=2)] == ['a', 'b', 'c']
+    return
+
+
+def test_page_resumes_from_the_cursor():
+    rows = Rows(['a', 'b', 'c', 'd', 'e'])
+    first = rows.page(page_size=2)
+    assert decode_cursor(first['next_page_token'], rows._fingerprint) == (2, 'b')
+    pages = list(rows.pages(page_size=2, page_token=first['next_page_token'], max_workers=4))
+    assert [[row['id'] for row in page['rows']] for page in pages] == [['c', 'd'], ['e']]
+    assert rows.cursors == [None, 'b', 'd'], "Pages were not read after the last row of the previous one"
+    assert rows.offsets == []
+    return
+
+
+def test_limit_within_one_page_is_not_sorted():
+    rows = Rows(['a', 'b', 'c', 'd', 'e'], limit=3)
+    page = rows.page(page_size=5)
+    assert [row['id'] for row in page['rows']] == ['a', 'b', 'c']
+    assert page['next_page_token'] is None
+    assert rows.offsets == [0] and rows.cursors == [], "A LIMIT that fits in one page was read by cursor"
+    return
+
+
+def test_offset_skips_rows():
+    rows = Rows(['a', 'b', 'c', 'd', 'e', 'f'], limit=3, offset=2)
+    assert [row['id'] for row in rows.iter_response(page_size=2)] == ['c', 'd', 'e']
+    resumed = Rows(['a', 'b', 'c', 'd', 'e', 'f'], offset=2)
+    first = resumed.page(page_size=2)
+    second = resumed.page(page_size=2, page_token=first['next_page_token'])
+    assert [row['id'] for row in first['rows'] + second['rows']] == ['c', 'd', 'e', 'f']
+    assert resumed.cursors == [None, 'd'], "The cursor read did not skip the OFFSET rows"
+    return
+
+
+def test_response_is_capped():
+    with pytest.raises(ValueError):
+        Rows(['a', 'b', 'c', 'd']).response(max_rows=3)
+    assert len(Rows(['a', 'b', 'c', 'd']).response(max_rows=None)) == 4
+    return
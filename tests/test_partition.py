@@ -0,0 +1,70 @@
+import statistics
+
+from sql2gee.utils.partition import index_ranges, mergeable, merge_partials, partition_functions
+
+
+def _function(name, column):
+    return {'type': 'function', 'alias': None, 'value': name, 'arguments': [{'type': 'literal', 'value': column}]}
+
+
+def _partial(*columns):
+    """What partial_reduce_columns returns for one partition, values given per column"""
+    return {'count': [len(values) for values in columns],
+            'sum': [sum(values) for values in columns],
+            'min': [min(values) if values else None for values in columns],
+            'max': [max(values) if values else None for values in columns],
+            'variance': [statistics.pvariance(values) if values else None for values in columns]}
+
+
+def test_functions_follow_reduce_columns_order():
+    functions = [_function('sum', 'AREA'), _function('avg', 'AREA'), _function('max', 'POP')]
+    assert partition_functions(functions) == [('mean', 'AREA'), ('max', 'POP'), ('sum', 'AREA')]
+    assert mergeable(functions)
+    assert not mergeable(functions + [_function('mode', 'POP')]), "mode cannot be merged from partials"
+    return
+
+
+def test_partials_merge_into_whole_collection_values():
+    area, pop = [3.0, 7.5, 1.25, 9.0, 4.0], [10, 20, 30, 40, 50]
+    functions = [('mean', 'AREA'), ('variance', 'AREA'), ('max', 'POP'), ('count', 'AREA'), ('sum', 'POP')]
+    row = merge_partials([_partial(area[:2], pop[:2]), _partial([], []), _partial(area[2:], pop[2:])],
+                         ['AREA', 'POP'], functions)
+    assert abs(row['mean'][0] - statistics.mean(area)) < 1e-12
+    assert abs(row['variance'][0] - statistics.pvariance(area)) < 1e-12
+    assert row['max'] == [50] and row['count'] == [5] and row['sum'] == [150]
+    return
+
+
+def test_variance_of_large_values_does_not_cancel():
+    values = [1e11 + 2 * i - 1000 for i in range(1000)]
+    functions = [('variance', 'AREA'), ('stdDev', 'AREA'), ('mean', 'AREA')]
+    row = merge_partials([_partial(values[:400]), _partial(values[400:])], ['AREA'], functions)
+    expected = statistics.pvariance(values)
+    assert expected > 3e5, "The values should spread around the offset"
+    assert abs(row['variance'][0] - expected) / expected < 1e-9, "Variance lost to cancellation: {0}".format(row)
+    assert abs(row['mean'][0] - statistics.mean(values)) < 1e-3
+    return
+
+
+def test_groups_are_merged_by_key():
+    first = {'groups': [{'STATE': 'CA', 'groups': [{'TYPE': 'a', **_partial([1.0])}]},
+                        {'STATE': 'NV', 'groups': [{'TYPE': 'a', **_partial([2.0])}]}]}
+    second = {'groups': [{'STATE': 'CA', 'groups': [{'TYPE': 'a', **_partial([3.0])},
+                                                    {'TYPE': 'b', **_partial([4.0])}]}]}
+    merged = merge_partials([second, first], ['AREA'], [('sum', 'AREA')], ['TYPE', 'STATE'])
+    assert merged == {'groups': [
+        {'STATE': 'CA', 'groups': [{'TYPE': 'a', 'sum': [4.0]}, {'TYPE': 'b', 'sum': [4.0]}]},
+        {'STATE': 'NV', 'groups': [{'TYPE': 'a', 'sum': [2.0]}]}]}, "Groups were not merged by key"
+    return
+
+
+def test_index_ranges_hold_every_feature_once():
+    ids = ['0', '00a', '1', '10', '2', 'b', 'b0']
+    ranges = index_ranges(['1', '2', '2'])
+    assert len(ranges) == 4
+    for id in ids:
+        owners = [(lower, upper) for lower, upper in ranges
+                  if (lower is None or id >= lower) and (upper is None or id < upper)]
+        assert len(owners) == 1, "{0} is not in exactly one partition".format(id)
+    assert index_ranges([]) == [(None, None)]
+    return
@@ -0,0 +1,74 @@
+import pytest
+
+from sql2gee import SQL2GEE
+from sql2gee.catalog import MetadataCatalog
+from sql2gee.prepared import PreparedQuery
+from sql2gee.utils.jsonSql import JsonSql
+from sql2gee.utils.sqlParser import SqlParseError, unquote
+
+AOI = {'type': 'Polygon', 'coordinates': [[[-3.8, 40.3], [-3.6, 40.3], [-3.6, 40.5], [-3.8, 40.3]]]}
+
+
+@pytest.fixture
+def prepare(fake_backend):
+    return lambda sql: PreparedQuery(sql, backend=fake_backend('IMAGE'), catalog=MetadataCatalog())
+
+
+def test_parameters_are_parsed():
+    where = JsonSql("select * from 'TIGER/2018/States' where ALAND > $area")\
+        .to_json()['data']['attributes']['jsonSql']['where']
+    assert where[0]['right'] == [{'value': 'area', 'type': 'parameter'}], "$area was not parsed as a parameter"
+    return
+
+
+def test_values_are_bound_as_literals(prepare):
+    statement = prepare("select ST_SUMMARYSTATS() from 'CGIAR/SRTM90_V4' "
+                         "where ST_INTERSECTS(ST_GeomFromGeoJSON($aoi), the_geom) and NAME = $name and ALAND > $area")
+    assert statement.parameters == ['aoi', 'name', 'area']
+    where = statement._scheme({'aoi': AOI, 'name': 'Texas', 'area': 1e11})['data']['attributes']['jsonSql']['where']
+    assert where[0]['right'][0]['right'] == [{'value': 1e11, 'type': 'number'}]
+    assert where[0]['left'][0]['right'][0]['right'] == [{'value': "'Texas'", 'type': 'string'}]
+    assert statement.json['data']['attributes']['jsonSql']['where'] != where, "Binding modified the statement"
+    return
+
+
+def test_executions_reuse_the_plan(prepare):
+    statement = prepare("select ST_SUMMARYSTATS() from 'CGIAR/SRTM90_V4' "
+                         "where ST_INTERSECTS(ST_GeomFromGeoJSON($aoi), the_geom)")
+    first = statement.query(aoi=AOI)
+    second = statement.query(aoi=dict(AOI, coordinates=[[[0, 0], [1, 0], [1, 1], [0, 0]]]))
+    assert first.factory._select is second.factory._select, "The select was validated again"
+    assert len(statement.backend.calls) == 1, "Metadata was fetched again"
+    assert first.factory._features == [AOI], "The geometry was not bound"
+    assert first._canonical != second._canonical, "Different values would share a cached result"
+    return
+
+
+def test_quotes_in_values_are_escaped(prepare):
+    statement = prepare("select ST_SUMMARYSTATS() from 'CGIAR/SRTM90_V4' where NAME = $name")
+    where = statement._scheme({'name': "O'Brien' or 1 = 1"})['data']['attributes']['jsonSql']['where']
+    assert where[0]['right'] == [{'value': "'O''Brien'' or 1 = 1'", 'type': 'string'}]
+    assert unquote(where[0]['right'][0]['value']) == "O'Brien' or 1 = 1", "The value did not survive as one literal"
+    return
+
+
+def test_zones_follow_the_bound_geometry(prepare):
+    statement = prepare("select name, ST_SUMMARYSTATS() from 'CGIAR/SRTM90_V4' "
+                         "where ST_INTERSECTS(ST_GeomFromGeoJSON($aoi), the_geom) group by name")
+    first = statement.query(aoi={'type': 'Feature', 'properties': {'name': 'a'}, 'geometry': AOI}).factory
+    second = statement.query(aoi=AOI).factory
+    assert first._zones['keys'] == ['name'] and first._zones['features'][0]['properties'] == {'name': 'a'}
+    assert second._zones is None, "Zones of another execution were reused"
+    return
+
+
+def test_missing_and_misplaced_parameters_raise(prepare, fake_backend):
+    statement = prepare("select ST_SUMMARYSTATS() from 'CGIAR/SRTM90_V4' "
+                         "where ST_INTERSECTS(ST_GeomFromGeoJSON($aoi), the_geom)")
+    with pytest.raises(ValueError):
+        statement.query()
+    with pytest.raises(ValueError):
+        statement.query(aoi=AOI, year=2000)
+    with pytest.raises(SqlParseError):
+        SQL2GEE.prepare("select elevation from 'CGIAR/SRTM90_V4' group by $n", backend=fake_backend('IMAGE'))
+    return
@@ -0,0 +1,36 @@
+from sql2gee.utils.jsonSql import JsonSql
+from sql2gee.utils.pushdown import conjuncts, is_time_range, time_intervals
+
+
+def _where(sql):
+    return JsonSql(sql).to_json()['data']['attributes']['jsonSql']['where'][0]
+
+
+def test_only_conjuncts_are_pushed_down():
+    where = _where("select pr from 'IDAHO_EPSCOR/GRIDMET' where system:time_start > 1522548800000 and "
+                   "(status = 'permanent' or system:time_start < 1) and system:time_start <= 1523548800000")
+    nodes = conjuncts(where)
+    assert len(nodes) == 3, "AND operands were not split"
+    assert [is_time_range(node) for node in nodes] == [True, False, True], "A predicate under OR was pushed down"
+    return
+
+
+def test_time_ranges_merge_into_one_interval():
+    where = _where("select pr from 'IDAHO_EPSCOR/GRIDMET' where system:time_start > 100 and system:time_start >= 150 "
+                   "and system:time_start < 900 and system:time_start <= 500 and system:time_end >= 200")
+    intervals = time_intervals([node for node in conjuncts(where) if is_time_range(node)])
+    assert intervals == {'system:time_start': [150, 501], 'system:time_end': [200, None]}
+    equal = _where("select pr from 'IDAHO_EPSCOR/GRIDMET' where system:time_start = 300")
+    assert time_intervals(conjuncts(equal)) == {'system:time_start': [300, 301]}
+    return
+
+
+def test_fractional_bounds_round_to_whole_milliseconds():
+    where = _where("select pr from 'IDAHO_EPSCOR/GRIDMET' where system:time_start > 100.5 and "
+                   "system:time_start <= 200.5 and system:time_end >= 300.5 and system:time_end < 400.5")
+    intervals = time_intervals(conjuncts(where))
+    assert intervals == {'system:time_start': [101, 201], 'system:time_end': [301, 401]}, \
+        "Fractional bounds were shifted as whole milliseconds"
+    assert time_intervals(conjuncts(_where("select pr from 'IDAHO_EPSCOR/GRIDMET' where system:time_start = 1.5"))) \
+        == {'system:time_start': [2, 2]}, "t = 1.5 should match no whole millisecond"
+    return
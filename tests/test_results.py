@@ -0,0 +1,87 @@
+import json
+import time
+from contextlib import contextmanager
+
+from sql2gee import SQL2GEE
+from sql2gee.results import ResultCache
+from sql2gee.utils.jsonSql import JsonSql
+from sql2gee.utils.lruCache import LRUCache
+
+VERSION = ['2019-06-17T17:48:10.661679Z', None]
+
+
+def _canonical(sql):
+    return json.dumps(JsonSql(sql).to_json()['data']['attributes']['jsonSql'], sort_keys=True)
+
+
+def test_key_ignores_formatting_and_tracks_version():
+    cache = ResultCache()
+    a = cache.key('GLIMS/2016', _canonical("select sum(area) from 'GLIMS/2016' group by anlys_time"), version=VERSION)
+    b = cache.key('GLIMS/2016', _canonical("SELECT  sum(area)\nFROM 'GLIMS/2016' GROUP BY anlys_time"),
+                  version=VERSION)
+    assert a == b, "Equivalent queries got different cache keys"
+    assert a != cache.key('GLIMS/2016', _canonical("select sum(area) from 'GLIMS/2016' group by anlys_time"),
+                          version=['2021-01-01T00:00:00Z', None]), "Asset update did not change the cache key"
+    assert a != cache.key('GLIMS/2016', _canonical("select sum(area) from 'GLIMS/2016' group by anlys_time"),
+                          flags={'tiles': 4}, version=VERSION)
+    assert a == cache.key('GLIMS/2016', _canonical("select sum(area) from 'GLIMS/2016' group by anlys_time"),
+                          flags={'stats': False}, version=VERSION)
+    return
+
+
+def test_invalidate_one_asset():
+    cache = ResultCache()
+    glims = cache.key('GLIMS/2016', 'q1')
+    states = cache.key('TIGER/2018/States', 'q2')
+    cache.set(glims, [{'sum': 1.5}], 'GLIMS/2016')
+    cache.set(states, [{'count': 56}], 'TIGER/2018/States')
+    cache.invalidate('GLIMS/2016')
+    assert cache.get(cache.key('GLIMS/2016', 'q1')) is None, "Invalidated result was served"
+    assert cache.get(cache.key('TIGER/2018/States', 'q2')) == [{'count': 56}]
+    return
+
+
+def test_per_asset_ttl_and_disk_tier(tmp_path):
+    cache = ResultCache(ttl=0.05, ttls={'GLIMS/2016': 3600}, path=str(tmp_path))
+    cache.set('a', [1], 'GLIMS/2016')
+    cache.set('b', [2], 'TIGER/2018/States')
+    time.sleep(0.1)
+    assert cache.get('a') == [1] and cache.get('b') is None
+    assert ResultCache(path=str(tmp_path)).get('a') == [1], "Result was not persisted on disk"
+    return
+
+
+def test_lru_evicts_by_size():
+    cache = LRUCache(maxsize=10, maxbytes=10)
+    cache.set('a', 'xxxx')
+    cache.set('b', 'yyyy')
+    cache.set('c', 'zzzz')
+    assert cache.get('a') is None and cache.get('c') == 'zzzz'
+    assert cache.nbytes == 8
+    cache.set('huge', 'x' * 11)
+    assert cache.get('huge') is None and cache.nbytes == 8, "Oversized value was kept in memory"
+    return
+
+
+def test_cache_stage_does_not_time_the_metadata_lookup(fake_backend):
+    cache = ResultCache()
+    q = SQL2GEE("select NAME from 'TIGER/2018/States' limit 3", backend=fake_backend(delay=0.05), results=cache)
+    cache.set(q._key(['response'], q._version()), [{'NAME': 'Texas'}], q._asset_id)
+    fresh = SQL2GEE("select NAME from 'TIGER/2018/States' limit 3", backend=fake_backend(delay=0.05),
+                    results=cache)
+    opened = []
+    stage = fresh.stats.stage
+
+    @contextmanager
+    def logged(name):
+        opened.append(name)
+        with stage(name) as stats:
+            yield stats
+        opened.remove(name)
+        assert not opened, "{0} was timed inside {1}".format(name, opened)
+
+    fresh.stats.stage = logged
+    assert fresh.response() == [{'NAME': 'Texas'}]
+    assert fresh.stats.cache_hits.get('result') == 1
+    assert fresh.stats.stages['cache'] < 0.05, "The metadata lookup was timed under the cache stage"
+    return
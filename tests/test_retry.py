@@ -0,0 +1,56 @@
+import ee
+import pytest
+
+from sql2gee.utils.parallel import chunks, fetch_chunks
+from sql2gee.utils.retry import is_transient, retry
+
+
+def test_transient_errors_are_retried():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ee.EEException('Too many concurrent aggregations.')
+        return 'rows'
+
+    assert retry(flaky, attempts=3, backoff=0) == 'rows'
+    assert len(calls) == 3, "Chunk was not retried until it succeeded"
+    return
+
+
+def test_permanent_errors_are_not_retried():
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ee.EEException("Collection.loadTable: Table not found: 'nope'.")
+
+    with pytest.raises(ee.EEException):
+        retry(broken, attempts=3, backoff=0)
+    assert len(calls) == 1
+    assert not is_transient(ee.EEException('User memory limit exceeded.')), "Memory errors are for the planner"
+    assert not is_transient(ee.EEException('Computation timed out.'))
+    assert not is_transient(NameError('column/band name not valid: foo'))
+    return
+
+
+def test_chunks_cover_the_page_in_order():
+    assert chunks(500, 600, 250) == [(500, 250), (750, 250), (1000, 100)]
+    assert chunks(0, 0, 250) == []
+    return
+
+
+def test_chunks_are_only_fanned_out_while_full():
+    calls = []
+
+    def fetch(start, size):
+        calls.append(start)
+        return list(range(start, min(start + size, 612)))
+
+    assert fetch_chunks(fetch, 0, 5000, 250, max_workers=2) == list(range(612))
+    assert calls == [0, 250, 500], "Chunks past the last group were fetched"
+    calls.clear()
+    assert fetch_chunks(fetch, 600, 5000, 250) == list(range(600, 612))
+    assert calls == [600], "A result smaller than a chunk cost more than one call"
+    return
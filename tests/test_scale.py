@@ -0,0 +1,96 @@
+import ee
+import pytest
+
+from sql2gee.catalog import MetadataCatalog
+from sql2gee.gee_factory import GeeFactory
+from sql2gee.utils.geometry import geojson_area
+from sql2gee.utils.jsonSql import JsonSql
+from sql2gee.utils.scale import ReductionPlan, band_scale, plan_reduction, reduce_adaptively
+
+# getAsset() band metadata of an Image, getInfo() band metadata of the first image of an ImageCollection
+SRTM = {'id': 'elevation', 'grid': {'crsCode': 'EPSG:4326', 'dimensions': {'width': 432000, 'height': 144000},
+                                    'affineTransform': {'scaleX': 0.000833333333333, 'scaleY': -0.000833333333333}}}
+LANDSAT = {'id': 'B4', 'crs': 'EPSG:32610', 'crs_transform': [30, 0, 460485, 0, -30, 4264515],
+           'dimensions': [7611, 7771]}
+SQUARE = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+
+
+class Failing(object):
+    """Backend failing with `error` until the plan reaches the given tileScale"""
+
+    def __init__(self, error, tile_scale):
+        self.error = error
+        self.tile_scale = tile_scale
+        self.plans = []
+
+    def get_info(self, plan):
+        self.plans.append(plan)
+        if plan.tile_scale < self.tile_scale:
+            raise ee.EEException(self.error)
+        return {'elevation': 1}
+
+
+def test_native_scale_from_band_metadata():
+    assert abs(band_scale(SRTM) - 92.77) < 0.01, "Degrees were not converted to metres"
+    assert band_scale(LANDSAT) == 30
+    assert band_scale({'id': 'b1'}) is None
+    assert abs(geojson_area(SQUARE) / 1e6 - 12391) < 10
+    return
+
+
+def test_small_areas_run_at_native_scale_and_large_ones_are_coarsened():
+    small = plan_reduction([LANDSAT], area=1e7)
+    assert small.scale == 30 and small.tile_scale == 1, "A small AOI was not reduced at native resolution"
+    large = plan_reduction([LANDSAT], area=geojson_area(SQUARE) * 100)
+    assert large.scale > 30 and (large.scale / 30) ** 2 * 1e9 == pytest.approx(geojson_area(SQUARE) * 100 / 900)
+    assert large.tile_scale == 16
+    whole = plan_reduction([SRTM])
+    assert whole.scale > band_scale(SRTM), "The whole image was planned over the pixel budget"
+    assert plan_reduction([{'id': 'b1'}]).arguments() == {'tileScale': 16, 'maxPixels': 1e9}, \
+        "An unknown scale did not get the largest tileScale"
+    return
+
+
+def test_collection_budget_counts_images():
+    sentinel = {'id': 'B4', 'crs': 'EPSG:32630', 'crs_transform': [10, 0, 399960, 0, -10, 4500000]}
+    single = plan_reduction([sentinel], area=1e10)
+    assert single.scale == 10, "One image of 1e8 pixels should run at native scale"
+    stack = plan_reduction([sentinel], area=1e10, images=90)
+    assert stack.scale == pytest.approx(30), "90 images were planned like one"
+    assert stack.tile_scale == 16
+    return
+
+
+def test_resource_errors_escalate_the_plan():
+    backend = Failing('User memory limit exceeded.', 16)
+    assert reduce_adaptively(backend, lambda plan: plan, ReductionPlan(30)) == {'elevation': 1}
+    assert [plan.tile_scale for plan in backend.plans] == [1, 4, 16]
+    plan = ReductionPlan(30, 16)
+    scales = []
+    while plan is not None:
+        scales.append(plan.scale)
+        plan = plan.escalate()
+    assert scales == [30, 60, 120, 240], "Scale was not coarsened once tiles could not shrink"
+    with pytest.raises(ee.EEException):
+        reduce_adaptively(Failing('Image.load: Image asset not found.', 16), lambda plan: plan, ReductionPlan(30))
+    return
+
+
+def test_collection_images_are_counted_in_the_reduction_request(offline_ee, fake_backend):
+    sentinel = {'id': 'B4', 'crs': 'EPSG:32630', 'crs_transform': [10, 0, 399960, 0, -10, 4500000]}
+    images = {'type': 'ImageCollection', 'features': [{'bands': [sentinel], 'properties': {'CLOUDS': 1.0}}]}
+    requests = []
+
+    def info(ee_object):
+        requests.append(ee_object)
+        return images
+
+    backend = fake_backend(lambda asset_id: {'type': 'IMAGE_COLLECTION', 'id': asset_id}, info=info)
+    sql = "select avg(B4) from 'COPERNICUS/S2' where CLOUDS < 10 group by MGRS_TILE"
+    factory = GeeFactory(JsonSql(sql).to_json(), catalog=MetadataCatalog(), backend=backend)
+    plan = factory._plan
+    assert len(requests) == 1, "The images were counted with a request of their own"
+    assert isinstance(plan.arguments()['scale'], ee.ComputedObject), "The scale was not computed with the reduction"
+    assert plan.tile_scale == 1, "The tileScale was not planned from a single image"
+    assert isinstance(plan.escalate().escalate().scale, ee.ComputedObject)
+    return
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from sql2gee.catalog import MetadataCatalog
+from sql2gee.utils.parallel import parallel_map
+from sql2gee.utils.singleFlight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return [{'count': 56}]
+
+    results = parallel_map(lambda _: flight.do('q', slow), range(8), max_workers=8)
+    assert len(calls) == 1, "Identical concurrent calls were not coalesced"
+    assert all(result == [{'count': 56}] for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert len(flight) == 0
+    assert flight.do('q', slow) == ([{'count': 56}], False) and len(calls) == 2, "Finished call was reused"
+    return
+
+
+class LeaderGate(object):
+    """Lock that holds the leader thread when it takes the lock again to release its key, until `opened` is set"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opened = threading.Event()
+        self.leader = None
+
+    def __enter__(self):
+        if threading.current_thread() is self.leader:
+            self.opened.wait()
+        self.lock.acquire()
+        if self.leader is None:
+            self.leader = threading.current_thread()
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+def test_result_is_published_before_the_key_is_released():
+    flight = SingleFlight()
+    flight._lock = gate = LeaderGate()
+    calls = []
+
+    def count():
+        calls.append(1)
+        return len(calls)
+
+    leader = threading.Thread(target=flight.do, args=('q', count))
+    leader.start()
+    try:
+        while 'q' not in flight._calls and leader.is_alive():
+            time.sleep(0.001)
+        assert flight._calls['q'].done.wait(2), "Result was not published while the key was still held"
+        assert flight.do('q', count) == (1, True), "Caller joining before the key was released ran the call again"
+    finally:
+        gate.opened.set()
+        leader.join()
+    assert len(calls) == 1 and len(flight) == 0
+    return
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise NameError('column/band name not valid: foo')
+
+    def call(_):
+        with pytest.raises(NameError):
+            flight.do('q', failing)
+        return True
+
+    assert all(parallel_map(call, range(4), max_workers=4))
+    return
+
+
+def test_catalog_coalesces_concurrent_lookups(fake_backend):
+    backend = fake_backend(delay=0.1)
+    catalog = MetadataCatalog()
+    parallel_map(lambda _: catalog.metadata('TIGER/2018/States', backend), range(6), max_workers=6)
+    assert len(backend.calls) == 1, "Concurrent metadata lookups were not coalesced"
+    return
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from sql2gee.backend import EarthEngineBackend
+from sql2gee.catalog import MetadataCatalog
+from sql2gee.stats import InstrumentedBackend, Metrics, QueryStats, listening
+
+def test_instrumented_backend_counts_calls_and_bytes(expression):
+    stats = QueryStats('TIGER/2018/States', measure_bytes=True)
+    backend = InstrumentedBackend(EarthEngineBackend(), stats)
+    assert backend.get_info(expression('{"a":1}', [1, 2])) == [1, 2]
+    assert backend.get_info(expression('{"b":22}', {'x': 'y'})) == {'x': 'y'}
+    assert stats.ee_calls == 2, "Earth Engine calls were not counted"
+    assert stats.request_bytes == len('{"a":1}') + len('{"b":22}')
+    assert stats.response_bytes == len('[1,2]') + len('{"x":"y"}')
+    return
+
+
+def test_bytes_are_not_measured_by_default(expression):
+    class Unserializable(expression):
+        def serialize(self):
+            raise AssertionError('request serialized without measure_bytes')
+
+    stats = QueryStats('TIGER/2018/States')
+    backend = InstrumentedBackend(EarthEngineBackend(), stats)
+    assert backend.get_info(Unserializable('{"a":1}', [1, 2])) == [1, 2]
+    assert stats.ee_calls == 1 and stats.request_bytes == 0 and stats.response_bytes == 0
+    return
+
+
+def test_stages_and_errors_are_published():
+    published = []
+    stats = QueryStats()
+    with listening(published.append):
+        with stats.stage('plan'):
+            pass
+        with pytest.raises(NameError):
+            with stats.stage('execute'):
+                raise NameError('column/band name not valid: foo')
+    assert list(stats.stages) == ['plan', 'execute']
+    assert published == [stats] and 'NameError' in stats.error, "Failed query was not published with its error"
+    return
+
+
+def test_nested_stages_do_not_overlap_and_publish_once():
+    published = []
+    stats = QueryStats()
+    with listening(published.append):
+        with pytest.raises(KeyError):
+            with stats.stage('cache'):
+                time.sleep(0.02)
+                with stats.stage('metadata'):
+                    time.sleep(0.05)
+                    raise KeyError('TIGER/2018/Missing')
+    assert published == [stats], "A failed query was published by every stage"
+    assert 0.05 <= stats.stages['metadata'] < 0.07 and 0.02 <= stats.stages['cache'] < 0.04, \
+        "Nested time was counted in the outer stage"
+    assert stats.total < 0.09
+    return
+
+
+def test_catalog_reports_cache_hits_and_misses(fake_backend):
+    stats = QueryStats()
+    backend = InstrumentedBackend(fake_backend(), stats)
+    catalog = MetadataCatalog(ttl=3600)
+    catalog.metadata('TIGER/2018/States', backend)
+    catalog.metadata('TIGER/2018/States', backend)
+    assert stats.cache_misses == {'metadata': 1} and stats.cache_hits == {'metadata': 1}
+    assert stats.ee_calls == 1
+    return
+
+
+def test_prometheus_export():
+    metrics = Metrics(buckets=[0.1, 1])
+    stats = QueryStats()
+    stats.type = 'TABLE'
+    stats.ee_calls = 3
+    stats.stages['execute'] = 0.5
+    stats.cache_hits['metadata'] = 1
+    metrics.observe(stats)
+    metrics.observe(stats)
+    text = metrics.render()
+    assert 'sql2gee_queries_total{type="TABLE"} 2' in text
+    assert 'sql2gee_ee_calls_total{type="TABLE"} 6' in text
+    assert 'sql2gee_cache_hits_total{cache="metadata"} 2' in text
+    assert 'sql2gee_stage_seconds_bucket{stage="execute",type="TABLE",le="0.1"} 0' in text
+    assert 'sql2gee_stage_seconds_bucket{stage="execute",type="TABLE",le="1"} 2' in text
+    assert 'sql2gee_stage_seconds_count{stage="execute",type="TABLE"} 2' in text
+    return
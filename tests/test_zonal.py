@@ -0,0 +1,34 @@
+import pytest
+
+from sql2gee.catalog import MetadataCatalog
+from sql2gee.gee_factory import GeeFactory
+from sql2gee.utils.jsonSql import JsonSql
+
+ZONES = {'type': 'FeatureCollection', 'features': [
+    {'type': 'Feature', 'properties': {'name': 'a', 'code': 1},
+     'geometry': {'type': 'Point', 'coordinates': [-3.7, 40.4]}},
+    {'type': 'Feature', 'properties': {'name': 'b'},
+     'geometry': {'type': 'Point', 'coordinates': [2.1, 41.3]}}]}
+
+
+@pytest.fixture
+def zonal_factory(fake_backend):
+    return lambda sql, flags=None: GeeFactory(JsonSql(sql).to_json(), ZONES, flags, catalog=MetadataCatalog(),
+                                              backend=fake_backend('IMAGE'))
+
+
+def test_group_by_feature_property_is_zonal(zonal_factory):
+    factory = zonal_factory("select ST_SUMMARYSTATS(), name from 'CGIAR/SRTM90_V4' group by name")
+    zones = factory._zones
+    assert zones['keys'] == ['name'] and len(zones['features']) == 2, "GROUP BY a feature property was not zonal"
+    assert zones['properties'] == {'name', 'code'}
+    assert [column['value'] for column in factory._select['columns']] == ['name'], "Zone key was not selectable"
+    return
+
+
+def test_zonal_mode_needs_feature_keys_or_flag(zonal_factory):
+    assert zonal_factory("select ST_SUMMARYSTATS() from 'CGIAR/SRTM90_V4' group by elevation")._zones is None
+    assert zonal_factory("select ST_SUMMARYSTATS() from 'CGIAR/SRTM90_V4'")._zones is None
+    zones = zonal_factory("select ST_SUMMARYSTATS() from 'CGIAR/SRTM90_V4'", {'zonal': True})._zones
+    assert zones['keys'] == ['code', 'name'], "Without GROUP BY every feature property is a zone key"
+    return